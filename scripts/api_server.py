@@ -1,23 +1,109 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import os
+import re
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
 # Removed google.genai imports - now using direct HTTP requests
 
+import numpy as np
 import pandas as pd
-import requests
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+
+from scripts.campus_places import record_place
+from scripts.chat_batch import AdaptiveLimit, BatchJob, BatchJobs
+from scripts.chat_cache import ChatCache, chat_cache_key
+from scripts.chat_sessions import ChatSession, SessionStore, api_key_hash
+from scripts.classes import ClassStats
+from scripts.cohort import DEFAULT_PERCENTILES, DIMENSIONS, EMOTION_DIMENSIONS, CohortStats
+from scripts.columnar_store import DEFAULT_COMPILED_DIR, CompiledStore
+from scripts.dataset_store import (
+    EMOTION_LOG_SUFFIX,
+    NARRATIVE_FIELDS,
+    STATUS_KINDS,
+    STATUS_VALUE_COLUMNS,
+    DatasetStore,
+    EmotionLog,
+    FrameEntry,
+)
+from scripts.gemini_client import GeminiClient, GeminiError, extract_text
+from scripts.http_cache import ConditionalGetMiddleware, ResponseCache
+from scripts.live_feed import LiveFeed, Subscriber
+from scripts.metrics import Metrics, TimedJSONResponse, TimingMiddleware, annotate, phase, timed
+from scripts.search_index import COMPARISONS, SearchIndex
+from scripts.timeseries import (
+    aligned_buckets,
+    bucket_mean,
+    bucket_mode,
+    lttb,
+    parse_bucket,
+    parse_time,
+    widen_to_fit,
+)
 
 # from dotenv import load_dotenv
 
 
 WORKSPACE_ROOT = Path(__file__).resolve().parents[1]
+# directory holding the uXX/ folders and logs; DATASET_ROOT points it elsewhere (e.g. a synthetic cohort)
+DATASET_ROOT = Path(os.getenv("DATASET_ROOT", str(WORKSPACE_ROOT))).resolve()
+
+# Memory-mapped output of `python -m scripts.columnar_store build`, if present;
+# DATASET_COMPILED_DIR="" turns it off.  Files changed since the build are read from CSV.
+_COMPILED_DIR = os.getenv("DATASET_COMPILED_DIR", str(DATASET_ROOT / DEFAULT_COMPILED_DIR))
+COMPILED = CompiledStore.open(Path(_COMPILED_DIR)) if _COMPILED_DIR else None
+
+# Parsed CSVs shared by every request; files are re-stat'ed at most this often.
+DATASET = DatasetStore(
+    DATASET_ROOT,
+    refresh_interval=float(os.getenv("DATASET_REFRESH_SECONDS", "2.0")),
+    compiled=COMPILED,
+)
+
+# users x weeks x dimensions array behind /api/cohort/*, refreshed per changed user.
+COHORT = CohortStats(DATASET)
+CLASSES = ClassStats(DATASET)
+# Positional index over every weekly_desc behind /api/search, refreshed per changed user.
+SEARCH = SearchIndex(DATASET)
+
+# Pushes new simulation output to /api/live subscribers; see DATASET_WATCH_SECONDS in SETUP.md.
+LIVE = LiveFeed.from_env(DATASET)
+# seconds between comment lines that keep an idle /api/live stream open through proxies
+LIVE_KEEPALIVE = 15.0
+
+# Encoded bodies of the read-only GET endpoints for the current dataset version;
+# see API_RESPONSE_CACHE_MB / API_COMPRESS_MIN_BYTES / API_CACHE_MAX_AGE in SETUP.md.
+RESPONSE_CACHE = ResponseCache.from_env()
+
+# Per-route latency and phase histograms behind /metrics, plus sampled request logs;
+# see API_SERVER_TIMING / API_LOG_SAMPLE / API_LOG_SLOW_MS in SETUP.md.
+METRICS = Metrics.from_env()
+
+# Pooled async Gemini client; GEMINI_API_BASE points it at a local stub for testing.
+GEMINI = GeminiClient.from_env()
+
+# Persona replies keyed by student/week/traits/description/message; see CHAT_CACHE_* in SETUP.md.
+CHAT_CACHE = ChatCache.from_env()
+
+# Multi-turn conversations (session id -> persona prompt + trimmed history).
+CHAT_SESSIONS = SessionStore.from_env()
+# Upload each session's persona prompt once as upstream cached context when possible.
+CHAT_CONTEXT_CACHE = os.getenv("CHAT_CONTEXT_CACHE", "1") not in ("0", "false", "no")
+# answers to a request naming a cachedContent that expired or belongs to another key
+CACHED_CONTENT_GONE = (403, 404)
+
+# One question asked of many students (/api/chat/batch); see CHAT_BATCH_* in SETUP.md.
+CHAT_BATCHES = BatchJobs.from_env()
 
 # load_dotenv()  
 # api_key = os.getenv("GEMINI_API_KEY")
@@ -31,81 +117,507 @@ class ChatRequest(BaseModel):
     bigFive: Dict[str, float]
     weeklyDesc: str
     week: int
+    stream: bool = False
+    noCache: bool = False
+
+
+class ChatSessionRequest(BaseModel):
+    studentId: str
+    week: int
+    bigFive: Optional[Dict[str, float]] = None
+    weeklyDesc: Optional[str] = None
 
 
-def _user_dir(user_id: str) -> Path:
-    return WORKSPACE_ROOT / user_id
+class ChatSessionMessage(BaseModel):
+    message: str
+    apiKey: str
+    stream: bool = False
+
+
+class ChatBatchRequest(BaseModel):
+    message: str
+    apiKey: str
+    week: int
+    # a list of student ids, or "all" for every student with a Big Five row
+    studentIds: Union[List[str], str] = "all"
+    concurrency: Optional[int] = None
+    # resume this job if it is still held, otherwise start it under this id
+    jobId: Optional[str] = None
+    after: int = 0
+    noCache: bool = False
+
+
+# Mock enrolled classes based on the emotion entries mentioning specific courses
+ENROLLED_CLASSES: Dict[str, List[Dict[str, Any]]] = {
+    'u01': [{'code': 'ENGS 069', 'name': 'Smartphone Programming', 'credits': 3},
+    {'code': 'ENGS 022', 'name': 'None', 'credits': None},
+    {'code': 'ANTH 012', 'name': 'None', 'credits': None}],
+    'u02': [{'code': 'COSC 077', 'name': 'None', 'credits': None},
+    {'code': 'COSC 098', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u03': [{'code': 'COSC 057', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u04': [{'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u05': [{'code': 'COSC 050', 'name': 'None', 'credits': None},
+    {'code': 'PSYC 028', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u07': [{'code': 'COSC 077', 'name': 'None', 'credits': None},
+    {'code': 'COSC 060', 'name': 'Computer Networks', 'credits': 4},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u08': [{'code': 'CHIN 062', 'name': 'None', 'credits': None},
+    {'code': 'COSC 089 1', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u09': [{'code': 'ANTH 050', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3},
+    {'code': 'COSC 099', 'name': 'Senior Thesis Research', 'credits': 4}],
+    'u10': [{'code': 'COSC 050', 'name': 'None', 'credits': None},
+    {'code': 'BIOL 004', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u12': [{'code': 'COSC 089 1', 'name': 'None', 'credits': None},
+    {'code': 'COSC 050', 'name': 'None', 'credits': None},
+    {'code': 'TUCK 003', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u13': [{'code': 'COSC 070', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u14': [{'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3},
+    {'code': 'COSC 027', 'name': 'None', 'credits': None},
+    {'code': 'COSC 020', 'name': 'None', 'credits': None}],
+    'u15': [{'code': 'EARS 003', 'name': 'None', 'credits': None},
+    {'code': 'SPAN 003', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u16': [{'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3},
+    {'code': 'COSC 027', 'name': 'None', 'credits': None}],
+    'u17': [{'code': 'COSC 089 1', 'name': 'None', 'credits': None},
+    {'code': 'MUS 016', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u18': [{'code': 'COSC 089 1', 'name': 'None', 'credits': None},
+    {'code': 'CHIN 033', 'name': 'None', 'credits': None},
+    {'code': 'TUCK 003', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u19': [{'code': 'COSC 050', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3},
+    {'code': 'FILM 051', 'name': 'None', 'credits': None}],
+    'u20': [{'code': 'COSC 070', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u22': [{'code': 'COSC 050', 'name': 'None', 'credits': None},
+    {'code': 'NAS 035', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u23': [{'code': 'COSC 070', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u24': [{'code': 'M&SS 045', 'name': 'None', 'credits': None},
+    {'code': 'COSC 060', 'name': 'Computer Networks', 'credits': 4},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u25': [{'code': 'NAS 008', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3},
+    {'code': 'ENGL 028', 'name': 'None', 'credits': None}],
+    'u27': [{'code': 'ECON 024', 'name': 'None', 'credits': None},
+    {'code': 'JAPN 033', 'name': 'None', 'credits': None},
+    {'code': 'FILM 042', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u30': [{'code': 'MUS 003', 'name': 'None', 'credits': None},
+    {'code': 'COSC 050', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u31': [{'code': 'MUS 003', 'name': 'None', 'credits': None},
+    {'code': 'COSC 077', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u32': [{'code': 'MATH 023', 'name': 'None', 'credits': None},
+    {'code': 'COSC 069', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u33': [{'code': 'ENGS 025', 'name': 'None', 'credits': None},
+    {'code': 'ENGS 069', 'name': 'Smartphone Programming', 'credits': 3},
+    {'code': 'ENGS 093', 'name': 'None', 'credits': None}],
+    'u34': [{'code': 'COSC 070', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u35': [{'code': 'COSC 070', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u41': [{'code': 'COSC 050', 'name': 'None', 'credits': None},
+    {'code': 'SPAN 002', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u42': [{'code': 'COSC 070', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u43': [{'code': 'ENGS 031', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u44': [{'code': 'COSC 060', 'name': 'Computer Networks', 'credits': 4},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u45': [{'code': 'COSC 070', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u46': [{'code': 'ECON 036', 'name': 'None', 'credits': None},
+    {'code': 'COSC 050', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u47': [{'code': 'COSC 060', 'name': 'Computer Networks', 'credits': 4},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u49': [{'code': 'MATH 013', 'name': 'None', 'credits': None},
+    {'code': 'LAT 003', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u50': [{'code': 'COSC 060', 'name': 'Computer Networks', 'credits': 4},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u51': [{'code': 'COSC 070', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u52': [{'code': 'BIOL 006', 'name': 'None', 'credits': None},
+    {'code': 'COSC 050', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u53': [{'code': 'COSC 089 1', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u54': [{'code': 'ENGS 025', 'name': 'None', 'credits': None},
+    {'code': 'MATH 023', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u57': [{'code': 'COSC 098', 'name': 'None', 'credits': None},
+    {'code': 'COSC 060', 'name': 'Computer Networks', 'credits': 4},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u58': [{'code': 'COSC 070', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
+    'u59': [{'code': 'GERM 001', 'name': 'None', 'credits': None},
+    {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3},
+    {'code': 'COSC 007', 'name': 'None', 'credits': None}]
+}
 
 
 def _ensure_user(user_id: str) -> None:
-    if not _user_dir(user_id).exists():
+    if not DATASET.has_user(user_id):
         raise HTTPException(status_code=404, detail=f"Unknown user_id: {user_id}")
 
 
 def _list_weeks(user_id: str) -> List[int]:
-    user_path = _user_dir(user_id)
-    weeks = []
-    for csv_path in sorted(user_path.glob("data_per_week*.csv")):
-        name = csv_path.stem  # data_per_weekX
-        try:
-            week_num = int(name.replace("data_per_week", ""))
-            weeks.append(week_num)
-        except ValueError:
-            continue
-    return sorted(set(weeks))
+    return DATASET.weeks(user_id)
 
 
-def _read_week_csv(user_id: str, week: int) -> pd.DataFrame:
-    csv_path = _user_dir(user_id) / f"data_per_week{week}.csv"
-    if not csv_path.exists():
+def _week_frame(user_id: str, week: int) -> FrameEntry:
+    entry = DATASET.week_frame(user_id, week)
+    if entry is None:
         raise HTTPException(status_code=404, detail=f"data_per_week{week}.csv not found for {user_id}")
-    df = pd.read_csv(csv_path)
-    # normalize timestamp column
-    time_col = None
-    for cand in ["times", "timestamp", "time", "resp_time"]:
-        if cand in df.columns:
-            time_col = cand
-            break
-    if time_col is None:
+    if entry.time_col not in ("times", "resp_time"):
         raise HTTPException(status_code=500, detail="No recognizable time column in week csv")
-    df[time_col] = pd.to_datetime(df[time_col])
-    return df
+    return entry
 
 
-def _read_status_csv(user_id: str, kind: str) -> pd.DataFrame:
+def _status_frame(user_id: str, kind: str) -> FrameEntry:
     # kind in {sleep, social, stress}
-    csv_path = _user_dir(user_id) / f"{kind}_week_.csv"
-    if not csv_path.exists():
+    entry = DATASET.status_frame(user_id, kind)
+    if entry is None:
         raise HTTPException(status_code=404, detail=f"{kind}_week_.csv not found for {user_id}")
-    df = pd.read_csv(csv_path)
-    # find resp_time
-    time_col = None
-    for cand in ["resp_time", "times", "time"]:
-        if cand in df.columns:
-            time_col = cand
-            break
-    if time_col is None:
+    if entry.time_col is None:
         raise HTTPException(status_code=500, detail=f"No recognizable time column in {kind}_week_.csv")
-    df[time_col] = pd.to_datetime(df[time_col])
-    return df
-
-
-def _read_emotions(user_id: str) -> List[Dict[str, Any]]:
-    jsonl_path = WORKSPACE_ROOT / f"{user_id}_emotion_status_history.jsonl"
-    if not jsonl_path.exists():
-        raise HTTPException(status_code=404, detail=f"{jsonl_path.name} not found")
-    entries: List[Dict[str, Any]] = []
-    with open(jsonl_path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            entries.append(json.loads(line))
-    return entries
+    if entry.time_col not in ("resp_time", "times"):
+        raise HTTPException(status_code=500, detail="No recognizable time column in status csv")
+    return entry
+
+
+def _parse_day(day: str) -> str:
+    try:
+        return datetime.fromisoformat(day).date().isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid day format; use YYYY-MM-DD")
+
+
+@timed("serialize")
+def _location_records(entry: FrameEntry, rows: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+    if rows is None:
+        rows = range(len(entry.times))
+    cols = entry.columns
+    none = [None] * len(entry.times)
+    times = entry.times
+    location = cols.get("location", none)
+    location_des = cols.get("location_des", none)
+    activity = cols.get(" activity inference", cols.get("activity inference", none))
+    return [
+        {"time": times[i], "location": location[i], "location_des": location_des[i], "activity": activity[i]}
+        for i in rows
+    ]
+
+
+@timed("serialize")
+def _status_records(entry: FrameEntry, kind: str, rows: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+    if rows is None:
+        rows = range(len(entry.times))
+    cols = entry.columns
+    none = [None] * len(entry.times)
+    times = entry.times
+    value = cols.get(STATUS_VALUE_COLUMNS[kind], none)
+    week = cols.get("week", none)
+    day_offset = cols.get("day_offset", none)
+    return [
+        {"time": times[i], "value": value[i], "week": week[i], "day_offset": day_offset[i]}
+        for i in rows
+    ]
+
 
+@timed("filter")
+def _status_rows(entry: FrameEntry, week: Optional[int], day_key: Optional[str]) -> Optional[List[int]]:
+    # a status csv without a week column ignores the week filter
+    if week is not None and "week" not in entry.columns:
+        week = None
+    if day_key:
+        return entry.by_day.rows(day_key) if week is None else entry.by_week_day.rows((week, day_key))
+    return entry.by_week.rows(week) if week is not None else None
 
-app = FastAPI(title="Ubicomp Dashboard API", version="0.1.0")
 
+def _parse_range(start: Optional[str], end: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    try:
+        return (parse_time(start) if start else None, parse_time(end) if end else None)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid start/end; use ISO dates or datetimes")
+
+
+def _parse_resample(bucket: Optional[str], max_points: Optional[int]) -> Optional[int]:
+    if max_points is not None and max_points < 1:
+        raise HTTPException(status_code=400, detail="max_points must be positive")
+    if not bucket:
+        return None
+    try:
+        return parse_bucket(bucket)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid bucket; use hour, day, week or an offset like 15min / 6h / 2D")
+
+
+def _iso(ns: np.ndarray) -> List[str]:
+    return np.datetime_as_string(ns.astype("datetime64[ns]"), unit="s").tolist()
+
+
+
+@timed("aggregate")
+def _resampled_locations(
+    rows: List[Tuple[FrameEntry, int]],
+    ns: np.ndarray,
+    width: Optional[int],
+    max_points: Optional[int],
+    lo_ns: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """One record per time bucket: the bucket's most frequent location (its first such
+    row), stamped with the bucket start and the number of rows it stands for.
+    ``max_points`` widens ``width`` only to whole multiples of it."""
+    if max_points is not None:
+        width = widen_to_fit(ns, width, max_points, lo_ns)
+    starts, _, inverse = aligned_buckets(ns, width, lo_ns)
+    labels = [entry.columns.get("location", [None] * len(entry.times))[i] for entry, i in rows]
+    codes, _ = pd.factorize(pd.Series(labels, dtype=object))
+    picks = bucket_mode(codes, inverse, len(starts))
+    counts = np.bincount(inverse, minlength=len(starts))
+    records = []
+    for time, pick, count in zip(_iso(starts), picks.tolist(), counts.tolist()):
+        entry, i = rows[pick]
+        record = _location_records(entry, [i])[0]
+        record["time"] = time
+        record["count"] = count
+        records.append(record)
+    return records
+
+
+@timed("aggregate")
+def _resampled_status(
+    entry: FrameEntry,
+    kind: str,
+    rows: np.ndarray,
+    width: Optional[int],
+    agg: str,
+    max_points: Optional[int],
+    lo_ns: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Status rows (time-sorted) reduced to bucket aggregates and/or at most ``max_points``
+    LTTB-selected points.  Bucket records carry the bucket start and row count."""
+    ns = entry.epoch_ns[rows]
+    raw = entry.columns.get(STATUS_VALUE_COLUMNS[kind], [None] * len(entry.times))
+    values = pd.to_numeric(pd.Series([raw[i] for i in rows.tolist()], dtype=object), errors="coerce").to_numpy(float)
+    base = _status_records(entry, kind, rows.tolist())
+    if width is not None:
+        starts, first, inverse = aligned_buckets(ns, width, lo_ns)
+        if agg == "mode":
+            codes, _ = pd.factorize(pd.Series(values))
+            picks = bucket_mode(codes, inverse, len(starts))
+            agg_values = [base[p]["value"] for p in picks.tolist()]
+        else:
+            agg_values = [None if np.isnan(v) else float(v) for v in bucket_mean(values, inverse, len(starts))]
+        counts = np.bincount(inverse, minlength=len(starts))
+        base = [
+            {**base[f], "time": t, "value": v, "count": c}
+            for f, t, v, c in zip(first.tolist(), _iso(starts), agg_values, counts.tolist())
+        ]
+        ns, values = starts, np.array([np.nan if v is None else v for v in agg_values], dtype=float)
+    if max_points is not None and len(base) > max_points:
+        # LTTB needs numbers: points without a value are dropped first
+        keep = np.flatnonzero(~np.isnan(values))
+        picked = keep[lttb(ns[keep].astype(float), values[keep], max_points)]
+        base = [base[i] for i in picked.tolist()]
+    return base
+
+
+LOCATION_FORMATS = ("records", "compact")
+# columns of a compact location payload whose values are codes into its table
+COMPACT_CODED = ("location", "location_des", "activity", "place")
+
+
+class _ValueTable:
+    """Per-response table of distinct values for the compact location format; code -1 is null."""
+
+    __slots__ = ("values", "_codes")
+
+    def __init__(self) -> None:
+        self.values: List[Any] = []
+        self._codes: Dict[Tuple[type, Any], int] = {}
+
+    def code(self, value: Any) -> int:
+        if value is None:
+            return -1
+        # keyed by type too, so 1 and "1" (or 1 and True) get separate codes
+        key = (type(value), value)
+        code = self._codes.get(key)
+        if code is None:
+            code = self._codes[key] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+@timed("serialize")
+def _compact_locations(records: List[Dict[str, Any]], table: _ValueTable) -> Dict[str, List[Any]]:
+    """Location records as parallel columns: ``time`` (and ``count`` for buckets) as
+    values, the rest as table codes, plus the campus ``place`` key resolved server-side."""
+    code = table.code
+    columns: Dict[str, List[Any]] = {
+        "time": [r["time"] for r in records],
+        "location": [code(r["location"]) for r in records],
+        "location_des": [code(r["location_des"]) for r in records],
+        "activity": [code(r["activity"]) for r in records],
+        "place": [code(record_place(r["location_des"], r["activity"], r["location"])) for r in records],
+    }
+    if records and "count" in records[0]:
+        columns["count"] = [r["count"] for r in records]
+    return columns
+
+
+def _check_location_format(format: str) -> None:
+    if format not in LOCATION_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be records or compact")
+
+
+def _location_payload(records: List[Dict[str, Any]], format: str) -> Dict[str, Any]:
+    if format != "compact":
+        return {"records": records}
+    table = _ValueTable()
+    columns = _compact_locations(records, table)
+    return {"format": "compact", "table": table.values, **columns}
+
+
+def _week_bundle(user_id: str, week: int, format: str = "records") -> Dict[str, Any]:
+    """Everything the dashboard plays back for one week, in one payload.
+
+    With ``format="compact"`` every day's locations are compact columns sharing one
+    ``table`` for the whole bundle.
+    """
+    entry = _week_frame(user_id, week)
+    status: Dict[str, List[Dict[str, Any]]] = {}
+    for kind in STATUS_KINDS:
+        status_entry = DATASET.status_frame(user_id, kind)
+        status[kind] = [] if status_entry is None or status_entry.time_col is None else (
+            _status_records(status_entry, kind, _status_rows(status_entry, week, None))
+        )
+    log = DATASET.emotion_log(user_id)
+    locations: Dict[str, Any] = {day: _location_records(entry, entry.by_day.rows(day)) for day in entry.days}
+    bundle: Dict[str, Any] = {"week": week, "days": entry.days}
+    if format == "compact":
+        table = _ValueTable()
+        locations = {day: _compact_locations(records, table) for day, records in locations.items()}
+        bundle.update(format="compact", table=table.values)
+    bundle.update(
+        locations=locations,
+        status=status,
+        emotion=log.entry(week) if log is not None else None,
+    )
+    return bundle
+
+
+def _emotion_log(user_id: str) -> EmotionLog:
+    log = DATASET.emotion_log(user_id)
+    if log is None:
+        raise HTTPException(status_code=404, detail=f"{user_id}{EMOTION_LOG_SUFFIX} not found")
+    return log
+
+
+def _parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    if not fields:
+        return None
+    wanted = [f.strip() for f in fields.split(",") if f.strip()]
+    if "week" not in wanted:
+        wanted.insert(0, "week")
+    return wanted
+
+
+def _parse_dimensions(dimensions: Optional[str], default: Sequence[str]) -> List[str]:
+    if not dimensions:
+        return list(default)
+    wanted = [d.strip() for d in dimensions.split(",") if d.strip()]
+    unknown = [d for d in wanted if d not in DIMENSIONS]
+    if unknown or not wanted:
+        raise HTTPException(status_code=400, detail=f"dimensions must be among {','.join(DIMENSIONS)}")
+    return wanted
+
+
+def _parse_percentiles(percentiles: Optional[str]) -> List[float]:
+    if not percentiles:
+        return list(DEFAULT_PERCENTILES)
+    try:
+        values = [float(p) for p in percentiles.split(",") if p.strip()]
+    except ValueError:
+        values = []
+    if not values or any(not 0 <= p <= 100 for p in values):
+        raise HTTPException(status_code=400, detail="percentiles must be comma-separated numbers in [0, 100]")
+    return values
+
+
+def _parse_weeks(weeks: Optional[str]) -> Optional[List[int]]:
+    """``"3"``, ``"1,4"`` or ``"3-5"`` (and mixes of them) as a list of weeks."""
+    if not weeks:
+        return None
+    wanted: List[int] = []
+    try:
+        for part in weeks.split(","):
+            first, _, last = part.strip().partition("-")
+            wanted.extend(range(int(first), int(last or first) + 1))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="weeks must be comma-separated weeks or ranges like 3-5")
+    return wanted
+
+
+THRESHOLD_RE = re.compile(r"\s*(\w+)\s*(>=|<=|>|<|=)\s*(-?\d+(?:\.\d+)?)\s*")
+
+
+def _parse_thresholds(emotion: Optional[str]) -> List[Tuple[str, str, float]]:
+    """``"stress>70,happy<=40"`` as ``(dimension, operator, value)`` tests."""
+    if not emotion:
+        return []
+    tests = []
+    for part in emotion.split(","):
+        match = THRESHOLD_RE.fullmatch(part)
+        if match is None or match.group(1) not in EMOTION_DIMENSIONS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"emotion filters look like stress>70; dimensions are {','.join(EMOTION_DIMENSIONS)}, "
+                       f"operators {' '.join(COMPARISONS)}",
+            )
+        tests.append((match.group(1), match.group(2), float(match.group(3))))
+    return tests
+
+
+app = FastAPI(title="Ubicomp Dashboard API", version="0.1.0", default_response_class=TimedJSONResponse)
+
+
+def _cacheable_path(path: str) -> bool:
+    # everything under /api/ is derived from the dataset except chat, the Gemini
+    # check, the live feed and the NDJSON semester stream
+    return (
+        path.startswith("/api/")
+        and not path.startswith(("/api/chat", "/api/test-gemini", "/api/live"))
+        and not path.endswith("/stream")
+    )
+
+
+# added before CORS so CORS headers also go out on cached responses and 304s
+app.add_middleware(
+    ConditionalGetMiddleware,
+    cache=RESPONSE_CACHE,
+    version=DATASET.current_version,
+    cacheable=_cacheable_path,
+)
+# outside the response cache so cache hits and 304s are timed too
+app.add_middleware(TimingMiddleware, metrics=METRICS, routes=app.router.routes)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -114,13 +626,169 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Set once the dataset is loaded (and warmed, under scripts.serve); /readyz reports it.
+READY = threading.Event()
+_PRELOAD: Dict[str, Any] = {"seconds": None, "error": None}
+
+
+def preload(warm: bool = False) -> None:
+    """Load the dataset before serving.  ``warm`` also builds every lazily derived
+    index and aggregate, so forked workers share them instead of each building its own."""
+    start = time.perf_counter()
+    try:
+        DATASET.load()
+        if warm:
+            DATASET.warm()
+            COHORT.refresh()
+            CLASSES.refresh()
+            SEARCH.refresh()
+            _profiles()
+    except Exception as e:
+        _PRELOAD["error"] = repr(e)
+        raise
+    _PRELOAD["seconds"] = round(time.perf_counter() - start, 3)
+    READY.set()
+
+
+def after_fork() -> None:
+    """Reset per-process state in a worker forked from a preloaded parent."""
+    CHAT_CACHE.reopen()
+
+
+@app.on_event("startup")
+def _preload_dataset() -> None:
+    # in the background, so /healthz answers while /readyz says 503 until loading is done
+    if not READY.is_set():
+        threading.Thread(target=preload, name="dataset-preload", daemon=True).start()
+    LIVE.start(_live_payload)
+
+
+@app.on_event("shutdown")
+async def _close_gemini_client() -> None:
+    LIVE.stop()
+    await GEMINI.aclose()
+    # chat cache writes are queued for a background thread
+    await run_in_threadpool(CHAT_CACHE.flush)
+
+
 @app.get("/api/users")
 def list_users() -> Dict[str, Any]:
-    users = []
-    for path in WORKSPACE_ROOT.iterdir():
-        if path.is_dir() and path.name.startswith("u") and path.name[1:].isdigit():
-            users.append(path.name)
-    return {"users": sorted(users)}
+    return {"users": DATASET.users()}
+
+
+def _live_payload(event: Dict[str, Any]) -> Dict[str, Any]:
+    """A dataset change event plus the data a client needs to apply it without refetching."""
+    user_id = event["user"]
+    if event["type"] == "week":
+        message = {**event, "weeks": DATASET.weeks(user_id)}
+        if event["change"] != "removed" and DATASET.week_frame(user_id, event["week"]) is not None:
+            message["bundle"] = _week_bundle(user_id, event["week"], "compact")
+        return message
+    if event["type"] == "emotions":
+        log = DATASET.emotion_log(user_id)
+        entries = [log.entry(week) for week in event["weeks"]] if log is not None else []
+        return {**event, "entries": [e for e in entries if e is not None]}
+    return event
+
+
+async def _live_events(subscriber: Subscriber) -> AsyncIterator[str]:
+    try:
+        yield _sse_event("ready", {"version": DATASET.version, "interval": LIVE.interval})
+        while True:
+            try:
+                message = await asyncio.wait_for(subscriber.queue.get(), LIVE_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield _sse_event(message["type"], message)
+    finally:
+        LIVE.unsubscribe(subscriber)
+
+
+@app.get("/api/live")
+async def live_updates(users: Optional[str] = None) -> StreamingResponse:
+    """Server-sent events for new simulation output of ``users`` (comma-separated,
+    default all): ``week`` when a ``data_per_weekN.csv`` appears or changes, with
+    the user's weeks and the week's compact bundle; ``emotions`` with the entries
+    appended to the emotion log; ``status``, ``classes`` and ``user`` notices; and
+    ``reset`` when a client fell too far behind and should reload."""
+    wanted = {u.strip() for u in users.split(",") if u.strip()} if users else None
+    return _sse_response(_live_events(LIVE.subscribe(wanted)))
+
+
+# Cohort routes are registered before /api/{user_id}/... so "cohort" is never read as a user id.
+@app.get("/api/cohort/emotions")
+def get_cohort_emotions(dimensions: Optional[str] = None, percentiles: Optional[str] = None) -> Dict[str, Any]:
+    """Per-week count/mean/std/percentiles of emotion (or ``lab_*``) dimensions across all students."""
+    dims = _parse_dimensions(dimensions, EMOTION_DIMENSIONS)
+    wanted = _parse_percentiles(percentiles)
+    with phase("aggregate"):
+        return COHORT.emotion_summary(dims, wanted)
+
+
+@app.get("/api/cohort/labs")
+def get_cohort_labs(percentiles: Optional[str] = None, bins: int = 10) -> Dict[str, Any]:
+    """Per-week lab score distributions plus a histogram of score / max_score."""
+    if not 1 <= bins <= 100:
+        raise HTTPException(status_code=400, detail="bins must be between 1 and 100")
+    wanted = _parse_percentiles(percentiles)
+    with phase("aggregate"):
+        return COHORT.lab_summary(wanted, bins)
+
+
+@app.get("/api/cohort/correlations")
+def get_cohort_correlations(dimensions: Optional[str] = None, week: Optional[int] = None) -> Dict[str, Any]:
+    """Pearson r between the Big Five traits and weekly dimensions (semester mean unless ``week``)."""
+    dims = _parse_dimensions(dimensions, EMOTION_DIMENSIONS)
+    with phase("aggregate"):
+        COHORT.refresh()
+        if week is not None and week not in COHORT.weeks:
+            raise HTTPException(status_code=404, detail=f"No cohort data for week {week}")
+        return COHORT.trait_correlations(dims, week)
+
+
+@app.get("/api/cohort/classes")
+def get_cohort_classes() -> Dict[str, Any]:
+    """Class attendance and workload per course, week and building across all students."""
+    with phase("aggregate"):
+        return CLASSES.cohort_summary()
+
+
+@app.get("/api/search")
+def search_narratives(
+    q: str = "",
+    users: Optional[str] = None,
+    weeks: Optional[str] = None,
+    emotion: Optional[str] = None,
+    limit: int = 20,
+    offset: int = 0,
+) -> Dict[str, Any]:
+    """Full-text search over every student's weekly descriptions.
+
+    ``q`` takes words, ``"phrases"``, ``prefix*``, ``AND`` (implied between
+    words), ``OR``, ``NOT``/``-word`` and parentheses.  ``users`` and ``weeks``
+    (``3``, ``1,4``, ``3-5``) narrow the weeks searched, and ``emotion`` keeps
+    weeks passing every threshold, e.g. ``stress>70,happy<=40``.  Hits are ranked
+    by BM25, each with the week's emotions and an HTML snippet whose matches are
+    in ``<mark>``; an empty ``q`` lists the filtered weeks by user and week,
+    while a ``q`` with no search terms (only quotes, brackets or operators) is a 400.
+    """
+    if not 1 <= limit <= 100:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="offset must not be negative")
+    wanted = [u.strip() for u in users.split(",") if u.strip()] if users else None
+    try:
+        return SEARCH.search(
+            q,
+            users=wanted,
+            weeks=_parse_weeks(weeks),
+            thresholds=_parse_thresholds(emotion),
+            limit=limit,
+            offset=offset,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
 
 
 @app.get("/api/{user_id}/weeks")
@@ -131,267 +799,246 @@ def list_user_weeks(user_id: str) -> Dict[str, Any]:
 @app.get("/api/{user_id}/week/{week}/days")
 def list_days(user_id: str, week: int) -> Dict[str, Any]:
     _ensure_user(user_id)
-    df = _read_week_csv(user_id, week)
-    time_col = "times" if "times" in df.columns else "resp_time" if "resp_time" in df.columns else None
-    if time_col is None:
-        raise HTTPException(status_code=500, detail="No recognizable time column in week csv")
-    days = sorted({d.date().isoformat() for d in df[time_col]})
-    return {"days": days}
+    entry = _week_frame(user_id, week)
+    return {"days": entry.days}
 
 
 @app.get("/api/{user_id}/week/{week}/locations")
-def get_locations(user_id: str, week: int, day: Optional[str] = None) -> Dict[str, Any]:
+def get_locations(user_id: str, week: int, day: Optional[str] = None, format: str = "records") -> Dict[str, Any]:
+    """Location records of a week (or one ``day``); ``format=compact`` returns
+    table-coded columns with a resolved campus ``place`` instead."""
+    _check_location_format(format)
     _ensure_user(user_id)
-    df = _read_week_csv(user_id, week)
-    time_col = "times" if "times" in df.columns else "resp_time" if "resp_time" in df.columns else None
-    if time_col is None:
-        raise HTTPException(status_code=500, detail="No recognizable time column in week csv")
-    if day:
-        try:
-            day_dt = datetime.fromisoformat(day).date()
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Invalid day format; use YYYY-MM-DD")
-        df = df[df[time_col].dt.date == day_dt]
-    cols = df.columns
-    # best-effort mapping
-    result = []
-    for _, row in df.iterrows():
-        result.append({
-            "time": row[time_col].isoformat(),
-            "location": row.get("location", None),
-            "location_des": row.get("location_des", None),
-            "activity": row.get(" activity inference", row.get("activity inference", None)),
-        })
-    return {"records": result}
+    entry = _week_frame(user_id, week)
+    rows = entry.by_day.rows(_parse_day(day)) if day else None
+    return _location_payload(_location_records(entry, rows), format)
 
 
 @app.get("/api/{user_id}/status/{kind}")
-def get_status_timeseries(user_id: str, kind: str, week: Optional[int] = None, day: Optional[str] = None) -> Dict[str, Any]:
-    if kind not in {"sleep", "social", "stress"}:
+def get_status_timeseries(
+    user_id: str,
+    kind: str,
+    week: Optional[int] = None,
+    day: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    bucket: Optional[str] = None,
+    agg: str = "mean",
+    max_points: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Status series of one kind, filtered by ``week``/``day`` or by a ``[start, end)``
+    time range, optionally resampled into ``bucket``s (``agg`` mean or mode) and/or
+    reduced to at most ``max_points`` points with LTTB."""
+    if kind not in STATUS_KINDS:
         raise HTTPException(status_code=400, detail="kind must be one of sleep|social|stress")
+    if agg not in ("mean", "mode"):
+        raise HTTPException(status_code=400, detail="agg must be mean or mode")
+    if (start or end) and (week is not None or day):
+        raise HTTPException(status_code=400, detail="Use either week/day or start/end")
+    lo_ns, hi_ns = _parse_range(start, end)
+    width = _parse_resample(bucket, max_points)
     _ensure_user(user_id)
-    df = _read_status_csv(user_id, kind)
-    time_col = "resp_time" if "resp_time" in df.columns else "times" if "times" in df.columns else None
-    if time_col is None:
-        raise HTTPException(status_code=500, detail="No recognizable time column in status csv")
-    if week is not None and "week" in df.columns:
-        df = df[df["week"] == week]
-    if day:
-        try:
-            day_dt = datetime.fromisoformat(day).date()
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Invalid day format; use YYYY-MM-DD")
-        df = df[df[time_col].dt.date == day_dt]
-    value_key = {
-        "sleep": "hour",
-        "social": "number",
-        "stress": "level",
-    }[kind]
-    records = []
-    for _, row in df.iterrows():
-        records.append({
-            "time": row[time_col].isoformat(),
-            "value": None if value_key not in df.columns or pd.isna(row.get(value_key)) else row.get(value_key),
-            "week": int(row.get("week")) if "week" in df.columns and not pd.isna(row.get("week")) else None,
-            "day_offset": int(row.get("day_offset")) if "day_offset" in df.columns and not pd.isna(row.get("day_offset")) else None,
-        })
-    return {"records": records}
+    entry = _status_frame(user_id, kind)
+    ranged = start or end
+    if not ranged and width is None and max_points is None:
+        rows = _status_rows(entry, week, _parse_day(day) if day else None)
+        return {"records": _status_records(entry, kind, rows)}
 
+    index = entry.time_index
+    with phase("filter"):
+        if ranged:
+            lo, hi = index.between(lo_ns, hi_ns)
+            sorted_rows = index.rows[lo:hi]
+        else:
+            selected = _status_rows(entry, week, _parse_day(day) if day else None)
+            sorted_rows = index.rows
+            if selected is not None:
+                sorted_rows = sorted_rows[np.isin(sorted_rows, selected)]
+    if width is None and max_points is None:
+        return {"records": _status_records(entry, kind, sorted_rows.tolist())}
+    return {"records": _resampled_status(entry, kind, sorted_rows, width, agg, max_points, lo_ns)}
 
-@app.get("/api/{user_id}/emotions")
-def get_emotions(user_id: str) -> Dict[str, Any]:
-    entries = _read_emotions(user_id)
-    return {"entries": entries}
 
+@app.get("/api/{user_id}/locations")
+def get_location_range(
+    user_id: str,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    bucket: Optional[str] = None,
+    max_points: Optional[int] = None,
+    format: str = "records",
+) -> Dict[str, Any]:
+    """Location records across weeks for ``start <= time < end`` (either bound optional),
+    in time order.  With ``bucket`` or ``max_points`` each record instead stands for a
+    time bucket and shows its most frequent location."""
+    _check_location_format(format)
+    lo_ns, hi_ns = _parse_range(start, end)
+    width = _parse_resample(bucket, max_points)
+    _ensure_user(user_id)
+    timeline = DATASET.location_timeline(user_id)
+    with phase("filter"):
+        lo, hi = timeline.index.between(lo_ns, hi_ns)
+        runs = timeline.locate(timeline.index.rows[lo:hi])
+    if width is None and max_points is None:
+        records: List[Dict[str, Any]] = []
+        for entry, rows in runs:
+            records.extend(_location_records(entry, rows))
+        return _location_payload(records, format)
+    rows = [(entry, i) for entry, run in runs for i in run]
+    return _location_payload(_resampled_locations(rows, timeline.index.ns[lo:hi], width, max_points, lo_ns), format)
 
-@app.get("/api/{user_id}/profile")
-def get_user_profile(user_id: str) -> Dict[str, Any]:
+
+@app.get("/api/{user_id}/classes")
+def get_classes(user_id: str) -> Dict[str, Any]:
+    """Class attendance and workload of one student per course, week and building."""
     _ensure_user(user_id)
-    
-    # Read CSV file using absolute path
-    csv_path = WORKSPACE_ROOT / "result_pre_bigfive.csv"
-    df_id_info = pd.read_csv(csv_path)
-    id_info = df_id_info[df_id_info["uid"] == user_id]  # CSV uses 'uid' column
-    
-    if id_info.empty:
-        raise HTTPException(status_code=404, detail=f"No personality data found for user {user_id}")
-    
-    big_five_profiles = id_info.to_dict(orient="records")[0]
-    
-    # Map CSV column names (capitalized) to expected format (lowercase)
-    big_five_ = {
-        "openness": big_five_profiles["Openness"],
-        "conscientiousness": big_five_profiles["Conscientiousness"], 
-        "extraversion": big_five_profiles["Extraversion"],
-        "agreeableness": big_five_profiles["Agreeableness"],
-        "neuroticism": big_five_profiles["Neuroticism"]
-    }
-    
-    
-    # Mock enrolled classes based on the emotion entries mentioning specific courses
-    enrolled_classes = {
-        'u01': [{'code': 'ENGS 069', 'name': 'Smartphone Programming', 'credits': 3},
-        {'code': 'ENGS 022', 'name': 'None', 'credits': None},
-        {'code': 'ANTH 012', 'name': 'None', 'credits': None}],
-        'u02': [{'code': 'COSC 077', 'name': 'None', 'credits': None},
-        {'code': 'COSC 098', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u03': [{'code': 'COSC 057', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u04': [{'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u05': [{'code': 'COSC 050', 'name': 'None', 'credits': None},
-        {'code': 'PSYC 028', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u07': [{'code': 'COSC 077', 'name': 'None', 'credits': None},
-        {'code': 'COSC 060', 'name': 'Computer Networks', 'credits': 4},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u08': [{'code': 'CHIN 062', 'name': 'None', 'credits': None},
-        {'code': 'COSC 089 1', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u09': [{'code': 'ANTH 050', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3},
-        {'code': 'COSC 099', 'name': 'Senior Thesis Research', 'credits': 4}],
-        'u10': [{'code': 'COSC 050', 'name': 'None', 'credits': None},
-        {'code': 'BIOL 004', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u12': [{'code': 'COSC 089 1', 'name': 'None', 'credits': None},
-        {'code': 'COSC 050', 'name': 'None', 'credits': None},
-        {'code': 'TUCK 003', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u13': [{'code': 'COSC 070', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u14': [{'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3},
-        {'code': 'COSC 027', 'name': 'None', 'credits': None},
-        {'code': 'COSC 020', 'name': 'None', 'credits': None}],
-        'u15': [{'code': 'EARS 003', 'name': 'None', 'credits': None},
-        {'code': 'SPAN 003', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u16': [{'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3},
-        {'code': 'COSC 027', 'name': 'None', 'credits': None}],
-        'u17': [{'code': 'COSC 089 1', 'name': 'None', 'credits': None},
-        {'code': 'MUS 016', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u18': [{'code': 'COSC 089 1', 'name': 'None', 'credits': None},
-        {'code': 'CHIN 033', 'name': 'None', 'credits': None},
-        {'code': 'TUCK 003', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u19': [{'code': 'COSC 050', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3},
-        {'code': 'FILM 051', 'name': 'None', 'credits': None}],
-        'u20': [{'code': 'COSC 070', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u22': [{'code': 'COSC 050', 'name': 'None', 'credits': None},
-        {'code': 'NAS 035', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u23': [{'code': 'COSC 070', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u24': [{'code': 'M&SS 045', 'name': 'None', 'credits': None},
-        {'code': 'COSC 060', 'name': 'Computer Networks', 'credits': 4},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u25': [{'code': 'NAS 008', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3},
-        {'code': 'ENGL 028', 'name': 'None', 'credits': None}],
-        'u27': [{'code': 'ECON 024', 'name': 'None', 'credits': None},
-        {'code': 'JAPN 033', 'name': 'None', 'credits': None},
-        {'code': 'FILM 042', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u30': [{'code': 'MUS 003', 'name': 'None', 'credits': None},
-        {'code': 'COSC 050', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u31': [{'code': 'MUS 003', 'name': 'None', 'credits': None},
-        {'code': 'COSC 077', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u32': [{'code': 'MATH 023', 'name': 'None', 'credits': None},
-        {'code': 'COSC 069', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u33': [{'code': 'ENGS 025', 'name': 'None', 'credits': None},
-        {'code': 'ENGS 069', 'name': 'Smartphone Programming', 'credits': 3},
-        {'code': 'ENGS 093', 'name': 'None', 'credits': None}],
-        'u34': [{'code': 'COSC 070', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u35': [{'code': 'COSC 070', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u41': [{'code': 'COSC 050', 'name': 'None', 'credits': None},
-        {'code': 'SPAN 002', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u42': [{'code': 'COSC 070', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u43': [{'code': 'ENGS 031', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u44': [{'code': 'COSC 060', 'name': 'Computer Networks', 'credits': 4},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u45': [{'code': 'COSC 070', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u46': [{'code': 'ECON 036', 'name': 'None', 'credits': None},
-        {'code': 'COSC 050', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u47': [{'code': 'COSC 060', 'name': 'Computer Networks', 'credits': 4},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u49': [{'code': 'MATH 013', 'name': 'None', 'credits': None},
-        {'code': 'LAT 003', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u50': [{'code': 'COSC 060', 'name': 'Computer Networks', 'credits': 4},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u51': [{'code': 'COSC 070', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u52': [{'code': 'BIOL 006', 'name': 'None', 'credits': None},
-        {'code': 'COSC 050', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u53': [{'code': 'COSC 089 1', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u54': [{'code': 'ENGS 025', 'name': 'None', 'credits': None},
-        {'code': 'MATH 023', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u57': [{'code': 'COSC 098', 'name': 'None', 'credits': None},
-        {'code': 'COSC 060', 'name': 'Computer Networks', 'credits': 4},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u58': [{'code': 'COSC 070', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3}],
-        'u59': [{'code': 'GERM 001', 'name': 'None', 'credits': None},
-        {'code': 'COSC 065', 'name': 'Smartphone Programming', 'credits': 3},
-        {'code': 'COSC 007', 'name': 'None', 'credits': None}]
-    }
-    
+    with phase("aggregate"):
+        return {"user_id": user_id, **CLASSES.user_summary(user_id)}
+
+
+@app.get("/api/{user_id}/week/{week}/classes")
+def get_week_classes(user_id: str, week: int) -> Dict[str, Any]:
+    """Class survey responses of a week with the nearest campus building of each fix."""
+    _ensure_user(user_id)
+    if week not in DATASET.class_frames(user_id):
+        raise HTTPException(status_code=404, detail=f"class1_week_{week}.csv not found for {user_id}")
+    return {"week": week, "records": CLASSES.week_records(user_id, week)}
+
+
+@app.get("/api/{user_id}/week/{week}/bundle")
+def get_week_bundle(user_id: str, week: int, format: str = "records") -> Dict[str, Any]:
+    """Days, per-day location records, sleep/social/stress series and the emotion
+    entry of one week; replaces the days/locations/status/emotions round trips."""
+    _check_location_format(format)
+    _ensure_user(user_id)
+    return _week_bundle(user_id, week, format)
+
+
+def _ndjson_line(data: Dict[str, Any]) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+@app.get("/api/{user_id}/bundle/stream")
+def stream_semester_bundles(user_id: str, format: str = "records") -> StreamingResponse:
+    """The week bundle of every week as NDJSON, one line per week in order, so the
+    client can start playback as soon as the first line arrives."""
+    _check_location_format(format)
+    _ensure_user(user_id)
+    weeks = _list_weeks(user_id)
+
+    def lines() -> Iterator[bytes]:
+        for week in weeks:
+            try:
+                bundle = _week_bundle(user_id, week, format)
+            except HTTPException:
+                # the week disappeared or became unreadable after the stream started
+                continue
+            yield _ndjson_line(bundle)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.get("/api/{user_id}/emotions")
+def get_emotions(user_id: str, fields: Optional[str] = None) -> Dict[str, Any]:
+    """All weekly emotion entries; ``fields=emotion,lab_assessment`` projects each
+    entry down to those keys (plus ``week``) without reading the narrative text."""
+    log = _emotion_log(user_id)
+    wanted = _parse_fields(fields)
+    if wanted is None:
+        return {"entries": log.entries()}
+    source = log.compact if not any(f in NARRATIVE_FIELDS for f in wanted) else log.entries()
+    return {"entries": [{f: e[f] for f in wanted if f in e} for e in source]}
+
+
+def _build_profile(user_id: str, big_five: Dict[str, float]) -> Dict[str, Any]:
     return {
         "user_id": user_id,
-        "big_five": big_five_,
-        "enrolled_classes": enrolled_classes.get(user_id, []),
+        "big_five": big_five,
+        "enrolled_classes": ENROLLED_CLASSES.get(user_id, []),
         "display_name": f"Student {user_id.upper()}"
     }
 
 
+_PROFILE_REGISTRY: Tuple[int, Dict[str, Dict[str, Any]]] = (-1, {})
+
+
+def _profiles() -> Dict[str, Dict[str, Any]]:
+    """uid -> profile plus data availability for every user with a data directory.
+
+    Rebuilt only when the dataset version changes, so per-request lookups are a
+    dict access; users without a Big Five row are left out.
+    """
+    global _PROFILE_REGISTRY
+    users = DATASET.users()
+    version, registry = _PROFILE_REGISTRY
+    if version == DATASET.version:
+        return registry
+    version = DATASET.version
+    registry = {}
+    for user_id in users:
+        big_five = DATASET.big_five(user_id)
+        if big_five is None:
+            continue
+        profile = _build_profile(user_id, big_five)
+        profile["available"] = {
+            "weeks": DATASET.weeks(user_id),
+            "status": DATASET.status_kinds(user_id),
+            "emotions": DATASET.emotion_log(user_id) is not None,
+        }
+        registry[user_id] = profile
+    _PROFILE_REGISTRY = (version, registry)
+    return registry
+
+
+@app.get("/api/profiles")
+def list_profiles() -> Dict[str, Any]:
+    """Every user's profile in one response, for the student picker."""
+    return {"profiles": list(_profiles().values())}
+
+
+@app.get("/api/{user_id}/profile")
+def get_user_profile(user_id: str) -> Dict[str, Any]:
+    _ensure_user(user_id)
+    big_five = DATASET.big_five(user_id)
+    if big_five is None:
+        raise HTTPException(status_code=404, detail=f"No personality data found for user {user_id}")
+    return _build_profile(user_id, big_five)
+
+
 @app.get("/api/{user_id}/week/{week}/summary")
 def get_week_summary(user_id: str, week: int) -> Dict[str, Any]:
     # emotions per week from history file
-    entries = _read_emotions(user_id)
-    emo = next((e for e in entries if int(e.get("week")) == week), None)
+    emo = _emotion_log(user_id).entry(week)
     if emo is None:
         raise HTTPException(status_code=404, detail="No emotion entry for week")
     days = list_days(user_id, week)["days"]
     return {"week": week, "days": days, "emotion": emo.get("emotion"), "lab_assessment": emo.get("lab_assessment"), "weekly_desc": emo.get("weekly_desc")}
 
-@app.post("/api/chat")
-def chat_with_student(request: ChatRequest) -> Dict[str, Any]:
-    try:
-        print(f"DEBUG: Received chat request for student {request.studentId}, week {request.week}")
-        print(f"DEBUG: Big Five data: {request.bigFive}")
-        print(f"DEBUG: API Key length: {len(request.apiKey) if request.apiKey else 0}")
-        # Create personality description
-        personality_traits = []
-        for trait, value in request.bigFive.items():
-            level = "high" if value >= 70 else "moderate" if value >= 40 else "low"
-            personality_traits.append(f"{trait}: {level} ({value:.1f}/100)")
-
-        personality_desc = ", ".join(personality_traits)
-        
-        # Create system prompt
-        system_prompt = f"""You are {request.studentId.upper()}, a college student. Respond as this student would, based on your personality and recent experiences.
+CHAT_GENERATION_CONFIG: Dict[str, Any] = {
+    "temperature": 0.9,
+    "topP": 1.0,
+    "topK": 1,
+    "maxOutputTokens": 2048
+}
+
+
+def _persona_prompt(student_id: str, week: int, big_five: Dict[str, float], weekly_desc: str) -> str:
+    # Create personality description
+    personality_traits = []
+    for trait, value in big_five.items():
+        level = "high" if value >= 70 else "moderate" if value >= 40 else "low"
+        personality_traits.append(f"{trait}: {level} ({value:.1f}/100)")
+
+    personality_desc = ", ".join(personality_traits)
+
+    # Create system prompt
+    return f"""You are {student_id.upper()}, a college student. Respond as this student would, based on your personality and recent experiences.
 
 PERSONALITY (Big Five):
 {personality_desc}
 
-RECENT WEEK {request.week} EXPERIENCE:
-{request.weeklyDesc}
+RECENT WEEK {week} EXPERIENCE:
+{weekly_desc}
 
 Instructions:
 Respond in first person as this student
@@ -402,62 +1049,433 @@ Keep responses conversational (2-3 sentences usually)
 Show your emotions and thoughts based on your personality and week's events
 """
 
-        # Prepare request data for Gemini API
-        request_data = {
-            "contents": [
-                {
-                    "parts": [
-                        {
-                            "text": request.message
-                        }
-                    ]
-                }
-            ],
-            "systemInstruction": {
+
+def _chat_request_data(request: ChatRequest) -> Dict[str, Any]:
+    system_prompt = _persona_prompt(request.studentId, request.week, request.bigFive, request.weeklyDesc)
+
+    # Prepare request data for Gemini API
+    return {
+        "contents": [
+            {
                 "parts": [
                     {
-                        "text": system_prompt
+                        "text": request.message
                     }
                 ]
-            },
-            "generationConfig": {
-                "temperature": 0.9,
-                "topP": 1.0,
-                "topK": 1,
-                "maxOutputTokens": 2048
             }
-        }
+        ],
+        "systemInstruction": {
+            "parts": [
+                {
+                    "text": system_prompt
+                }
+            ]
+        },
+        "generationConfig": dict(CHAT_GENERATION_CONFIG)
+    }
+
+
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _chat_cache_key(request: ChatRequest, request_data: Dict[str, Any]) -> str:
+    return chat_cache_key(
+        request.studentId,
+        request.week,
+        request.bigFive,
+        request.weeklyDesc,
+        request.message,
+        request_data["generationConfig"],
+    )
+
+
+async def _stream_chat(
+    api_key: str,
+    request_data: Dict[str, Any],
+    on_done: Optional[Callable[[str], None]] = None,
+    cached: Optional[str] = None,
+    fallback: Optional[Callable[[], Dict[str, Any]]] = None,
+) -> AsyncIterator[str]:
+    """Relay upstream text deltas as ``chunk`` events, then ``done`` or ``error``.
+
+    A ``cached`` reply is sent as a single chunk; ``on_done`` receives the full
+    reply of a completed upstream stream, in the threadpool since it may write
+    to SQLite.  If the upstream rejects ``request_data``'s cached context before
+    the first delta, the request ``fallback`` returns is streamed instead.  When
+    the client disconnects Starlette cancels this generator, which closes the
+    upstream streaming request as well.
+    """
+    if cached is not None:
+        yield _sse_event("chunk", {"text": cached})
+        yield _sse_event("done", {"response": cached, "cached": True})
+        return
+    parts: List[str] = []
+    try:
+        while True:
+            try:
+                async for text in GEMINI.stream_generate(api_key, request_data):
+                    parts.append(text)
+                    yield _sse_event("chunk", {"text": text})
+                break
+            except GeminiError as e:
+                if parts or fallback is None or e.status_code not in CACHED_CONTENT_GONE:
+                    raise
+                request_data, fallback = fallback(), None
+    except GeminiError as e:
+        yield _sse_event("error", {"status": _gemini_error_status(e), "detail": str(e)})
+        return
+    except Exception as e:
+        yield _sse_event("error", {"status": 500, "detail": f"Chat error: {str(e)}"})
+        return
+    reply = "".join(parts)
+    if on_done is not None:
+        await run_in_threadpool(on_done, reply)
+    yield _sse_event("done", {"response": reply})
+
+
+def _gemini_error_status(e: GeminiError) -> int:
+    if e.status_code is not None:
+        return e.status_code
+    return 504 if e.timeout else 500
+
+
+def _sse_response(events: AsyncIterator[str], headers: Optional[Dict[str, str]] = None) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", **(headers or {})},
+    )
+
+
+@app.post("/api/chat")
+async def chat_with_student(request: ChatRequest, response: Response) -> Any:
+    """Reply as the student; with ``"stream": true`` the reply is sent as
+    Server-Sent Events (``chunk`` deltas, then ``done`` or ``error``).
+
+    Replies are served from ``CHAT_CACHE`` when possible (``X-Cache: HIT``);
+    ``"noCache": true`` always asks upstream and stores the fresh reply.
+    """
+    try:
+        annotate(student=request.studentId, week=request.week, stream=request.stream)
+        request_data = _chat_request_data(request)
+        cache_key = _chat_cache_key(request, request_data)
+        if request.noCache:
+            CHAT_CACHE.record_bypass()
+            cached = None
+        else:
+            cached = CHAT_CACHE.get(cache_key)
+        annotate(chat_cache="bypass" if request.noCache else "hit" if cached is not None else "miss")
+
+        if request.stream:
+            return _sse_response(
+                _stream_chat(request.apiKey, request_data, lambda reply: CHAT_CACHE.put(cache_key, reply), cached),
+                headers={"X-Cache": "HIT" if cached is not None else "MISS"},
+            )
+
+        response.headers["X-Cache"] = "HIT" if cached is not None else "MISS"
+        if cached is not None:
+            return {"response": cached}
+
+        # Make HTTP request to Gemini API through the shared pooled client
+        response_data = await GEMINI.generate(request.apiKey, request_data)
 
-        # Make HTTP request to Gemini API
-        gemini_url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
-        headers = {
-            'Content-Type': 'application/json',
-            'X-goog-api-key': request.apiKey
-        }
-        
-        response = requests.post(gemini_url, headers=headers, json=request_data)
-        
-        if not response.ok:
-            raise HTTPException(status_code=response.status_code, detail=f"Gemini API error: {response.text}")
-        
-        response_data = response.json()
-        
         # Extract the generated text from the response
-        if 'candidates' in response_data and len(response_data['candidates']) > 0:
-            if 'content' in response_data['candidates'][0] and 'parts' in response_data['candidates'][0]['content']:
-                generated_text = response_data['candidates'][0]['content']['parts'][0]['text']
-                return {"response": generated_text}
-        
+        generated_text = extract_text(response_data)
+        if generated_text is not None:
+            CHAT_CACHE.put(cache_key, generated_text)
+            return {"response": generated_text}
+
         raise HTTPException(status_code=500, detail="Unexpected response format from Gemini API")
 
-    except requests.RequestException as e:
-        raise HTTPException(status_code=500, detail=f"Network error: {str(e)}")
+    except HTTPException:
+        raise
+    except GeminiError as e:
+        raise HTTPException(status_code=_gemini_error_status(e), detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
 
     
+def _chat_session(session_id: str) -> ChatSession:
+    session = CHAT_SESSIONS.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired chat session: {session_id}")
+    return session
+
+
+async def _session_cached_content(session: ChatSession, api_key: str) -> Optional[str]:
+    """Name of an upstream cachedContents resource holding the persona prompt, if
+    context caching is enabled and the upstream accepts this prompt; created on
+    first use per session and again whenever a turn brings a different key."""
+    if not CHAT_CONTEXT_CACHE or session.context_cache_unsupported:
+        return None
+    now = time.time()
+    key = api_key_hash(api_key)
+    if (
+        session.cached_content is not None
+        and session.cached_content_key == key
+        and session.cached_content_expires - now > 30
+    ):
+        return session.cached_content
+    ttl = int(CHAT_SESSIONS.idle_ttl)
+    try:
+        name = await GEMINI.create_cached_content(api_key, {"parts": [{"text": session.system_prompt}]}, ttl)
+    except GeminiError as e:
+        # a bad key or an outage says nothing about the prompt: send it inline this turn
+        if not e.cache_unsupported:
+            return None
+        session.context_cache_unsupported = True
+        session.cached_content = None
+        await run_in_threadpool(CHAT_SESSIONS.save, session)
+        return None
+    session.cached_content = name
+    session.cached_content_key = key
+    session.cached_content_expires = now + ttl
+    await run_in_threadpool(CHAT_SESSIONS.save, session)
+    return name
+
+
+def _session_request_data(session: ChatSession, message: str, cached_content: Optional[str]) -> Dict[str, Any]:
+    request_data: Dict[str, Any] = {
+        "contents": session.contents(message),
+        "generationConfig": dict(CHAT_GENERATION_CONFIG),
+    }
+    if cached_content is not None:
+        request_data["cachedContent"] = cached_content
+    else:
+        request_data["systemInstruction"] = {"parts": [{"text": session.system_prompt}]}
+    return request_data
+
+
+@app.post("/api/chat/sessions")
+def create_chat_session(request: ChatSessionRequest) -> Dict[str, Any]:
+    """Start a multi-turn conversation with one student for one week.
+
+    ``bigFive`` and ``weeklyDesc`` default to the stored profile and that
+    week's narrative, so clients only send them to override.
+    """
+    big_five = request.bigFive
+    if big_five is None:
+        big_five = get_user_profile(request.studentId)["big_five"]
+    weekly_desc = request.weeklyDesc
+    if weekly_desc is None:
+        entry = _emotion_log(request.studentId).entry(request.week)
+        if entry is None or not entry.get("weekly_desc"):
+            raise HTTPException(status_code=404, detail="No emotion entry for week")
+        weekly_desc = entry["weekly_desc"]
+    system_prompt = _persona_prompt(request.studentId, request.week, big_five, weekly_desc)
+    session = CHAT_SESSIONS.create(request.studentId, request.week, system_prompt)
+    return {**session.summary(), "idle_timeout_seconds": CHAT_SESSIONS.idle_ttl}
+
+
+@app.get("/api/chat/sessions/{session_id}")
+def get_chat_session(session_id: str) -> Dict[str, Any]:
+    return _chat_session(session_id).summary()
+
+
+@app.delete("/api/chat/sessions/{session_id}")
+def delete_chat_session(session_id: str) -> Dict[str, Any]:
+    if not CHAT_SESSIONS.delete(session_id):
+        raise HTTPException(status_code=404, detail=f"Unknown or expired chat session: {session_id}")
+    return {"deleted": session_id}
+
+
+@app.post("/api/chat/sessions/{session_id}/messages")
+async def post_chat_session_message(session_id: str, request: ChatSessionMessage) -> Any:
+    """Send one turn; the upstream sees the trimmed history plus this message and
+    the persona prompt (inline or as cached context)."""
+    # the session store may be SQLite (CHAT_SESSION_PATH); keep its I/O off the loop
+    session = await run_in_threadpool(_chat_session, session_id)
+    message = request.message
+
+    def record(reply: str) -> None:
+        session.add_exchange(message, reply, CHAT_SESSIONS.history_budget)
+        CHAT_SESSIONS.save(session)
+
+    def inline_prompt() -> Dict[str, Any]:
+        # the cached context expired upstream early or is not visible to this key
+        session.cached_content = None
+        return _session_request_data(session, message, None)
+
+    try:
+        cached_content = await _session_cached_content(session, request.apiKey)
+        request_data = _session_request_data(session, message, cached_content)
+        fallback = inline_prompt if cached_content is not None else None
+        if request.stream:
+            return _sse_response(_stream_chat(request.apiKey, request_data, record, fallback=fallback))
+
+        try:
+            response_data = await GEMINI.generate(request.apiKey, request_data)
+        except GeminiError as e:
+            if fallback is None or e.status_code not in CACHED_CONTENT_GONE:
+                raise
+            response_data = await GEMINI.generate(request.apiKey, fallback())
+
+        generated_text = extract_text(response_data)
+        if generated_text is None:
+            raise HTTPException(status_code=500, detail="Unexpected response format from Gemini API")
+        await run_in_threadpool(record, generated_text)
+        return {"response": generated_text, "session_id": session.session_id}
+
+    except HTTPException:
+        raise
+    except GeminiError as e:
+        raise HTTPException(status_code=_gemini_error_status(e), detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
+
+
+def _batch_students(student_ids: Union[List[str], str]) -> List[str]:
+    if isinstance(student_ids, str):
+        if student_ids != "all":
+            raise HTTPException(status_code=400, detail='studentIds must be a list of ids or "all"')
+        return sorted(_profiles())
+    students = list(dict.fromkeys(s.strip() for s in student_ids if s.strip()))
+    if not students:
+        raise HTTPException(status_code=400, detail="studentIds is empty")
+    unknown = [s for s in students if not DATASET.has_user(s)]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown students: {', '.join(unknown[:20])}")
+    return students
+
+
+def _batch_persona(student_id: str, week: int) -> Tuple[Dict[str, float], str]:
+    """Stored Big Five scores and the week's narrative of one student."""
+    big_five = DATASET.big_five(student_id)
+    if big_five is None:
+        raise HTTPException(status_code=404, detail=f"No personality data found for user {student_id}")
+    log = DATASET.emotion_log(student_id)
+    entry = log.entry(week) if log is not None else None
+    if entry is None or not entry.get("weekly_desc"):
+        raise HTTPException(status_code=404, detail="No emotion entry for week")
+    return big_five, entry["weekly_desc"]
+
+
+async def _batch_answer(request: ChatBatchRequest, student_id: str, limit: AdaptiveLimit) -> Dict[str, Any]:
+    """One student's reply to the batch question, as the fields of its result line.
+
+    Replies go through the chat cache under the same key as ``/api/chat``, so a
+    batch started again (e.g. after its job expired) only asks the students
+    that have no reply yet.
+    """
+    try:
+        big_five, weekly_desc = await run_in_threadpool(_batch_persona, student_id, request.week)
+    except HTTPException as e:
+        return {"error": e.detail, "status": e.status_code}
+    chat_request = ChatRequest(
+        message=request.message,
+        apiKey=request.apiKey,
+        studentId=student_id,
+        bigFive=big_five,
+        weeklyDesc=weekly_desc,
+        week=request.week,
+    )
+    request_data = _chat_request_data(chat_request)
+    cache_key = _chat_cache_key(chat_request, request_data)
+    cached = None if request.noCache else CHAT_CACHE.get(cache_key)
+    if cached is not None:
+        return {"response": cached, "cached": True}
+
+    def on_retry(error: GeminiError, delay: float) -> None:
+        # a rate limit slows the whole job down, not just this call
+        if error.status_code == 429:
+            limit.throttle(delay)
+
+    try:
+        response_data = await GEMINI.generate(request.apiKey, request_data, on_retry=on_retry)
+    except GeminiError as e:
+        if e.status_code == 429:
+            limit.throttle(GEMINI.backoff_max)
+        return {"error": str(e), "status": _gemini_error_status(e)}
+    generated_text = extract_text(response_data)
+    if generated_text is None:
+        return {"error": "Unexpected response format from Gemini API", "status": 500}
+    CHAT_CACHE.put(cache_key, generated_text)
+    return {"response": generated_text, "cached": False}
+
+
+async def _batch_lines(job: BatchJob, after: int) -> AsyncIterator[bytes]:
+    yield _ndjson_line(job.header())
+    async for result in job.follow(after):
+        yield _ndjson_line(result)
+    yield _ndjson_line(job.summary())
+
+
+def _batch_response(job: BatchJob, after: int) -> StreamingResponse:
+    return StreamingResponse(
+        _batch_lines(job, after),
+        media_type="application/x-ndjson",
+        headers={"X-Job-Id": job.job_id, "Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _batch_job(job_id: str) -> BatchJob:
+    job = CHAT_BATCHES.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Unknown or expired batch job: {job_id}; POST it again with the same jobId to resume from the chat cache",
+        )
+    return job
+
+
+@app.post("/api/chat/batch")
+async def start_chat_batch(request: ChatBatchRequest) -> StreamingResponse:
+    """Ask every listed student (or ``"all"``) the same question about one week.
+
+    Each persona is built from the stored Big Five scores and that week's
+    narrative.  The upstream calls run concurrently, and the reply stream is
+    NDJSON: a header line with the ``job_id`` and students, one line per
+    student as it completes (``index``, ``student_id``, ``response`` or
+    ``error``/``status``), and a summary line with ``done``.  The job keeps
+    running if the client disconnects; ``GET /api/chat/batch/{job_id}?after=N``
+    or a POST with ``jobId`` and ``after`` picks the stream up after the first
+    ``N`` result lines.
+    """
+    if request.jobId:
+        job = CHAT_BATCHES.get(request.jobId)
+        if job is not None:
+            if (job.message, job.week) != (request.message, request.week):
+                raise HTTPException(status_code=409, detail=f"Batch job {job.job_id} asks a different question")
+            return _batch_response(job, request.after)
+    if request.concurrency is not None and request.concurrency < 1:
+        raise HTTPException(status_code=400, detail="concurrency must be at least 1")
+    students = await run_in_threadpool(_batch_students, request.studentIds)
+    if len(students) > CHAT_BATCHES.max_students:
+        raise HTTPException(status_code=400, detail=f"At most {CHAT_BATCHES.max_students} students per batch")
+    job = CHAT_BATCHES.create(request.week, request.message, students, request.concurrency, request.jobId)
+    if job is None:
+        raise HTTPException(status_code=429, detail="Too many batch jobs running; try again later")
+    job.start(lambda student_id, limit: _batch_answer(request, student_id, limit))
+    return _batch_response(job, 0)
+
+
+@app.get("/api/chat/batch/{job_id}")
+async def resume_chat_batch(job_id: str, after: int = 0) -> StreamingResponse:
+    """The job's NDJSON stream again, skipping the first ``after`` result lines."""
+    return _batch_response(_batch_job(job_id), after)
+
+
+@app.delete("/api/chat/batch/{job_id}")
+async def cancel_chat_batch(job_id: str) -> Dict[str, Any]:
+    job = _batch_job(job_id)
+    CHAT_BATCHES.delete(job_id)
+    return job.summary()
+
+
+@app.get("/api/chat/cache")
+def get_chat_cache_stats() -> Dict[str, Any]:
+    return CHAT_CACHE.stats()
+
+
+@app.delete("/api/chat/cache")
+def clear_chat_cache() -> Dict[str, Any]:
+    CHAT_CACHE.clear()
+    return CHAT_CACHE.stats()
+
+
 @app.get("/api/test-gemini")
-def test_gemini_api(api_key: Optional[str] = None) -> Dict[str, Any]:
+async def test_gemini_api(api_key: Optional[str] = None) -> Dict[str, Any]:
     """Test endpoint to verify Gemini API connectivity using direct HTTP requests"""
     try:
         if not api_key:
@@ -492,42 +1510,32 @@ def test_gemini_api(api_key: Optional[str] = None) -> Dict[str, Any]:
             }
         }
 
-        # Make HTTP request to Gemini API
-        gemini_url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
-        headers = {
-            'Content-Type': 'application/json',
-            'X-goog-api-key': api_key
-        }
-        
-        response = requests.post(gemini_url, headers=headers, json=request_data)
-        
-        if not response.ok:
+        # Make HTTP request to Gemini API through the shared pooled client
+        try:
+            response_data = await GEMINI.generate(api_key, request_data)
+        except GeminiError as e:
+            if e.status_code is not None:
+                return {
+                    "success": False,
+                    "error": f"Gemini API error: {e.status_code} - {e.body}"
+                }
             return {
                 "success": False,
-                "error": f"Gemini API error: {response.status_code} - {response.text}"
+                "error": str(e)
             }
-        
-        response_data = response.json()
-        
+
         # Extract the generated text from the response
-        if 'candidates' in response_data and len(response_data['candidates']) > 0:
-            if 'content' in response_data['candidates'][0] and 'parts' in response_data['candidates'][0]['content']:
-                generated_text = response_data['candidates'][0]['content']['parts'][0]['text']
-                return {
-                    "success": True,
-                    "response": generated_text,
-                    "message": "Gemini API connection successful!"
-                }
-        
-        return {
-            "success": False,
-            "error": "Unexpected response format from Gemini API"
-        }
+        generated_text = extract_text(response_data)
+        if generated_text is not None:
+            return {
+                "success": True,
+                "response": generated_text,
+                "message": "Gemini API connection successful!"
+            }
 
-    except requests.RequestException as e:
         return {
             "success": False,
-            "error": f"Network error: {str(e)}"
+            "error": "Unexpected response format from Gemini API"
         }
     except Exception as e:
         return {
@@ -535,13 +1543,50 @@ def test_gemini_api(api_key: Optional[str] = None) -> Dict[str, Any]:
             "error": f"Connection test failed: {str(e)}"
         }
 
+@app.get("/healthz")
+def get_health() -> Dict[str, Any]:
+    """Liveness: the process is up and answering."""
+    return {"status": "ok", "pid": os.getpid()}
+
+
+@app.get("/readyz")
+def get_readiness(response: Response) -> Dict[str, Any]:
+    """Readiness: 200 once the dataset is loaded, 503 until then (or if loading failed)."""
+    if not READY.is_set():
+        response.status_code = 503
+        return {"ready": False, "error": _PRELOAD["error"]}
+    return {
+        "ready": True,
+        "pid": os.getpid(),
+        "users": len(DATASET.users()),
+        "version": DATASET.version,
+        "load_seconds": _PRELOAD["seconds"],
+    }
+
+
+@app.get("/metrics")
+def get_metrics() -> Response:
+    """Request, phase and cache metrics in the Prometheus text format."""
+    text = METRICS.render({
+        "api_response_cache": RESPONSE_CACHE.stats(),
+        "api_chat_cache": CHAT_CACHE.stats(),
+        "api_chat_sessions": {"active": len(CHAT_SESSIONS)},
+        "api_chat_batch": CHAT_BATCHES.stats(),
+        "api_dataset": {"version": DATASET.version, "users": len(DATASET.users())},
+        "api_live": LIVE.stats(),
+        "api_search": SEARCH.stats(),
+    })
+    return Response(content=text, media_type="text/plain; version=0.0.4")
+
+
 def create_app() -> FastAPI:
     return app
 
 
 if __name__ == "__main__":
-    import uvicorn
+    # same as `python -m scripts.serve`; API_WORKERS / API_HOST / API_PORT configure it
+    from scripts.serve import main
 
-    uvicorn.run("scripts.api_server:app", host="127.0.0.1", port=8089, reload=False)
+    main()
 
 
@@ -0,0 +1,128 @@
+"""Wall time of a cohort interview through ``/api/chat/batch`` against a fake upstream.
+
+Runs the API server and a fake Gemini upstream (fixed ``--latency``, an
+optional ``--error-rate`` of 429s) on background uvicorn threads and asks
+every student the same question.  Reports the batch wall time next to the
+time the same replies take one after another, the per-reply latency and how
+often the job throttled itself.  It also checks resuming: a client that
+drops the stream halfway and reconnects with ``after`` must end up with
+every student exactly once, and POSTing the finished job's id again after
+it is gone must answer from the chat cache.
+
+    python -m scripts.benchmarks.chat_batch [--root /tmp/cohort] [--latency 1.0] [--concurrency 16] [--json out.json]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from typing import Any, Dict, List, Tuple
+
+import httpx
+
+from scripts.benchmarks.fake_gemini import create_fake_gemini_app, serve_in_thread
+from scripts.benchmarks.report import latency_summary, metadata, write_json
+
+QUESTION = "How did this week go for you, and what are you worried about?"
+
+
+def read_stream(response: httpx.Response, limit: int = -1) -> Tuple[Dict[str, Any], List[Dict[str, Any]], Dict[str, Any]]:
+    """(header, result lines, summary) of one batch stream; stops after ``limit`` results if given."""
+    header: Dict[str, Any] = {}
+    results: List[Dict[str, Any]] = []
+    summary: Dict[str, Any] = {}
+    for line in response.iter_lines():
+        if not line:
+            continue
+        data = json.loads(line)
+        if "students" in data:
+            header = data
+        elif "done" in data:
+            summary = data
+        else:
+            results.append(data)
+            if len(results) == limit:
+                break
+    return header, results, summary
+
+
+def run(latency: float, error_rate: float, concurrency: int, week: int) -> Dict[str, Any]:
+    # imported here so --root can set DATASET_ROOT first
+    from scripts import api_server
+
+    api_server.preload()
+    api_server.GEMINI.max_concurrency = concurrency
+    api_server.CHAT_BATCHES.concurrency = concurrency
+    upstream = create_fake_gemini_app(latency=latency, error_rate=error_rate, retry_after=latency)
+    body = {"message": QUESTION, "apiKey": "stub-key", "week": week, "studentIds": "all", "noCache": True}
+    report: Dict[str, Any] = {}
+    with serve_in_thread(api_server.app) as base, serve_in_thread(upstream) as upstream_url, \
+            httpx.Client(base_url=base, timeout=None) as client:
+        api_server.GEMINI.api_base = upstream_url
+
+        start = time.perf_counter()
+        with client.stream("POST", "/api/chat/batch", json=body) as response:
+            header, results, summary = read_stream(response)
+        wall = time.perf_counter() - start
+        replies = [r for r in results if "response" in r]
+        sequential = sum(r["ms"] for r in replies) / 1000
+        report["batch"] = {
+            "students": header.get("total"),
+            "replies": len(replies),
+            "errors": len(results) - len(replies),
+            "wall_s": round(wall, 3),
+            "sequential_s": round(sequential, 3),
+            "speedup": round(sequential / wall, 2) if wall else None,
+            "throttles": summary.get("throttles"),
+            "final_concurrency": summary.get("concurrency"),
+            "reply": latency_summary([r["ms"] for r in replies]),
+        }
+
+        # drop the stream halfway, then pick it up after the lines already seen
+        with client.stream("POST", "/api/chat/batch", json=body) as response:
+            header, first, _ = read_stream(response, limit=max(1, len(results) // 2))
+        with client.stream("GET", f"/api/chat/batch/{header['job_id']}", params={"after": len(first)}) as response:
+            _, rest, _ = read_stream(response)
+        indices = sorted(r["index"] for r in first + rest)
+        report["resume_ok"] = indices == list(range(header["total"]))
+
+        # a gone job posted again under its id answers finished students from the chat cache
+        client.delete(f"/api/chat/batch/{header['job_id']}")
+        calls = upstream.state.calls
+        with client.stream("POST", "/api/chat/batch", json={**body, "noCache": False, "jobId": header["job_id"]}) as response:
+            _, again, _ = read_stream(response)
+        report["rerun_cached"] = sum(bool(r.get("cached")) for r in again)
+        report["rerun_upstream_calls"] = upstream.state.calls - calls
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--root", help="workspace to interview (default: this repository)")
+    parser.add_argument("--week", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=1.0, help="fake upstream seconds per reply")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream calls answered with 429")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    args = parser.parse_args()
+    if args.root:
+        os.environ["DATASET_ROOT"] = args.root
+    os.environ.setdefault("DATASET_COMPILED_DIR", "")
+    # room for every reply, so the rerun can be answered from the cache
+    os.environ.setdefault("CHAT_CACHE_SIZE", "100000")
+
+    result = run(args.latency, args.error_rate, args.concurrency, args.week)
+    params = {k: v for k, v in vars(args).items() if k != "json_path"}
+    report = {"meta": metadata("chat_batch", **params), **result}
+    batch = report["batch"]
+    print(f"{batch['replies']}/{batch['students']} replies ({batch['errors']} errors) in {batch['wall_s']:.1f}s; "
+          f"one after another: {batch['sequential_s']:.1f}s ({batch['speedup']}x); "
+          f"{batch['throttles']} throttles, concurrency ended at {batch['final_concurrency']}")
+    print(f"resume ok: {report['resume_ok']}; rerun: {report['rerun_cached']} from cache, "
+          f"{report['rerun_upstream_calls']} upstream calls")
+    write_json(args.json_path, report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Time-to-first-token of ``/api/chat`` with and without ``"stream": true``.
+
+Runs the API server and a fake Gemini upstream that emits delayed chunks on
+background uvicorn threads, then measures TTFT and total time for both modes.
+It also checks the SSE contract: ``chunk`` events followed by ``done``, an
+``error`` event for a failing upstream, and cancellation of the upstream
+stream when the client disconnects.
+
+    python -m scripts.benchmarks.chat_stream [--latency 0.4] [--chunk-delay 0.15]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from typing import Any, Dict, Iterator, List, Tuple
+
+import httpx
+
+from scripts import api_server
+from scripts.benchmarks.fake_gemini import create_fake_gemini_app, serve_in_thread
+
+CHAT_BODY = {
+    "message": "How was your week? Tell me about classes, the boathouse and how you slept lately.",
+    "apiKey": "stub-key",
+    "studentId": "u01",
+    "bigFive": {"openness": 78.0, "neuroticism": 55.0},
+    "weeklyDesc": "A busy week of rowing and deadlines.",
+    "week": 1,
+    # every run must reach the upstream, not replay the reply cached by the previous one
+    "noCache": True,
+}
+
+
+def iter_sse(response: httpx.Response) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    event = "message"
+    for line in response.iter_lines():
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            yield event, json.loads(line[len("data:"):].strip())
+            event = "message"
+
+
+def measure(client: httpx.Client, base: str, stream: bool) -> Dict[str, Any]:
+    start = time.perf_counter()
+    if not stream:
+        response = client.post(f"{base}/api/chat", json=CHAT_BODY)
+        total = time.perf_counter() - start
+        return {"ttft_s": total, "total_s": total, "status": response.status_code}
+    ttft = None
+    events: List[str] = []
+    with client.stream("POST", f"{base}/api/chat", json={**CHAT_BODY, "stream": True}) as response:
+        for event, _data in iter_sse(response):
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            events.append(event)
+    total = time.perf_counter() - start
+    ok = bool(events) and events[-1] == "done" and all(e == "chunk" for e in events[:-1])
+    return {"ttft_s": ttft, "total_s": total, "status": response.status_code, "events": len(events), "contract_ok": ok}
+
+
+def run(latency: float, chunk_delay: float) -> Dict[str, Any]:
+    report: Dict[str, Any] = {}
+    upstream = create_fake_gemini_app(latency=latency, chunk_delay=chunk_delay)
+    failing = create_fake_gemini_app(fail_first=10**6, fail_status=400)
+    with serve_in_thread(api_server.app) as base, serve_in_thread(upstream) as upstream_url, \
+            serve_in_thread(failing) as failing_url, httpx.Client(timeout=30) as client:
+        api_server.GEMINI.api_base = upstream_url
+        report["blocking"] = measure(client, base, stream=False)
+        report["streaming"] = measure(client, base, stream=True)
+
+        # disconnect after the first chunk; the fake upstream should see its stream cancelled
+        with client.stream("POST", f"{base}/api/chat", json={**CHAT_BODY, "stream": True}) as response:
+            next(iter_sse(response))
+        deadline = time.monotonic() + 5
+        while upstream.state.cancelled_streams == 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        report["disconnect_cancels_upstream"] = upstream.state.cancelled_streams > 0
+
+        api_server.GEMINI.api_base = failing_url
+        with client.stream("POST", f"{base}/api/chat", json={**CHAT_BODY, "stream": True}) as response:
+            events = list(iter_sse(response))
+        report["error_event"] = events[-1][0] == "error" and events[-1][1].get("status") == 400
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.4, help="fake upstream time to first chunk (s)")
+    parser.add_argument("--chunk-delay", type=float, default=0.15, help="fake upstream delay between chunks (s)")
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = run(args.latency, args.chunk_delay)
+    for mode in ("blocking", "streaming"):
+        row = report[mode]
+        print(f"{mode:9s}  ttft {row['ttft_s'] * 1000:7.1f} ms  total {row['total_s'] * 1000:7.1f} ms  status {row['status']}")
+    print(f"sse contract ok: {report['streaming']['contract_ok']}  "
+          f"disconnect cancels upstream: {report['disconnect_cancels_upstream']}  "
+          f"error event on upstream 400: {report['error_event']}")
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Diff two benchmark JSON reports (e.g. from two commits) and flag regressions.
+
+Every latency (``*_ms``) and throughput (``rps``) figure found at the same
+path in both reports is compared; a latency that grew, or a throughput that
+shrank, by more than ``--threshold`` is a regression and makes the exit
+status 1.
+
+    python -m scripts.benchmarks.compare before.json after.json [--threshold 0.15] [--min-ms 0.5]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from typing import Any, Dict, Iterator, List, Tuple
+
+# figures where smaller is better / larger is better; max_ms is too noisy to gate on
+LOWER_IS_BETTER = ("mean_ms", "p50_ms", "p95_ms", "p99_ms", "first_ms")
+HIGHER_IS_BETTER = ("rps",)
+
+
+def _figures(node: Any, path: Tuple[str, ...] = ()) -> Iterator[Tuple[Tuple[str, ...], float]]:
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "meta":
+                continue
+            if key in LOWER_IS_BETTER + HIGHER_IS_BETTER and isinstance(value, (int, float)):
+                yield path + (key,), float(value)
+            else:
+                yield from _figures(value, path + (key,))
+
+
+def compare(before: Dict[str, Any], after: Dict[str, Any], threshold: float, min_ms: float) -> List[Dict[str, Any]]:
+    """One row per figure present in both reports, with its relative change."""
+    old = dict(_figures(before))
+    rows = []
+    for path, new_value in _figures(after):
+        if path not in old:
+            continue
+        old_value = old[path]
+        change = (new_value - old_value) / old_value if old_value else 0.0
+        key = path[-1]
+        if key in LOWER_IS_BETTER:
+            # sub-millisecond jitter is noise, not a regression
+            regressed = change > threshold and new_value - old_value > min_ms
+        else:
+            regressed = change < -threshold
+        rows.append({"figure": "/".join(path), "before": old_value, "after": new_value,
+                     "change": round(change, 4), "regressed": regressed})
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=0.15, help="relative change counted as a regression")
+    parser.add_argument("--min-ms", type=float, default=0.5, help="ignore latency changes smaller than this")
+    parser.add_argument("--all", action="store_true", help="list every figure, not only regressions and improvements")
+    args = parser.parse_args()
+
+    with open(args.before, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(args.after, encoding="utf-8") as f:
+        after = json.load(f)
+    print(f"before: {before.get('meta', {}).get('commit')}  after: {after.get('meta', {}).get('commit')}")
+    rows = compare(before, after, args.threshold, args.min_ms)
+    for row in rows:
+        if args.all or row["regressed"] or abs(row["change"]) > args.threshold:
+            flag = "REGRESSED" if row["regressed"] else ""
+            print(f"{row['figure']:60s} {row['before']:10.3f} -> {row['after']:10.3f}  {row['change']:+7.1%}  {flag}")
+    regressions = sum(row["regressed"] for row in rows)
+    print(f"{len(rows)} figures compared, {regressions} regressions")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
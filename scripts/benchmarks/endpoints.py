@@ -0,0 +1,155 @@
+"""Per-endpoint latency through an in-process client, with and without the response cache.
+
+Requests are rendered from templates against a seeded sample of (user, week,
+day, status kind) picked from the dataset, so the same arguments replay the
+same URLs.  Each endpoint is timed once with the encoded-response cache
+disabled (handler, JSON encoding and compression on every request) and once
+warm (served from the cache).  ``--root`` benchmarks another workspace, e.g.
+one written by ``scripts.benchmarks.synthetic_cohort``.
+
+    python -m scripts.benchmarks.endpoints [--root /tmp/cohort] [--samples 50] [--json out.json]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from scripts.benchmarks.report import latency_summary, metadata, write_json
+from scripts.search_index import tokenize
+
+# name -> URL template; fields come from _contexts()
+ENDPOINTS: Dict[str, str] = {
+    "users": "/api/users",
+    "profiles": "/api/profiles",
+    "profile": "/api/{user}/profile",
+    "weeks": "/api/{user}/weeks",
+    "days": "/api/{user}/week/{week}/days",
+    "locations_week": "/api/{user}/week/{week}/locations",
+    "locations_day": "/api/{user}/week/{week}/locations?day={day}",
+    "locations_compact": "/api/{user}/week/{week}/locations?format=compact",
+    "locations_range": "/api/{user}/locations?bucket=6h",
+    "status_week": "/api/{user}/status/{kind}?week={week}",
+    "status_day": "/api/{user}/status/{kind}?week={week}&day={day}",
+    "status_range": "/api/{user}/status/{kind}?bucket=1D",
+    "bundle": "/api/{user}/week/{week}/bundle",
+    "bundle_compact": "/api/{user}/week/{week}/bundle?format=compact",
+    "emotions": "/api/{user}/emotions",
+    "emotions_fields": "/api/{user}/emotions?fields=emotion,lab_assessment",
+    "summary": "/api/{user}/week/{week}/summary",
+    "classes": "/api/{user}/classes",
+    "classes_week": "/api/{user}/week/{week}/classes",
+    "cohort_emotions": "/api/cohort/emotions",
+    "cohort_labs": "/api/cohort/labs",
+    "cohort_correlations": "/api/cohort/correlations",
+    "cohort_classes": "/api/cohort/classes",
+    "search": "/api/search?q={word}",
+    "search_phrase": "/api/search?q={phrase}",
+    "search_filtered": "/api/search?q={word}&weeks={week}&emotion=stress%3E50",
+}
+
+
+def _contexts(api_server: Any, samples: int, seed: int) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    dataset = api_server.DATASET
+    users = [u for u in dataset.users() if dataset.weeks(u)]
+    contexts = []
+    for _ in range(samples):
+        user = rng.choice(users)
+        week = rng.choice(dataset.weeks(user))
+        days = dataset.week_frame(user, week).days
+        kinds = dataset.status_kinds(user) or ["sleep"]
+        # search terms come from the sampled week's own narrative, so every query has hits
+        log = dataset.emotion_log(user)
+        entry = log.entry(week) if log is not None else None
+        words = tokenize((entry or {}).get("weekly_desc") or "") or ["week", "week"]
+        i = rng.randrange(max(1, len(words) - 1))
+        contexts.append({
+            "user": user,
+            "week": week,
+            "day": rng.choice(days) if days else "",
+            "kind": rng.choice(kinds),
+            "word": quote(words[i]),
+            "phrase": quote(f'"{" ".join(words[i:i + 2])}"'),
+        })
+    return contexts
+
+
+def _time(client: Any, urls: List[str]) -> Tuple[List[float], Dict[int, int]]:
+    samples: List[float] = []
+    statuses: Dict[int, int] = {}
+    for url in urls:
+        start = time.perf_counter()
+        response = client.get(url)
+        samples.append((time.perf_counter() - start) * 1000.0)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    return samples, statuses
+
+
+def run(root: Optional[str] = None, samples: int = 50, seed: int = 0, only: Optional[List[str]] = None) -> Dict[str, Any]:
+    if root:
+        os.environ["DATASET_ROOT"] = root
+    # imported late so DATASET_ROOT is seen when the module-level store is built
+    from fastapi.testclient import TestClient
+
+    from scripts import api_server
+
+    start = time.perf_counter()
+    api_server.DATASET.load()
+    load_s = time.perf_counter() - start
+    contexts = _contexts(api_server, samples, seed)
+    client = TestClient(api_server.create_app())
+    cache = api_server.RESPONSE_CACHE
+    cache_bytes = cache.max_bytes
+
+    endpoints: Dict[str, Any] = {}
+    for name, template in ENDPOINTS.items():
+        if only and name not in only:
+            continue
+        urls = [template.format(**ctx) for ctx in contexts]
+        # first request of each endpoint pays for lazy indexes and aggregates; keep it apart
+        cold_ms, _ = _time(client, urls[:1])
+        cache.max_bytes = 0
+        uncached, statuses = _time(client, urls)
+        cache.max_bytes = cache_bytes
+        _time(client, urls)
+        cached, _ = _time(client, urls)
+        endpoints[name] = {
+            "template": template,
+            "first_ms": round(cold_ms[0], 3),
+            "uncached": latency_summary(uncached),
+            "cached": latency_summary(cached),
+            "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        }
+    return {
+        "meta": metadata("endpoints", root=root or str(api_server.DATASET_ROOT), samples=samples, seed=seed),
+        "dataset": {"users": len(api_server.DATASET.users()), "load_s": round(load_s, 3)},
+        "endpoints": endpoints,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--root", help="workspace to serve (default: this repository)")
+    parser.add_argument("--samples", type=int, default=50, help="requests per endpoint and mode")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", help="comma-separated endpoint names")
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    args = parser.parse_args()
+
+    only = [n.strip() for n in args.only.split(",")] if args.only else None
+    report = run(args.root, args.samples, args.seed, only)
+    print(f"{report['dataset']['users']} users loaded in {report['dataset']['load_s']:.2f}s")
+    print(f"{'endpoint':20s} {'first':>8s} {'p50':>8s} {'p95':>8s} {'p99':>8s} {'cached p50':>11s}  ms")
+    for name, row in report["endpoints"].items():
+        u, c = row["uncached"], row["cached"]
+        print(f"{name:20s} {row['first_ms']:8.2f} {u['p50_ms']:8.2f} {u['p95_ms']:8.2f} {u['p99_ms']:8.2f} {c['p50_ms']:11.2f}"
+              + ("" if list(row["statuses"]) == ["200"] else f"  statuses {row['statuses']}"))
+    write_json(args.json_path, report)
+
+
+if __name__ == "__main__":
+    main()
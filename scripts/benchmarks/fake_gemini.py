@@ -0,0 +1,181 @@
+"""Local stand-in for ``generativelanguage.googleapis.com``.
+
+Answers ``POST /v1beta/models/{model}:generateContent`` with a canned reply
+after a configurable delay (and ``:streamGenerateContent?alt=sse`` with the
+same reply split into delayed chunks), and can inject 429/5xx failures, so
+``/api/chat`` can be exercised and load-tested offline:
+
+    python -m scripts.benchmarks.fake_gemini --port 8090 --latency 0.8
+    GEMINI_API_BASE=http://127.0.0.1:8090 python -m scripts.api_server
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import json
+import random
+import socket
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def _reply_text(body: Dict[str, Any]) -> str:
+    try:
+        prompt = body["contents"][-1]["parts"][0]["text"]
+    except (KeyError, IndexError, TypeError):
+        prompt = ""
+    return f"(stub reply) You asked: {prompt[:80]}"
+
+
+def generate_content_response(text: str) -> Dict[str, Any]:
+    return {
+        "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+        "usageMetadata": {"promptTokenCount": 0, "candidatesTokenCount": len(text.split())},
+    }
+
+
+def create_fake_gemini_app(
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    fail_first: int = 0,
+    fail_status: int = 503,
+    error_rate: float = 0.0,
+    retry_after: Optional[float] = None,
+    chunk_delay: float = 0.0,
+    chunk_words: int = 3,
+    context_cache: bool = True,
+) -> FastAPI:
+    """Build the stub.  ``fail_first`` requests answer ``fail_status``; after that a
+    random ``error_rate`` fraction answers 429.  Streamed replies send their first
+    chunk after ``latency`` and the rest ``chunk_delay`` apart.  With
+    ``context_cache=False`` cachedContents uploads are rejected with a 400, like
+    prompts below the model's minimum cacheable size."""
+    app = FastAPI(title="Fake Gemini API")
+    app.state.calls = 0
+    app.state.cancelled_streams = 0
+    # streams whose last chunk has been sent
+    app.state.finished_streams = 0
+    app.state.cached_contents = {}
+    app.state.cached_content_keys = {}
+    # every generate request body, newest last, so callers can inspect what was sent
+    app.state.requests = []
+
+    async def _sse_chunks(text: str) -> AsyncIterator[str]:
+        words = text.split(" ")
+        try:
+            for i in range(0, len(words), chunk_words):
+                if i:
+                    await asyncio.sleep(chunk_delay)
+                last = i + chunk_words >= len(words)
+                piece = " ".join(words[i:i + chunk_words]) + ("" if last else " ")
+                if last:
+                    app.state.finished_streams += 1
+                yield f"data: {json.dumps(generate_content_response(piece))}\r\n\r\n"
+        except asyncio.CancelledError:
+            app.state.cancelled_streams += 1
+            raise
+
+    def _failure(status: int) -> JSONResponse:
+        headers = {"Retry-After": str(retry_after)} if retry_after is not None else None
+        return JSONResponse({"error": {"code": status, "message": "stub failure"}}, status_code=status, headers=headers)
+
+    @app.post("/v1beta/cachedContents")
+    async def create_cached_content(request: Request) -> Any:
+        body = await request.json()
+        if not context_cache:
+            return JSONResponse(
+                {"error": {"code": 400, "message": "Cached content is too small"}}, status_code=400
+            )
+        name = f"cachedContents/fake-{len(app.state.cached_contents) + 1}"
+        app.state.cached_contents[name] = body
+        # like the real API, only the key that created a resource may use it
+        app.state.cached_content_keys[name] = request.headers.get("x-goog-api-key")
+        return {"name": name, "model": body.get("model"), "ttl": body.get("ttl")}
+
+    @app.post("/v1beta/models/{target}")
+    async def generate(target: str, request: Request) -> Any:
+        model, _, method = target.partition(":")
+        if method not in ("generateContent", "streamGenerateContent"):
+            raise HTTPException(status_code=404, detail=f"Unsupported method {method!r} for {model}")
+        app.state.calls += 1
+        body = await request.json()
+        app.state.requests.append(body)
+        if "cachedContent" in body:
+            if body["cachedContent"] not in app.state.cached_contents:
+                return JSONResponse({"error": {"code": 404, "message": "cached content not found"}}, status_code=404)
+            if app.state.cached_content_keys[body["cachedContent"]] != request.headers.get("x-goog-api-key"):
+                return JSONResponse({"error": {"code": 403, "message": "permission denied"}}, status_code=403)
+        await asyncio.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+        if app.state.calls <= fail_first:
+            return _failure(fail_status)
+        if error_rate and random.random() < error_rate:
+            return _failure(429)
+        text = _reply_text(body)
+        if method == "streamGenerateContent":
+            return StreamingResponse(_sse_chunks(text), media_type="text/event-stream")
+        # a blocking reply arrives only once the whole text has been "generated"
+        chunks = -(-len(text.split(" ")) // chunk_words)
+        await asyncio.sleep(chunk_delay * (chunks - 1))
+        return generate_content_response(text)
+
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def serve_in_thread(app: Any, port: Optional[int] = None) -> Iterator[str]:
+    """Run an ASGI app on a background uvicorn server; yields its base URL."""
+    port = port or free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"server on port {port} did not start")
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a local fake Gemini API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before each reply")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds added to latency")
+    parser.add_argument("--fail-first", type=int, default=0, help="number of initial requests that fail")
+    parser.add_argument("--fail-status", type=int, default=503)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=None, help="Retry-After seconds sent with failures")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="seconds between streamed chunks")
+    args = parser.parse_args()
+
+    app = create_fake_gemini_app(
+        latency=args.latency,
+        jitter=args.jitter,
+        fail_first=args.fail_first,
+        fail_status=args.fail_status,
+        error_rate=args.error_rate,
+        retry_after=args.retry_after,
+        chunk_delay=args.chunk_delay,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
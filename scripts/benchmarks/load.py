@@ -0,0 +1,305 @@
+"""Concurrent load driver replaying dashboard traffic against a running API server.
+
+Starts the API server (``uvicorn scripts.api_server:app``) and the fake Gemini
+upstream as subprocesses, unless ``--base-url`` points at a server that is
+already running.  ``--concurrency`` virtual users then loop over scenarios
+drawn from a traffic ``--mix`` for ``--duration`` seconds:
+
+- ``session``: what the dashboard fetches when a student is picked (profiles,
+  weeks, emotions, the compact semester stream, the current week's bundle)
+- ``playback``: stepping through consecutive weeks, which re-fetches weeks,
+  emotions and the week bundle each time
+- ``explore``: profile, range queries, class and cohort summaries
+- ``chat``: a streamed ``/api/chat`` reply through the fake upstream
+
+Latency p50/p95/p99 and requests per second are reported overall and per
+step.  With ``--revalidate`` each virtual user keeps ETags and sends
+``If-None-Match`` the way a browser cache does.
+
+    python -m scripts.benchmarks.load [--root /tmp/cohort] [--mix mixed] [--concurrency 32] [--duration 30] [--json out.json]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import os
+import random
+import subprocess
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from scripts.benchmarks.fake_gemini import free_port
+from scripts.benchmarks.report import REPO_ROOT, latency_summary, metadata, write_json
+
+# scenario -> relative weight
+MIXES: Dict[str, Dict[str, float]] = {
+    "playback": {"session": 1, "playback": 4},
+    "browse": {"session": 1, "explore": 3},
+    "chat": {"chat": 1},
+    "mixed": {"session": 2, "playback": 6, "explore": 2, "chat": 1},
+}
+CHAT_QUESTIONS = (
+    "How was your week?",
+    "Where did you spend most of your time?",
+    "How are your classes going?",
+    "Did you sleep well lately?",
+)
+
+Call = Callable[..., Awaitable[Any]]
+
+
+class Catalog:
+    """Users and their weeks, fetched once so scenarios can pick valid URLs."""
+
+    def __init__(self, users: List[str], weeks: Dict[str, List[int]]) -> None:
+        self.users = users
+        self.weeks = weeks
+
+    @classmethod
+    async def fetch(cls, client: httpx.AsyncClient, max_users: int) -> "Catalog":
+        users = (await client.get("/api/users")).json()["users"]
+        sample = users if len(users) <= max_users else random.Random(0).sample(users, max_users)
+        weeks = {}
+        for user in sample:
+            weeks[user] = (await client.get(f"/api/{user}/weeks")).json()["weeks"]
+        return cls([u for u in sample if weeks[u]], weeks)
+
+
+async def _session(call: Call, rng: random.Random, catalog: Catalog) -> None:
+    user = rng.choice(catalog.users)
+    await call("profiles", "/api/profiles")
+    weeks = await call("weeks", f"/api/{user}/weeks")
+    await call("emotions", f"/api/{user}/emotions")
+    await call("bundle_stream", f"/api/{user}/bundle/stream?format=compact", stream=True)
+    week = (weeks or {}).get("weeks", catalog.weeks[user])[0]
+    await call("bundle", f"/api/{user}/week/{week}/bundle?format=compact")
+
+
+async def _playback(call: Call, rng: random.Random, catalog: Catalog) -> None:
+    user = rng.choice(catalog.users)
+    weeks = catalog.weeks[user]
+    first = rng.randrange(len(weeks))
+    for week in weeks[first:first + 4]:
+        await call("weeks", f"/api/{user}/weeks")
+        await call("emotions", f"/api/{user}/emotions")
+        await call("bundle", f"/api/{user}/week/{week}/bundle?format=compact")
+
+
+async def _explore(call: Call, rng: random.Random, catalog: Catalog) -> None:
+    user = rng.choice(catalog.users)
+    week = rng.choice(catalog.weeks[user])
+    kind = rng.choice(("sleep", "social", "stress"))
+    await call("profile", f"/api/{user}/profile")
+    await call("emotions_fields", f"/api/{user}/emotions?fields=emotion,lab_assessment")
+    await call("status_range", f"/api/{user}/status/{kind}?bucket=1D")
+    await call("locations_range", f"/api/{user}/locations?bucket=6h&format=compact")
+    await call("summary", f"/api/{user}/week/{week}/summary")
+    await call("classes", f"/api/{user}/classes")
+    await call("cohort_emotions", "/api/cohort/emotions")
+
+
+async def _chat(call: Call, rng: random.Random, catalog: Catalog) -> None:
+    user = rng.choice(catalog.users)
+    body = {
+        # a unique message per request so the reply cache does not answer it
+        "message": f"{rng.choice(CHAT_QUESTIONS)} ({rng.getrandbits(32):08x})",
+        "apiKey": "stub-key",
+        "studentId": user,
+        "bigFive": {"openness": 70.0, "neuroticism": 40.0},
+        "weeklyDesc": "A busy week of classes and deadlines.",
+        "week": rng.choice(catalog.weeks[user]),
+        "stream": True,
+    }
+    await call("chat", "/api/chat", method="POST", json=body, stream=True)
+
+
+SCENARIOS: Dict[str, Callable[[Call, random.Random, Catalog], Awaitable[None]]] = {
+    "session": _session,
+    "playback": _playback,
+    "explore": _explore,
+    "chat": _chat,
+}
+
+
+class _Deadline(Exception):
+    pass
+
+
+async def _virtual_user(
+    client: httpx.AsyncClient,
+    catalog: Catalog,
+    mix: Dict[str, float],
+    deadline: float,
+    seed: int,
+    think: float,
+    revalidate: bool,
+    results: List[Tuple[str, int, float]],
+) -> None:
+    rng = random.Random(seed)
+    etags: Dict[str, Tuple[str, Any]] = {}
+
+    async def call(step: str, url: str, method: str = "GET", json: Any = None, stream: bool = False) -> Any:
+        if time.monotonic() >= deadline:
+            raise _Deadline
+        headers = {}
+        if revalidate and url in etags:
+            headers["If-None-Match"] = etags[url][0]
+        start = time.perf_counter()
+        data = None
+        try:
+            if stream:
+                async with client.stream(method, url, json=json, headers=headers) as response:
+                    async for _ in response.aiter_bytes():
+                        pass
+            else:
+                response = await client.request(method, url, json=json, headers=headers)
+                if response.status_code == 304:
+                    data = etags[url][1]
+                elif response.status_code == 200:
+                    data = response.json()
+                    if revalidate and "etag" in response.headers:
+                        etags[url] = (response.headers["etag"], data)
+            status = response.status_code
+        except httpx.HTTPError:
+            status = 0
+        results.append((step, status, (time.perf_counter() - start) * 1000.0))
+        if think:
+            await asyncio.sleep(rng.uniform(0, 2 * think))
+        return data
+
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    with contextlib.suppress(_Deadline):
+        while time.monotonic() < deadline:
+            await SCENARIOS[rng.choices(names, weights)[0]](call, rng, catalog)
+
+
+async def drive(
+    base_url: str,
+    mix: Dict[str, float],
+    concurrency: int,
+    duration: float,
+    seed: int = 0,
+    think: float = 0.0,
+    revalidate: bool = False,
+    max_users: int = 200,
+) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        catalog = await Catalog.fetch(client, max_users)
+        results: List[Tuple[str, int, float]] = []
+        start = time.perf_counter()
+        deadline = time.monotonic() + duration
+        await asyncio.gather(*(
+            _virtual_user(client, catalog, mix, deadline, seed + i, think, revalidate, results)
+            for i in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - start
+
+    steps: Dict[str, Dict[str, Any]] = {}
+    for step in sorted({r[0] for r in results}):
+        rows = [r for r in results if r[0] == step]
+        statuses: Dict[str, int] = {}
+        for _, status, _ in rows:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        steps[step] = {"latency": latency_summary([r[2] for r in rows]), "rps": round(len(rows) / elapsed, 2), "statuses": statuses}
+    errors = sum(1 for _, status, _ in results if status == 0 or status >= 400)
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "requests": len(results),
+        "errors": errors,
+        "rps": round(len(results) / elapsed, 2),
+        "latency": latency_summary([r[2] for r in results]),
+        "steps": steps,
+    }
+
+
+def _wait_ready(url: str, proc: subprocess.Popen, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{url} exited with status {proc.returncode}")
+        try:
+            httpx.get(url, timeout=2)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout:.0f}s")
+
+
+@contextlib.contextmanager
+def _process(args: List[str], env: Dict[str, str], ready_url: str, timeout: float) -> Iterator[None]:
+    # server output (request logging) would drown the report; errors still reach stderr
+    proc = subprocess.Popen([sys.executable, *args], cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL)
+    try:
+        _wait_ready(ready_url, proc, timeout)
+        yield
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+@contextlib.contextmanager
+def local_stack(root: Optional[str], gemini_latency: float, server_args: List[str], timeout: float) -> Iterator[str]:
+    """Run the fake Gemini upstream and the API server as subprocesses; yields the API base URL."""
+    gemini_port, api_port = free_port(), free_port()
+    env = {**os.environ, "PYTHONPATH": str(REPO_ROOT)}
+    gemini_args = ["-m", "scripts.benchmarks.fake_gemini", "--port", str(gemini_port), "--latency", str(gemini_latency)]
+    with _process(gemini_args, env, f"http://127.0.0.1:{gemini_port}/docs", timeout):
+        env["GEMINI_API_BASE"] = f"http://127.0.0.1:{gemini_port}"
+        if root:
+            env["DATASET_ROOT"] = root
+        api_args = ["-m", "uvicorn", "scripts.api_server:app", "--host", "127.0.0.1", "--port", str(api_port),
+                    "--log-level", "warning", *server_args]
+        with _process(api_args, env, f"http://127.0.0.1:{api_port}/api/users", timeout):
+            yield f"http://127.0.0.1:{api_port}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", help="drive an already running server instead of starting one")
+    parser.add_argument("--root", help="workspace for the started server (default: this repository)")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="mixed")
+    parser.add_argument("--concurrency", type=int, default=16, help="virtual users")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of load")
+    parser.add_argument("--think", type=float, default=0.0, help="mean seconds a virtual user waits between requests")
+    parser.add_argument("--revalidate", action="store_true", help="send If-None-Match like a browser cache")
+    parser.add_argument("--gemini-latency", type=float, default=0.5, help="fake upstream seconds to first chunk")
+    parser.add_argument("--startup-timeout", type=float, default=300.0, help="seconds to wait for the server to load")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    parser.add_argument("server_args", nargs="*", help="extra uvicorn arguments after --, e.g. -- --workers 4")
+    args = parser.parse_args()
+
+    def run(base_url: str) -> Dict[str, Any]:
+        return asyncio.run(drive(base_url, MIXES[args.mix], args.concurrency, args.duration,
+                                 args.seed, args.think, args.revalidate))
+
+    if args.base_url:
+        result = run(args.base_url)
+    else:
+        with local_stack(args.root, args.gemini_latency, args.server_args, args.startup_timeout) as base_url:
+            result = run(base_url)
+
+    params = {k: v for k, v in vars(args).items() if k != "json_path"}
+    report = {"meta": metadata("load", **params), **result}
+    lat = report["latency"]
+    print(f"{report['requests']} requests in {report['elapsed_s']:.1f}s: {report['rps']:.1f} req/s, "
+          f"{report['errors']} errors, p50 {lat.get('p50_ms', 0):.1f} / p95 {lat.get('p95_ms', 0):.1f} / "
+          f"p99 {lat.get('p99_ms', 0):.1f} ms")
+    for step, row in report["steps"].items():
+        s = row["latency"]
+        print(f"  {step:16s} n={s['n']:6d}  {row['rps']:8.1f} req/s  p50 {s['p50_ms']:8.1f}  p95 {s['p95_ms']:8.1f}"
+              f"  p99 {s['p99_ms']:8.1f} ms  {row['statuses']}")
+    write_json(args.json_path, report)
+
+
+if __name__ == "__main__":
+    main()
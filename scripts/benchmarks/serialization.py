@@ -0,0 +1,150 @@
+"""Per-request latency of the locations/status endpoints, before and after indexing.
+
+"before" re-implements the original handlers (``pd.read_csv`` + ``pd.to_datetime``
+on every call, boolean-mask day filter, ``iterrows``); "after" calls the current
+handlers, which pick rows from the preloaded store.  Both responses are rendered
+with FastAPI's ``JSONResponse`` and compared byte for byte.
+
+    python -m scripts.benchmarks.serialization [--repeat 3] [--json out.json]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+from fastapi.responses import JSONResponse
+
+from scripts import api_server
+from scripts.dataset_store import STATUS_KINDS, STATUS_VALUE_COLUMNS
+
+
+def legacy_locations(user_id: str, week: int, day: Optional[str] = None) -> Dict[str, Any]:
+    df = pd.read_csv(api_server.WORKSPACE_ROOT / user_id / f"data_per_week{week}.csv")
+    df["times"] = pd.to_datetime(df["times"])
+    if day:
+        df = df[df["times"].dt.date == datetime.fromisoformat(day).date()]
+    result = []
+    for _, row in df.iterrows():
+        result.append({
+            "time": row["times"].isoformat(),
+            "location": row.get("location", None),
+            "location_des": row.get("location_des", None),
+            "activity": row.get(" activity inference", row.get("activity inference", None)),
+        })
+    return {"records": result}
+
+
+def legacy_status(user_id: str, kind: str, week: Optional[int] = None, day: Optional[str] = None) -> Dict[str, Any]:
+    df = pd.read_csv(api_server.WORKSPACE_ROOT / user_id / f"{kind}_week_.csv")
+    df["resp_time"] = pd.to_datetime(df["resp_time"])
+    if week is not None and "week" in df.columns:
+        df = df[df["week"] == week]
+    if day:
+        df = df[df["resp_time"].dt.date == datetime.fromisoformat(day).date()]
+    value_key = STATUS_VALUE_COLUMNS[kind]
+    records = []
+    for _, row in df.iterrows():
+        records.append({
+            "time": row["resp_time"].isoformat(),
+            "value": None if value_key not in df.columns or pd.isna(row.get(value_key)) else row.get(value_key),
+            "week": int(row.get("week")) if "week" in df.columns and not pd.isna(row.get("week")) else None,
+            "day_offset": int(row.get("day_offset")) if "day_offset" in df.columns and not pd.isna(row.get("day_offset")) else None,
+        })
+    return {"records": records}
+
+
+def _render(payload: Dict[str, Any]) -> Optional[bytes]:
+    try:
+        return JSONResponse(payload).body
+    except ValueError:  # NaN leaked into the payload; the old handlers answered 500
+        return None
+
+
+def _cases() -> List[Tuple[str, Callable[[], Dict[str, Any]], Callable[[], Dict[str, Any]]]]:
+    cases = []
+    for user_id in api_server.DATASET.users():
+        for week in api_server.DATASET.weeks(user_id):
+            cases.append((
+                "locations/week",
+                lambda u=user_id, w=week: legacy_locations(u, w),
+                lambda u=user_id, w=week: api_server.get_locations(u, w),
+            ))
+            for day in api_server.DATASET.week_frame(user_id, week).days:
+                cases.append((
+                    "locations/day",
+                    lambda u=user_id, w=week, d=day: legacy_locations(u, w, d),
+                    lambda u=user_id, w=week, d=day: api_server.get_locations(u, w, d),
+                ))
+                for kind in STATUS_KINDS:
+                    if api_server.DATASET.status_frame(user_id, kind) is None:
+                        continue
+                    cases.append((
+                        "status/week+day",
+                        lambda u=user_id, k=kind, w=week, d=day: legacy_status(u, k, w, d),
+                        lambda u=user_id, k=kind, w=week, d=day: api_server.get_status_timeseries(u, k, w, d),
+                    ))
+    return cases
+
+
+def _time_ms(fn: Callable[[], Dict[str, Any]], repeat: int) -> Tuple[float, Optional[bytes]]:
+    best = float("inf")
+    body = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = _render(fn())
+        best = min(best, time.perf_counter() - start)
+    return best * 1000.0, body
+
+
+def run(repeat: int = 3) -> Dict[str, Any]:
+    api_server.DATASET.load()
+    timings: Dict[str, Dict[str, List[float]]] = {}
+    mismatches = 0
+    legacy_errors = 0
+    for name, legacy, current in _cases():
+        before_ms, before_body = _time_ms(legacy, repeat)
+        after_ms, after_body = _time_ms(current, repeat)
+        if before_body is None:
+            legacy_errors += 1
+        elif before_body != after_body:
+            mismatches += 1
+        bucket = timings.setdefault(name, {"before": [], "after": []})
+        bucket["before"].append(before_ms)
+        bucket["after"].append(after_ms)
+
+    report: Dict[str, Any] = {"mismatches": mismatches, "legacy_errors": legacy_errors, "endpoints": {}}
+    for name, bucket in timings.items():
+        before = statistics.median(bucket["before"])
+        after = statistics.median(bucket["after"])
+        report["endpoints"][name] = {
+            "requests": len(bucket["before"]),
+            "before_median_ms": round(before, 4),
+            "after_median_ms": round(after, 4),
+            "speedup": round(before / after, 1) if after else None,
+        }
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per request (best is kept)")
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = run(repeat=args.repeat)
+    for name, row in report["endpoints"].items():
+        print(f"{name:18s} n={row['requests']:5d}  before {row['before_median_ms']:8.3f} ms"
+              f"  after {row['after_median_ms']:7.3f} ms  x{row['speedup']}")
+    print(f"byte mismatches: {report['mismatches']}  (legacy 500s on NaN rows: {report['legacy_errors']})")
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
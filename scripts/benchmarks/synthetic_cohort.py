@@ -0,0 +1,203 @@
+"""Write a synthetic workspace shaped like the simulation output, at any scale.
+
+Creates ``uXX/data_per_weekN.csv`` (hourly locations), ``uXX/{sleep,social,stress}_week_.csv``,
+``uXX/class1_week_N.csv``, ``uXX_emotion_status_history.jsonl`` (with prose of
+realistic length) and ``result_pre_bigfive.csv`` under ``--out``.  Values are
+random but seeded, so two runs with the same arguments write identical files.
+Point the server at the result with ``DATASET_ROOT``:
+
+    python -m scripts.benchmarks.synthetic_cohort --out /tmp/cohort --students 5000 --weeks 20
+    DATASET_ROOT=/tmp/cohort DATASET_COMPILED_DIR= python -m scripts.api_server
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from scripts.classes import CAMPUS_BUILDINGS
+from scripts.cohort import EMOTION_DIMENSIONS
+from scripts.dataset_store import BIG_FIVE_COLUMNS, BIG_FIVE_CSV, EMOTION_LOG_SUFFIX
+
+START = pd.Timestamp("2013-03-24")
+HOURS_PER_WEEK = 7 * 24
+COURSES = ("Cs65", "CS 50", "Engs22", "Anth12 ", "Math 23", "German1", "Lat3", "Film51", "Econ24", "Bio6")
+LAB_TOPICS = ("Layouts & Views Basics", "UI Components & Event Handling", "Activities & Intents", "Data Storage")
+SENTENCES = (
+    "This week felt like a whirlwind, honestly.",
+    "My sleep has been all over the place, and I can feel it in the afternoons.",
+    "I spent most evenings in the library trying to keep up with the reading.",
+    "The boathouse has been my second home lately.",
+    "I skipped a lecture on Thursday and I already regret it.",
+    "Lunch at Collis with friends was the best part of most days.",
+    "The lab assignment took far longer than I expected.",
+    "I keep telling myself I will start the problem sets earlier.",
+    "Walking across the Green at night clears my head.",
+    "Office hours actually helped more than I thought they would.",
+    "I felt more social than usual, which surprised me.",
+    "Deadlines are starting to pile up again.",
+)
+SLEEP_RATE = ("", "1", "2", "3", "4")
+
+
+def _places() -> List[Dict[str, Any]]:
+    return [
+        {
+            "location": f"{name}, Hanover, NH 03755, United States of America",
+            "location_des": name,
+            "lat": lat,
+            "lon": lon,
+        }
+        for name, _place, lat, lon in CAMPUS_BUILDINGS
+    ]
+
+
+def _quote(text: str) -> str:
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _prose(rng: np.random.Generator, sentences: int) -> str:
+    picks = rng.integers(0, len(SENTENCES), sentences)
+    paragraphs = [" ".join(SENTENCES[i] for i in picks[j:j + 6]) for j in range(0, sentences, 6)]
+    return "\n\n".join(paragraphs)
+
+
+def _coordinate(rng: np.random.Generator, place: Dict[str, Any]) -> str:
+    lat = place["lat"] + rng.normal(0.0, 0.0003)
+    lon = place["lon"] + rng.normal(0.0, 0.0003)
+    return _quote(f"{lat:.8f},{lon:.8f}")
+
+
+def _write_week(path: Path, rng: np.random.Generator, week: int, places: List[Dict[str, Any]], home: int) -> None:
+    start = START + pd.Timedelta(days=7 * (week - 1))
+    times = pd.date_range(start, periods=HOURS_PER_WEEK, freq="h").strftime("%Y-%m-%d %H:%M:%S")
+    # mostly at home at night, wandering between buildings during the day
+    hours = np.arange(HOURS_PER_WEEK) % 24
+    spots = np.where((hours < 8) | (hours > 22), home, rng.integers(0, len(places), HOURS_PER_WEEK))
+    activity = rng.choice(4, HOURS_PER_WEEK, p=(0.8, 0.1, 0.05, 0.05))
+    lines = ["times, activity inference,location,location_des"]
+    for t, a, s in zip(times, activity, spots):
+        place = places[s]
+        lines.append(f"{t},{a},{_quote(place['location'])},{place['location_des']}")
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def _write_status(user_dir: Path, rng: np.random.Generator, weeks: int, places: List[Dict[str, Any]]) -> None:
+    headers = {
+        "sleep": "null,resp_time,hour,location,rate,social,day_offset,week",
+        "social": "null,resp_time,location,number,day_offset,week",
+        "stress": "level,location,resp_time,null,day_offset,week",
+    }
+    rows: Dict[str, List[str]] = {kind: [header] for kind, header in headers.items()}
+    for week in range(1, weeks + 1):
+        for kind, lines in rows.items():
+            for _ in range(int(rng.integers(2, 6))):
+                day = (week - 1) * 7 + int(rng.integers(0, 7))
+                t = (START + pd.Timedelta(days=day, hours=int(rng.integers(8, 23)))).strftime("%Y-%m-%d %H:%M:%S")
+                where = _coordinate(rng, places[int(rng.integers(0, len(places)))])
+                if kind == "sleep":
+                    lines.append(f",{t},{rng.integers(3, 11)},{where},{SLEEP_RATE[rng.integers(0, 5)]},,{day},{week}")
+                elif kind == "social":
+                    lines.append(f",{t},{where},{rng.integers(0, 6)},{day},{week}")
+                else:
+                    lines.append(f"{rng.integers(1, 6)}.0,{where},{t},,{day},{week}")
+    for kind, lines in rows.items():
+        (user_dir / f"{kind}_week_.csv").write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def _write_classes(path: Path, rng: np.random.Generator, week: int, courses: List[str], places: List[Dict[str, Any]]) -> None:
+    lines = ["course_id,due,experience,hours,location,resp_time,null,day_offset,week"]
+    for course in courses:
+        for _ in range(int(rng.integers(0, 3))):
+            day = (week - 1) * 7 + int(rng.integers(0, 7))
+            t = (START + pd.Timedelta(days=day, hours=int(rng.integers(9, 20)))).strftime("%Y-%m-%d %H:%M:%S")
+            where = _coordinate(rng, places[int(rng.integers(0, len(places)))])
+            lines.append(
+                f"{course},{rng.integers(1, 3)}.0,{rng.integers(1, 6)}.0,{rng.integers(1, 13)}.0,{where},{t},,{day},{week}"
+            )
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def _history(rng: np.random.Generator, weeks: int) -> str:
+    lines = []
+    for week in range(1, weeks + 1):
+        graded = week % 4 != 1
+        max_score = 11.66 if graded else 0
+        total = 10 if graded else 0
+        correct = int(rng.integers(0, total + 1)) if graded else 0
+        entry = {
+            "week": week,
+            "emotion": {d: int(rng.integers(0, 21)) * 5 for d in EMOTION_DIMENSIONS},
+            "lab_assessment": {
+                "score": round(max_score * correct / total, 2) if graded else 0,
+                "max_score": max_score,
+                "topic": LAB_TOPICS[week % len(LAB_TOPICS)] if graded else "No exam this week",
+                "correct_answers": correct,
+                "total_questions": total,
+                "week": week,
+            },
+            # roughly the 3-4 KB / 1-2 KB of the real narratives
+            "weekly_desc": _prose(rng, 48),
+            "judge_reasoning": _prose(rng, 20),
+        }
+        lines.append(json.dumps(entry))
+    return "\n".join(lines) + "\n"
+
+
+def generate(out: Path, students: int, weeks: int, seed: int = 0) -> Dict[str, Any]:
+    """Write the workspace; returns counts of what was written."""
+    rng = np.random.default_rng(seed)
+    places = _places()
+    out.mkdir(parents=True, exist_ok=True)
+    width = max(2, len(str(students - 1)))
+    user_ids = [f"u{i:0{width}d}" for i in range(students)]
+    files = 0
+    for user_id in user_ids:
+        user_dir = out / user_id
+        user_dir.mkdir(exist_ok=True)
+        home = int(rng.integers(0, len(places)))
+        courses = list(rng.choice(COURSES, 3, replace=False))
+        for week in range(1, weeks + 1):
+            _write_week(user_dir / f"data_per_week{week}.csv", rng, week, places, home)
+            _write_classes(user_dir / f"class1_week_{week}.csv", rng, week, courses, places)
+        _write_status(user_dir, rng, weeks, places)
+        (out / f"{user_id}{EMOTION_LOG_SUFFIX}").write_text(_history(rng, weeks), encoding="utf-8")
+        files += 2 * weeks + 4
+
+    traits = rng.uniform(20.0, 95.0, (students, len(BIG_FIVE_COLUMNS)))
+    big_five = pd.DataFrame(traits, columns=list(BIG_FIVE_COLUMNS.values()))
+    big_five.insert(0, "type", "pre")
+    big_five.insert(0, "uid", user_ids)
+    big_five.to_csv(out / BIG_FIVE_CSV, index=False)
+    return {"students": students, "weeks": weeks, "files": files + 1}
+
+
+def dir_size(root: Path) -> int:
+    total = 0
+    for dirpath, _dirs, names in os.walk(root):
+        total += sum(os.path.getsize(os.path.join(dirpath, n)) for n in names)
+    return total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--out", required=True, help="workspace directory to write (created if missing)")
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--weeks", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    summary = generate(Path(args.out), args.students, args.weeks, args.seed)
+    print(f"wrote {summary['files']} files for {summary['students']} students x {summary['weeks']} weeks "
+          f"({dir_size(Path(args.out)) / 1e6:.1f} MB) to {args.out} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
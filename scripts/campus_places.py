@@ -0,0 +1,62 @@
+"""Server-side copy of the campus place matching in ``web/src/geo.ts``.
+
+Keep ``CAMPUS_PLACES`` in sync with the ``CAMPUS_PLACES`` array there (keys,
+labels and aliases, in the same order: the first matching place wins).
+"""
+from __future__ import annotations
+
+import re
+from functools import lru_cache
+from typing import Any, List, Optional, Tuple
+
+# (key, label, aliases)
+CAMPUS_PLACES: List[Tuple[str, str, Tuple[str, ...]]] = [
+    ("study building", "Study building", ("study", "study building", "lsb", "silsby", "rocky")),
+    ("alumni gym", "alumni gym", ("alumni gym", "alumni")),
+    ("laboratory", "Laboratory", ("laboratory", "lab", "life sciences", "lsr")),
+    ("community club", "Community club", ("community", "community club")),
+    ("library", "Library", ("library", "baker", "berry")),
+    ("gym", "gym", ("gym", "fitness")),
+    ("medical center", "medical center", ("medical", "health", "medical center")),
+    ("main building", "Main building", ("main building", "parkhurst", "administration", "Admissions Office")),
+    ("art center", "art center", ("art center", "hood", "museum", "The Hopkins Center for the Arts")),
+    ("hall2", "hall 2", ("hall 2", "cummings", "engineering", "McNutt Hall")),
+    ("dormitory", "Dormitory", ("dorm", "dormitory", "residence")),
+    ("inn", "inn", ("inn", "hanover inn")),
+    ("cafeteria", "cafeteria", ("cafeteria", "collis", "snack")),
+    ("dining hall", "Dining hall", ("dining", "foco", "dining hall")),
+    ("hall1", "hall 1", ("hall 1", "math", "kst", "kst hall")),
+    ("green", "green", ("green", "dartmouth green", "park")),
+]
+
+_STRIP = re.compile(r"[^a-z0-9 ]+")
+
+
+def _normalize(text: str) -> str:
+    return _STRIP.sub("", text.lower()).strip()
+
+
+_NAMES = [(key, [_normalize(label)] + [_normalize(a) for a in aliases]) for key, label, aliases in CAMPUS_PLACES]
+
+
+@lru_cache(maxsize=8192)
+def match_place(text: str) -> Optional[str]:
+    """Key of the campus place ``text`` refers to: an exact label/alias match first,
+    then the first place with a label/alias contained in the text."""
+    t = _normalize(text)
+    for key, names in _NAMES:
+        if t in names:
+            return key
+    for key, names in _NAMES:
+        if any(name in t for name in names):
+            return key
+    return None
+
+
+def record_place(location_des: Any, activity: Any, location: Any) -> Optional[str]:
+    """Place of a location record, from the first non-empty of ``location_des``,
+    ``activity`` and ``location`` (the order the dashboard has always used)."""
+    for value in (location_des, activity, location):
+        if value:
+            return match_place(str(value))
+    return None
@@ -0,0 +1,268 @@
+"""Ask many students the same question at once: the jobs behind ``/api/chat/batch``.
+
+A job runs one upstream call per student as an asyncio task on the server's
+event loop, at most ``concurrency`` at a time, and keeps every result, so a
+client that disconnects can pick the stream up again by job id while the
+job keeps running.  Concurrency adapts to upstream rate limits: a 429 halves
+the job's limit and pauses new calls for the backoff the upstream asked for,
+and the limit creeps back up as calls succeed.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import os
+import secrets
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+
+class AdaptiveLimit:
+    """Additive-increase/multiplicative-decrease concurrency limit for one job.
+
+    ``throttle`` (on a 429) halves ``limit``, at most once per backoff, and holds
+    back new calls for the given delay; every ``limit`` successes raise it by
+    one, up to ``max_limit``.
+    """
+
+    __slots__ = ("limit", "max_limit", "active", "throttles", "_resume_at", "_successes", "_cond")
+
+    def __init__(self, max_limit: int) -> None:
+        self.max_limit = max(1, max_limit)
+        self.limit = self.max_limit
+        self.active = 0
+        self.throttles = 0
+        self._resume_at = 0.0
+        self._successes = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        async with self._cond:
+            while True:
+                pause = self._resume_at - time.monotonic()
+                if pause > 0:
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), pause)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                if self.active < self.limit:
+                    self.active += 1
+                    return
+                await self._cond.wait()
+
+    async def release(self, ok: bool) -> None:
+        async with self._cond:
+            self.active -= 1
+            if ok and self.limit < self.max_limit:
+                self._successes += 1
+                if self._successes >= self.limit:
+                    self._successes = 0
+                    self.limit += 1
+            self._cond.notify_all()
+
+    def throttle(self, delay: float) -> None:
+        # called from the retry hook, i.e. on the loop but outside the condition
+        now = time.monotonic()
+        if now >= self._resume_at:
+            # the calls already in flight when the first 429 came count as one signal
+            self.throttles += 1
+            self.limit = max(1, self.limit // 2)
+            self._successes = 0
+        self._resume_at = max(self._resume_at, now + delay)
+
+
+# (student id, limit) -> one result line; must not raise
+Answer = Callable[[str, AdaptiveLimit], Awaitable[Dict[str, Any]]]
+
+
+class BatchJob:
+    __slots__ = ("job_id", "week", "message", "students", "results", "replies", "errors",
+                 "created", "finished", "cancelled", "limit", "task", "_changed")
+
+    def __init__(self, job_id: str, week: int, message: str, students: List[str], concurrency: int) -> None:
+        self.job_id = job_id
+        self.week = week
+        self.message = message
+        self.students = students
+        # result lines in completion order; resuming clients pass how many they have
+        self.results: List[Dict[str, Any]] = []
+        self.replies = 0
+        self.errors = 0
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.cancelled = False
+        self.limit = AdaptiveLimit(concurrency)
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.finished is not None
+
+    def header(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "week": self.week,
+            "message": self.message,
+            "total": len(self.students),
+            "students": self.students,
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        end = self.finished if self.finished is not None else time.time()
+        return {
+            "job_id": self.job_id,
+            "done": self.done,
+            "cancelled": self.cancelled,
+            "total": len(self.students),
+            "completed": len(self.results),
+            "replies": self.replies,
+            "errors": self.errors,
+            "throttles": self.limit.throttles,
+            "concurrency": self.limit.limit,
+            "seconds": round(end - self.created, 3),
+        }
+
+    def _add(self, result: Dict[str, Any]) -> None:
+        self.results.append(result)
+        if "error" in result:
+            self.errors += 1
+        else:
+            self.replies += 1
+        self._wake()
+
+    def _wake(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def start(self, answer: Answer) -> None:
+        # in a fresh context: the job outlives the request that started it, and its
+        # concurrent calls must not be timed as that request's phases
+        loop = asyncio.get_running_loop()
+        self.task = contextvars.Context().run(loop.create_task, self._run(answer))
+
+    async def _run(self, answer: Answer) -> None:
+        async def one(index: int, student_id: str) -> None:
+            await self.limit.acquire()
+            ok = False
+            start = time.perf_counter()
+            try:
+                result = await answer(student_id, self.limit)
+                ok = "error" not in result
+            except Exception as e:
+                # one student's failure must not end the whole job
+                result = {"error": f"Chat error: {e}", "status": 500}
+            finally:
+                await self.limit.release(ok)
+            result = {"index": index, "student_id": student_id, **result,
+                      "ms": round((time.perf_counter() - start) * 1000, 1)}
+            self._add(result)
+
+        try:
+            await asyncio.gather(*(one(i, s) for i, s in enumerate(self.students)))
+        except asyncio.CancelledError:
+            self.cancelled = True
+        finally:
+            self.finished = time.time()
+            self._wake()
+
+    def cancel(self) -> None:
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+    async def follow(self, after: int = 0) -> AsyncIterator[Dict[str, Any]]:
+        """Result lines from position ``after`` on, waiting for new ones until the job ends."""
+        pos = max(0, after)
+        while True:
+            # taken before yielding, so results added meanwhile are not missed
+            changed = self._changed
+            while pos < len(self.results):
+                yield self.results[pos]
+                pos += 1
+            if self.done:
+                return
+            await changed.wait()
+
+
+class BatchJobs:
+    """The jobs of this process, kept ``ttl`` seconds after they finish.
+
+    At most ``max_jobs`` are held; the oldest finished ones make room, and a
+    new job is refused while every slot holds a running one.  Only used from
+    the event loop the jobs run on.
+    """
+
+    def __init__(self, concurrency: int = 8, max_jobs: int = 32, ttl: float = 3600.0, max_students: int = 5000) -> None:
+        self.concurrency = concurrency
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self.max_students = max_students
+        self._jobs: "OrderedDict[str, BatchJob]" = OrderedDict()
+        self.replies = 0
+        self.errors = 0
+        self.throttles = 0
+
+    @classmethod
+    def from_env(cls) -> "BatchJobs":
+        return cls(
+            concurrency=int(os.getenv("CHAT_BATCH_CONCURRENCY", "8")),
+            max_jobs=int(os.getenv("CHAT_BATCH_JOBS", "32")),
+            ttl=float(os.getenv("CHAT_BATCH_TTL", "3600")),
+            max_students=int(os.getenv("CHAT_BATCH_MAX_STUDENTS", "5000")),
+        )
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.ttl
+        for job_id, job in list(self._jobs.items()):
+            if job.finished is not None and (job.finished < cutoff or len(self._jobs) > self.max_jobs):
+                self._retire(job_id)
+
+    def _retire(self, job_id: str) -> None:
+        job = self._jobs.pop(job_id)
+        self.replies += job.replies
+        self.errors += job.errors
+        self.throttles += job.limit.throttles
+
+    def get(self, job_id: str) -> Optional[BatchJob]:
+        self._prune()
+        return self._jobs.get(job_id)
+
+    def create(
+        self,
+        week: int,
+        message: str,
+        students: List[str],
+        concurrency: Optional[int] = None,
+        job_id: Optional[str] = None,
+    ) -> Optional[BatchJob]:
+        """A new job, or ``None`` when every slot is taken by a running job."""
+        self._prune()
+        if len(self._jobs) >= self.max_jobs:
+            oldest = next((j for j, job in self._jobs.items() if job.done), None)
+            if oldest is None:
+                return None
+            self._retire(oldest)
+        limit = min(concurrency, self.concurrency) if concurrency else self.concurrency
+        job = BatchJob(job_id or secrets.token_urlsafe(12), week, message, students, limit)
+        self._jobs[job.job_id] = job
+        return job
+
+    def delete(self, job_id: str) -> bool:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return False
+        job.cancel()
+        self._retire(job_id)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        jobs = list(self._jobs.values())
+        return {
+            "jobs": len(jobs),
+            "running": sum(not job.done for job in jobs),
+            "replies": self.replies + sum(job.replies for job in jobs),
+            "errors": self.errors + sum(job.errors for job in jobs),
+            "throttles": self.throttles + sum(job.limit.throttles for job in jobs),
+        }
@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+LOG = logging.getLogger("api.chat_cache")
+
+
+def normalize_message(message: str) -> str:
+    return " ".join(message.split()).casefold()
+
+
+def chat_cache_key(
+    student_id: str,
+    week: int,
+    big_five: Mapping[str, float],
+    weekly_desc: str,
+    message: str,
+    generation_config: Mapping[str, Any],
+) -> str:
+    """Stable hash of everything that shapes a persona reply.
+
+    Trait names are case-folded and scores rounded to the one decimal the prompt
+    shows; the message is case-folded with whitespace collapsed.
+    """
+    payload = {
+        "student": student_id.strip().lower(),
+        "week": int(week),
+        "big_five": {k.strip().lower(): round(float(v), 1) for k, v in big_five.items()},
+        "weekly_desc": weekly_desc.strip(),
+        "message": normalize_message(message),
+        "generation_config": dict(generation_config),
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("replies", "created", "cursor")
+
+    def __init__(self, replies: List[str], created: float) -> None:
+        self.replies = replies
+        self.created = created
+        self.cursor = 0
+
+
+class ChatCache:
+    """LRU + TTL cache of chat replies, optionally persisted to SQLite.
+
+    With ``variants > 1`` a key keeps collecting fresh upstream replies until it
+    holds ``variants`` of them; after that lookups rotate through the stored
+    replies, so a high-temperature persona does not repeat itself verbatim.
+
+    ``get`` and ``put`` only touch memory, so they are safe to call from the
+    event loop.  Their SQLite writes are queued for a writer thread, which
+    keeps only the latest write per key and commits whatever piled up in one
+    transaction; ``flush`` writes the queue out before exit.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttl: float = 24 * 3600,
+        variants: int = 1,
+        path: Optional[Path] = None,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.variants = max(1, variants)
+        self.path = path
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._init_writer()
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.evictions = 0
+        self.expirations = 0
+        if path is not None and self.enabled:
+            self._open_db(path)
+
+    @classmethod
+    def from_env(cls) -> "ChatCache":
+        path = os.getenv("CHAT_CACHE_PATH")
+        return cls(
+            max_entries=int(os.getenv("CHAT_CACHE_SIZE", "512")),
+            ttl=float(os.getenv("CHAT_CACHE_TTL", str(24 * 3600))),
+            variants=int(os.getenv("CHAT_CACHE_VARIANTS", "1")),
+            path=Path(path) if path else None,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    # ---------------------------------------------------------------- sqlite
+    def _open_db(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chat_cache ("
+            "key TEXT PRIMARY KEY, replies TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        cutoff = time.time() - self.ttl
+        self._db.execute("DELETE FROM chat_cache WHERE created < ?", (cutoff,))
+        rows = self._db.execute(
+            "SELECT key, replies, created FROM chat_cache ORDER BY accessed DESC LIMIT ?",
+            (self.max_entries,),
+        ).fetchall()
+        # most recently used last, matching the OrderedDict's LRU order
+        for key, replies, created in reversed(rows):
+            self._entries[key] = _Entry(json.loads(replies), created)
+        self._db.commit()
+
+    def _init_writer(self) -> None:
+        # key -> row to write, or None to delete it; guarded by _lock
+        self._pending: Dict[str, Optional[Tuple[str, float, float]]] = {}
+        self._dirty = threading.Condition(self._lock)
+        # held while a batch is taken from _pending and written, so batches land in order;
+        # taken before _lock wherever both are needed
+        self._db_lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+
+    def reopen(self) -> None:
+        """Replace the SQLite connection, e.g. in a forked worker process, which must
+        not share its parent's connection (nor its locks or writer thread)."""
+        self._lock = threading.Lock()
+        self._init_writer()
+        if self._db is not None:
+            self._db = None
+            self._open_db(self.path)
+
+    def _persist(self, key: str, entry: _Entry) -> None:
+        if self._db is not None:
+            self._queue(key, (json.dumps(entry.replies, ensure_ascii=False), entry.created, time.time()))
+
+    def _forget(self, key: str) -> None:
+        if self._db is not None:
+            self._queue(key, None)
+
+    def _queue(self, key: str, row: Optional[Tuple[str, float, float]]) -> None:
+        # called with _lock held
+        self._pending[key] = row
+        if self._writer is None or not self._writer.is_alive():
+            self._writer = threading.Thread(target=self._write_loop, name="chat-cache-writer", daemon=True)
+            self._writer.start()
+        self._dirty.notify()
+
+    def _write_loop(self) -> None:
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._dirty.wait()
+            self.flush()
+
+    def flush(self) -> None:
+        """Write every queued change to SQLite and commit."""
+        with self._db_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if self._db is None or not pending:
+                return
+            try:
+                for key, row in pending.items():
+                    if row is None:
+                        self._db.execute("DELETE FROM chat_cache WHERE key = ?", (key,))
+                    else:
+                        self._db.execute(
+                            "INSERT OR REPLACE INTO chat_cache (key, replies, created, accessed) VALUES (?, ?, ?, ?)",
+                            (key, *row),
+                        )
+                self._db.commit()
+            except sqlite3.Error:
+                # the in-memory cache stays correct; only persistence of this batch is lost
+                LOG.exception("writing %d chat cache changes failed", len(pending))
+
+    # ---------------------------------------------------------------- access
+    def get(self, key: str) -> Optional[str]:
+        """A cached reply, or ``None`` when the caller should ask upstream (and ``put``)."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry.created > self.ttl:
+                del self._entries[key]
+                self._forget(key)
+                self.expirations += 1
+                entry = None
+            if entry is None or len(entry.replies) < self.variants:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            reply = entry.replies[entry.cursor % len(entry.replies)]
+            entry.cursor += 1
+            self.hits += 1
+            return reply
+
+    def put(self, key: str, reply: str) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry.created > self.ttl:
+                entry = self._entries[key] = _Entry([], time.time())
+            entry.replies.append(reply)
+            del entry.replies[:-self.variants]
+            self._entries.move_to_end(key)
+            self._persist(key, entry)
+            while len(self._entries) > self.max_entries:
+                old_key, _ = self._entries.popitem(last=False)
+                self._forget(old_key)
+                self.evictions += 1
+
+    def record_bypass(self) -> None:
+        with self._lock:
+            self.bypasses += 1
+
+    def clear(self) -> None:
+        with self._db_lock:
+            with self._lock:
+                self._entries.clear()
+                self._pending.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM chat_cache")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "persistent": self._db is not None,
+                "pending_writes": len(self._pending),
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "variants": self.variants,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypasses": self.bypasses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
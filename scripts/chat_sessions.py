@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# (role, text) with role "user" or "model", as in the Gemini ``contents`` list
+Turn = Tuple[str, str]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), good enough for budgeting."""
+    return len(text) // 4 + 1
+
+
+def api_key_hash(api_key: str) -> str:
+    """Short digest identifying an API key without storing it."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def trim_history(turns: List[Turn], budget: int) -> List[Turn]:
+    """Drop the oldest turns until the history fits ``budget`` estimated tokens.
+
+    Whole user/model exchanges are dropped together so the history never
+    starts with a dangling model reply.
+    """
+    total = sum(estimate_tokens(text) for _, text in turns)
+    start = 0
+    while total > budget and start < len(turns):
+        total -= estimate_tokens(turns[start][1])
+        start += 1
+        if start < len(turns) and turns[start][0] == "model":
+            total -= estimate_tokens(turns[start][1])
+            start += 1
+    return turns[start:]
+
+
+class ChatSession:
+    __slots__ = (
+        "session_id",
+        "student_id",
+        "week",
+        "system_prompt",
+        "turns",
+        "created",
+        "last_used",
+        "cached_content",
+        "cached_content_expires",
+        "cached_content_key",
+        "context_cache_unsupported",
+    )
+
+    def __init__(self, session_id: str, student_id: str, week: int, system_prompt: str) -> None:
+        self.session_id = session_id
+        self.student_id = student_id
+        self.week = week
+        self.system_prompt = system_prompt
+        self.turns: List[Turn] = []
+        self.created = time.time()
+        self.last_used = self.created
+        # name of the upstream cachedContents resource holding the persona prompt,
+        # and the api_key_hash of the key it was created under
+        self.cached_content: Optional[str] = None
+        self.cached_content_expires = 0.0
+        self.cached_content_key: Optional[str] = None
+        # set once the upstream refused to cache this persona prompt
+        self.context_cache_unsupported = False
+
+    def contents(self, message: str) -> List[Dict[str, Any]]:
+        """Gemini ``contents``: the kept history followed by the new user message."""
+        turns = self.turns + [("user", message)]
+        return [{"role": role, "parts": [{"text": text}]} for role, text in turns]
+
+    def add_exchange(self, message: str, reply: str, budget: int) -> None:
+        self.turns = trim_history(self.turns + [("user", message), ("model", reply)], budget)
+
+    def state(self) -> Dict[str, Any]:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    @classmethod
+    def restore(cls, state: Dict[str, Any]) -> "ChatSession":
+        session = cls(state["session_id"], state["student_id"], state["week"], state["system_prompt"])
+        for slot in cls.__slots__:
+            # sessions saved before a slot was added keep its default
+            if slot in state:
+                setattr(session, slot, state[slot])
+        session.turns = [tuple(turn) for turn in session.turns]
+        return session
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "student_id": self.student_id,
+            "week": self.week,
+            "turns": [{"role": role, "text": text} for role, text in self.turns],
+            "history_tokens": sum(estimate_tokens(text) for _, text in self.turns),
+            "context_cached": self.cached_content is not None,
+        }
+
+
+class SessionStore:
+    """Bounded session map with idle expiry (least recently used goes first).
+
+    Sessions live in memory unless ``path`` names a SQLite file; then every
+    process opening the same file sees the same sessions, so a conversation
+    survives its turns landing on different server workers.  Callers ``save``
+    a session after changing it.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 1000,
+        idle_ttl: float = 1800.0,
+        history_budget: int = 2000,
+        path: Optional[Path] = None,
+    ) -> None:
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.history_budget = history_budget
+        self.path = path
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_pid = 0
+
+    @classmethod
+    def from_env(cls) -> "SessionStore":
+        path = os.getenv("CHAT_SESSION_PATH")
+        return cls(
+            max_sessions=int(os.getenv("CHAT_SESSION_LIMIT", "1000")),
+            idle_ttl=float(os.getenv("CHAT_SESSION_IDLE_SECONDS", "1800")),
+            history_budget=int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "2000")),
+            path=Path(path) if path else None,
+        )
+
+    # ---------------------------------------------------------------- sqlite
+    def _conn(self) -> sqlite3.Connection:
+        # one connection per process: a connection inherited across fork must not be used
+        if self._db is None or self._db_pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(str(self.path), timeout=10.0, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS chat_sessions ("
+                "id TEXT PRIMARY KEY, state TEXT NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db, self._db_pid = db, os.getpid()
+        return self._db
+
+    def _write(self, db: sqlite3.Connection, session: ChatSession) -> None:
+        db.execute(
+            "INSERT OR REPLACE INTO chat_sessions (id, state, last_used) VALUES (?, ?, ?)",
+            (session.session_id, json.dumps(session.state(), ensure_ascii=False), session.last_used),
+        )
+
+    def save(self, session: ChatSession) -> None:
+        """Persist changes made to ``session`` (a no-op for the in-memory store)."""
+        if self.path is None:
+            return
+        with self._lock:
+            self._write(self._conn(), session)
+
+    def _expire(self, now: float) -> None:
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_used <= self.idle_ttl:
+                break
+            self._sessions.popitem(last=False)
+
+    def create(self, student_id: str, week: int, system_prompt: str) -> ChatSession:
+        with self._lock:
+            now = time.time()
+            if self.path is not None:
+                session = ChatSession(secrets.token_urlsafe(16), student_id, week, system_prompt)
+                db = self._conn()
+                db.execute("DELETE FROM chat_sessions WHERE last_used < ?", (now - self.idle_ttl,))
+                self._write(db, session)
+                db.execute(
+                    "DELETE FROM chat_sessions WHERE id IN "
+                    "(SELECT id FROM chat_sessions ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_sessions,),
+                )
+                return session
+            self._expire(now)
+            session = ChatSession(secrets.token_urlsafe(16), student_id, week, system_prompt)
+            self._sessions[session.session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return session
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        with self._lock:
+            now = time.time()
+            if self.path is not None:
+                db = self._conn()
+                row = db.execute(
+                    "SELECT state FROM chat_sessions WHERE id = ? AND last_used >= ?",
+                    (session_id, now - self.idle_ttl),
+                ).fetchone()
+                if row is None:
+                    return None
+                db.execute("UPDATE chat_sessions SET last_used = ? WHERE id = ?", (now, session_id))
+                session = ChatSession.restore(json.loads(row[0]))
+                session.last_used = now
+                return session
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_used = now
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            if self.path is not None:
+                return self._conn().execute("DELETE FROM chat_sessions WHERE id = ?", (session_id,)).rowcount > 0
+            return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self) -> int:
+        if self.path is not None:
+            with self._lock:
+                cutoff = time.time() - self.idle_ttl
+                return self._conn().execute(
+                    "SELECT COUNT(*) FROM chat_sessions WHERE last_used >= ?", (cutoff,)
+                ).fetchone()[0]
+        return len(self._sessions)
@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import threading
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from scripts.dataset_store import DatasetStore, FileStamp, FrameEntry
+from scripts.spatial import GridIndex, frame_coordinates
+
+# (name, campus place key from campus_places.CAMPUS_PLACES or None, lat, lon);
+# approximate building centroids, good to a few tens of meters
+CAMPUS_BUILDINGS: List[Tuple[str, Optional[str], float, float]] = [
+    ("Baker-Berry Library", "library", 43.7056, -72.2886),
+    ("Carson Hall", "library", 43.7052, -72.2877),
+    ("Dartmouth Green", "green", 43.7033, -72.2885),
+    ("Dartmouth Hall", None, 43.7039, -72.2872),
+    ("Reed Hall", None, 43.7044, -72.2867),
+    ("Parkhurst Hall", "main building", 43.7047, -72.2898),
+    ("McNutt Hall", "hall2", 43.7041, -72.2903),
+    ("Silsby Hall", "study building", 43.7052, -72.2907),
+    ("Rockefeller Center", "study building", 43.7047, -72.2915),
+    ("Kemeny Hall", "hall1", 43.7065, -72.2893),
+    ("Fairchild Physical Sciences Center", "laboratory", 43.7062, -72.2866),
+    ("Sudikoff Laboratory", "laboratory", 43.7070, -72.2866),
+    ("Life Sciences Center", "laboratory", 43.7089, -72.2843),
+    ("Cummings Hall", "hall2", 43.7046, -72.2951),
+    ("Hopkins Center for the Arts", "art center", 43.7018, -72.2884),
+    ("Hood Museum of Art", "art center", 43.7022, -72.2874),
+    ("Hanover Inn", "inn", 43.7021, -72.2893),
+    ("Collis Center", "cafeteria", 43.7027, -72.2907),
+    ("Class of 1953 Commons", "dining hall", 43.7024, -72.2913),
+    ("Alumni Gym", "alumni gym", 43.7025, -72.2843),
+    ("Dick's House", "medical center", 43.7071, -72.2826),
+    ("Choate Road Residences", "dormitory", 43.7082, -72.2873),
+    ("River Cluster", "dormitory", 43.7024, -72.2933),
+    ("East Wheelock Cluster", "dormitory", 43.7027, -72.2826),
+]
+# a fix farther than this from every building is off campus
+BUILDING_RADIUS_M = 200.0
+NUMERIC_FIELDS = ("due", "experience", "hours")
+# "no class today", "no class": a response saying the class did not meet
+NO_CLASS = "NOCLASS"
+
+
+def building_index() -> GridIndex:
+    return GridIndex([b[2] for b in CAMPUS_BUILDINGS], [b[3] for b in CAMPUS_BUILDINGS], BUILDING_RADIUS_M)
+
+
+def _numbers(values: List[Any]) -> np.ndarray:
+    return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+
+
+# raw columns of a class file that the response table is built from
+_SOURCE_COLUMNS = ("course_id", "location", "null", "day_offset") + NUMERIC_FIELDS
+
+
+def _responses_table(frames: List[Tuple[str, int, FrameEntry]], index: GridIndex) -> pd.DataFrame:
+    """One row per class response (a non-empty ``course_id``) of the given
+    ``(user_id, week, frame)``s, parsed and matched to buildings in one pass."""
+    columns: Dict[str, List[Any]] = {name: [] for name in _SOURCE_COLUMNS}
+    user_ids: List[str] = []
+    weeks: List[int] = []
+    times: List[Optional[str]] = []
+    ns: List[np.ndarray] = [np.empty(0, dtype=np.int64)]
+    for user_id, week, entry in frames:
+        length = len(entry.epoch_ns)
+        none = [None] * length
+        for name, values in columns.items():
+            values.extend(entry.columns.get(name, none))
+        user_ids.extend([user_id] * length)
+        weeks.extend([week] * length)
+        times.extend(entry.times or none)
+        ns.append(entry.epoch_ns)
+
+    raw = pd.Series(columns["course_id"], dtype=object)
+    raw = raw.where(raw.map(type) == str).str.strip()
+    rows = np.flatnonzero((raw.fillna("") != "").to_numpy())
+    raw = raw.iloc[rows]
+    # "CS 65", "Cs65 " and "cs65" are the same course
+    course = raw.str.replace(r"[^A-Za-z0-9]+", "", regex=True).str.upper()
+    course = course.where(~course.str.startswith(NO_CLASS))
+    lat, lon = frame_coordinates({name: columns[name] for name in ("location", "null")})
+    lat, lon = lat[rows], lon[rows]
+    building, distance = index.nearest(lat, lon)
+    table = pd.DataFrame({
+        "user_id": np.array(user_ids, dtype=object)[rows],
+        "week": np.array(weeks, dtype=np.int64)[rows],
+        "day_offset": _numbers(columns["day_offset"])[rows],
+        "ns": np.concatenate(ns)[rows],
+        "time": np.array(times, dtype=object)[rows],
+        "course_id": raw.to_numpy(dtype=object),
+        "course": course.to_numpy(dtype=object),
+        **{field: _numbers(columns[field])[rows] for field in NUMERIC_FIELDS},
+        "lat": lat,
+        "lon": lon,
+        "building": building,
+        "distance_m": distance,
+    })
+    return table.sort_values(["user_id", "week", "ns"], kind="stable", ignore_index=True)
+
+
+def _value(v: Any, digits: int = 4) -> Any:
+    if v is None:
+        return None
+    if isinstance(v, (float, np.floating)):
+        return None if np.isnan(v) else round(float(v), digits)
+    if isinstance(v, np.integer):
+        return int(v)
+    return v
+
+
+def _building_name(i: int) -> Optional[str]:
+    return CAMPUS_BUILDINGS[i][0] if i >= 0 else None
+
+
+def _building_place(i: int) -> Optional[str]:
+    return CAMPUS_BUILDINGS[i][1] if i >= 0 else None
+
+
+def _top_building(buildings: pd.Series) -> Optional[str]:
+    located = buildings[buildings >= 0]
+    return _building_name(int(located.mode().iloc[0])) if len(located) else None
+
+
+def _group_summary(table: pd.DataFrame, key: str) -> List[Dict[str, Any]]:
+    """Response count, student count and field means per ``key`` value, in sorted order."""
+    attended = table[table["course"].notna()]
+    if not len(attended):
+        return []
+    grouped = attended.groupby(key, sort=True)
+    stats = grouped.agg(
+        responses=("course", "size"),
+        students=("user_id", "nunique"),
+        hours_total=("hours", "sum"),
+        **{f"{field}_mean": (field, "mean") for field in NUMERIC_FIELDS},
+    )
+    top = grouped["building"].agg(_top_building)
+    return [
+        {**{name: _value(v) for name, v in row.items()}, "building": top[row[key]]}
+        for row in stats.reset_index().to_dict("records")
+    ]
+
+
+class ClassStats:
+    """Class survey responses (``class1_week_N.csv``) of every user, with the
+    nearest campus building of each response's location fix.
+
+    Each user's table is rebuilt only when one of their class files changed;
+    summaries are recomputed lazily when the dataset version moves.
+    """
+
+    def __init__(self, store: DatasetStore) -> None:
+        self.store = store
+        self.index = building_index()
+        self.version = -1
+        self._tables: Dict[str, Tuple[Tuple[Tuple[int, FileStamp], ...], pd.DataFrame]] = {}
+        self._results: Dict[Hashable, Any] = {}
+        self._lock = threading.Lock()
+
+    def refresh(self) -> None:
+        with self._lock:
+            users = self.store.users()
+            if self.store.version == self.version:
+                return
+            version = self.store.version
+            for user_id in list(self._tables):
+                if user_id not in users:
+                    del self._tables[user_id]
+            changed: Dict[str, Tuple[Tuple[int, FileStamp], ...]] = {}
+            frames: List[Tuple[str, int, FrameEntry]] = []
+            for user_id in users:
+                user_frames = self.store.class_frames(user_id)
+                stamps = tuple((week, user_frames[week].stamp) for week in sorted(user_frames))
+                cached = self._tables.get(user_id)
+                if cached is None or cached[0] != stamps:
+                    changed[user_id] = stamps
+                    frames.extend((user_id, week, user_frames[week]) for week in sorted(user_frames))
+            if changed:
+                table = _responses_table(frames, self.index)
+                by_user = dict(iter(table.groupby("user_id", sort=False)))
+                for user_id, stamps in changed.items():
+                    user_table = by_user.get(user_id, table.iloc[:0])
+                    self._tables[user_id] = (stamps, user_table.reset_index(drop=True))
+            self._results.clear()
+            self.version = version
+
+    def _cached(self, key: Hashable, compute) -> Any:
+        self.refresh()
+        result = self._results.get(key)
+        if result is None:
+            result = self._results[key] = compute()
+        return result
+
+    def table(self, user_id: str) -> Optional[pd.DataFrame]:
+        self.refresh()
+        cached = self._tables.get(user_id)
+        return cached[1] if cached is not None else None
+
+    def week_records(self, user_id: str, week: int) -> List[Dict[str, Any]]:
+        """Class responses of one week in time order."""
+        table = self.table(user_id)
+        if table is None:
+            return []
+        rows = table[table["week"] == week]
+        return [
+            {
+                "time": time,
+                "week": week,
+                "day_offset": None if np.isnan(day_offset) else int(day_offset),
+                "course_id": course_id,
+                # NaN for "no class" answers
+                "course": None if pd.isna(course) else course,
+                **{field: _value(v) for field, v in zip(NUMERIC_FIELDS, values)},
+                "lat": _value(lat, 8),
+                "lon": _value(lon, 8),
+                "building": _building_name(b),
+                "place": _building_place(b),
+                "distance_m": _value(d, 1),
+            }
+            for time, day_offset, course_id, course, *values, lat, lon, b, d in zip(
+                rows["time"], rows["day_offset"], rows["course_id"], rows["course"],
+                *(rows[field] for field in NUMERIC_FIELDS),
+                rows["lat"], rows["lon"], rows["building"].tolist(), rows["distance_m"],
+            )
+        ]
+
+    # ------------------------------------------------------------- aggregates
+    def user_summary(self, user_id: str) -> Dict[str, Any]:
+        """Attendance and workload per course and per week for one user."""
+        return self._cached(("user", user_id), lambda: self._summary([user_id]))
+
+    def cohort_summary(self) -> Dict[str, Any]:
+        """Attendance and workload per course, per week and per building across users."""
+        return self._cached("cohort", lambda: self._summary(sorted(self._tables)))
+
+    def _summary(self, user_ids: List[str]) -> Dict[str, Any]:
+        tables = [self._tables[u][1] for u in user_ids if u in self._tables]
+        table = pd.concat(tables, ignore_index=True) if tables else _responses_table([], self.index)
+        no_class = table[table["course"].isna()].groupby("week").size()
+        weeks = _group_summary(table, "week")
+        for row in weeks:
+            row["no_class"] = int(no_class.get(row["week"], 0))
+        courses = _group_summary(table, "course")
+        course_weeks = table[table["course"].notna()].groupby("course")["week"].unique()
+        for row in courses:
+            row["weeks"] = sorted(int(w) for w in course_weeks[row["course"]])
+
+        located = table[(table["building"] >= 0) & table["course"].notna()]
+        buildings = [
+            {
+                "building": _building_name(b),
+                "place": _building_place(b),
+                "responses": int(group.shape[0]),
+                "students": int(group["user_id"].nunique()),
+                "courses": sorted(group["course"].unique().tolist()),
+            }
+            for b, group in located.groupby("building", sort=True)
+        ]
+        with_fix = table["course"].notna() & table["lat"].notna()
+        return {
+            "users": len(tables),
+            "responses": int(table["course"].notna().sum()),
+            "no_class": int(table["course"].isna().sum()),
+            "off_campus": int((with_fix & (table["building"] < 0)).sum()),
+            "courses": courses,
+            "weeks": weeks,
+            "buildings": buildings,
+        }
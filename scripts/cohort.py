@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import threading
+import warnings
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from scripts.dataset_store import BIG_FIVE_COLUMNS, DatasetStore, FileStamp
+
+EMOTION_DIMENSIONS = ("stamina", "knowledge", "stress", "happy", "sleep", "social")
+LAB_FIELDS = ("score", "max_score", "correct_answers", "total_questions")
+# emotion dimensions followed by lab-assessment fields along the last axis
+DIMENSIONS = EMOTION_DIMENSIONS + tuple(f"lab_{f}" for f in LAB_FIELDS)
+TRAITS = tuple(BIG_FIVE_COLUMNS)
+DEFAULT_PERCENTILES = (10.0, 25.0, 50.0, 75.0, 90.0)
+# aggregates kept per dataset version; keys come from query parameters, so bound them
+MAX_CACHED_RESULTS = 64
+
+
+def _number(value: Any) -> float:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return np.nan
+
+
+def _user_rows(compact: Sequence[Dict[str, Any]]) -> Dict[int, np.ndarray]:
+    """week -> dimension vector for one user's emotion log (first entry per week wins)."""
+    rows: Dict[int, np.ndarray] = {}
+    for entry in compact:
+        week = entry.get("week")
+        if week is None or int(week) in rows:
+            continue
+        emotion = entry.get("emotion") or {}
+        lab = entry.get("lab_assessment") or {}
+        rows[int(week)] = np.array(
+            [_number(emotion.get(d)) for d in EMOTION_DIMENSIONS] + [_number(lab.get(f)) for f in LAB_FIELDS],
+            dtype=np.float64,
+        )
+    return rows
+
+
+def _nanpercentile(data: np.ndarray, percentiles: Sequence[float]) -> np.ndarray:
+    """Percentiles over the first (user) axis; NaN where no user has a value."""
+    if not data.shape[0]:
+        return np.full((len(percentiles),) + data.shape[1:], np.nan)
+    return np.nanpercentile(data, percentiles, axis=0)
+
+
+def _clean(values: np.ndarray, digits: int = 4) -> List[Optional[float]]:
+    return [None if np.isnan(v) else round(float(v), digits) for v in values]
+
+
+class CohortStats:
+    """Cohort-wide ``users x weeks x DIMENSIONS`` array built from every emotion log.
+
+    Each user's rows are re-extracted only when that user's log changed; the
+    stacked array and the aggregates derived from it are rebuilt lazily when
+    the dataset version moves.  Missing weeks and values are NaN.  The last
+    ``MAX_CACHED_RESULTS`` aggregates are cached, computed under the same lock
+    as ``refresh`` so none mixes arrays from two versions.
+    """
+
+    def __init__(self, store: DatasetStore) -> None:
+        self.store = store
+        self.version = -1
+        self.users: List[str] = []
+        self.weeks: List[int] = []
+        self.values = np.empty((0, 0, len(DIMENSIONS)))
+        self.traits = np.empty((0, len(TRAITS)))
+        self._rows: Dict[str, Tuple[Optional[FileStamp], Dict[int, np.ndarray]]] = {}
+        self._results: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def refresh(self) -> None:
+        with self._lock:
+            users = self.store.emotion_users()
+            if self.store.version == self.version:
+                return
+            version = self.store.version
+            for user_id in list(self._rows):
+                if user_id not in users:
+                    del self._rows[user_id]
+            for user_id in users:
+                log = self.store.emotion_log(user_id)
+                if log is None:
+                    continue
+                cached = self._rows.get(user_id)
+                if cached is None or cached[0] != log.stamp:
+                    self._rows[user_id] = (log.stamp, _user_rows(log.compact))
+
+            user_ids = sorted(self._rows)
+            weeks = sorted({w for _, rows in self._rows.values() for w in rows})
+            week_pos = {w: i for i, w in enumerate(weeks)}
+            values = np.full((len(user_ids), len(weeks), len(DIMENSIONS)), np.nan)
+            traits = np.full((len(user_ids), len(TRAITS)), np.nan)
+            for u, user_id in enumerate(user_ids):
+                for week, row in self._rows[user_id][1].items():
+                    values[u, week_pos[week]] = row
+                big_five = self.store.big_five(user_id)
+                if big_five is not None:
+                    traits[u] = [_number(big_five.get(t)) for t in TRAITS]
+
+            self.users, self.weeks, self.values, self.traits = user_ids, weeks, values, traits
+            self._results.clear()
+            self.version = version
+
+    def _cached(self, key: Hashable, compute) -> Any:
+        self.refresh()
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+                return result
+            result = self._results[key] = compute()
+            while len(self._results) > MAX_CACHED_RESULTS:
+                self._results.popitem(last=False)
+            return result
+
+    # ------------------------------------------------------------- aggregates
+    def emotion_summary(self, dimensions: Sequence[str], percentiles: Sequence[float]) -> Dict[str, Any]:
+        """Per-week count, mean, std and percentiles across users for each dimension."""
+        return self._cached(("emotions", tuple(dimensions), tuple(percentiles)),
+                            lambda: self._emotion_summary(dimensions, percentiles))
+
+    def _emotion_summary(self, dimensions: Sequence[str], percentiles: Sequence[float]) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        idx = [DIMENSIONS.index(d) for d in dimensions]
+        data = self.values[:, :, idx]  # users x weeks x dims
+        with warnings.catch_warnings():
+            # all-NaN weeks are expected and come out as null
+            warnings.simplefilter("ignore", RuntimeWarning)
+            counts = np.sum(~np.isnan(data), axis=0)
+            means = np.nanmean(data, axis=0)
+            stds = np.nanstd(data, axis=0)
+            pcts = _nanpercentile(data, percentiles)
+        for j, dim in enumerate(dimensions):
+            out[dim] = {
+                "n": counts[:, j].tolist(),
+                "mean": _clean(means[:, j]),
+                "std": _clean(stds[:, j]),
+                "percentiles": {f"{p:g}": _clean(pcts[k, :, j]) for k, p in enumerate(percentiles)},
+            }
+        return {"users": len(self.users), "weeks": self.weeks, "dimensions": out}
+
+    def lab_summary(self, percentiles: Sequence[float], bins: int) -> Dict[str, Any]:
+        """Distribution of lab scores (absolute and as a fraction of ``max_score``).
+
+        Only weeks with a graded lab (``max_score > 0``) count.
+        """
+        return self._cached(("labs", tuple(percentiles), bins), lambda: self._lab_summary(percentiles, bins))
+
+    def _lab_summary(self, percentiles: Sequence[float], bins: int) -> Dict[str, Any]:
+        score = self.values[:, :, DIMENSIONS.index("lab_score")]
+        max_score = self.values[:, :, DIMENSIONS.index("lab_max_score")]
+        graded = max_score > 0
+        score = np.where(graded, score, np.nan)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            ratio = np.where(graded, score / max_score, np.nan)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            per_week = {
+                name: {
+                    "mean": _clean(np.nanmean(arr, axis=0)),
+                    "percentiles": {f"{p:g}": _clean(row) for p, row in zip(percentiles, _nanpercentile(arr, percentiles))},
+                }
+                for name, arr in (("score", score), ("ratio", ratio))
+            }
+        flat = ratio[~np.isnan(ratio)]
+        counts, edges = np.histogram(np.clip(flat, 0.0, 1.0), bins=bins, range=(0.0, 1.0))
+        return {
+            "weeks": self.weeks,
+            "n": np.sum(graded, axis=0).tolist(),
+            **per_week,
+            "ratio_histogram": {"edges": _clean(edges), "counts": counts.tolist()},
+        }
+
+    def trait_correlations(self, dimensions: Sequence[str], week: Optional[int]) -> Dict[str, Any]:
+        """Pearson r between each Big Five trait and each dimension across users.
+
+        A dimension is taken from ``week`` when given, otherwise each user's mean
+        over the semester; users missing either value are left out pairwise.
+        """
+        return self._cached(("corr", tuple(dimensions), week), lambda: self._trait_correlations(dimensions, week))
+
+    def _trait_correlations(self, dimensions: Sequence[str], week: Optional[int]) -> Dict[str, Any]:
+        idx = [DIMENSIONS.index(d) for d in dimensions]
+        if week is None:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                ys = np.nanmean(self.values[:, :, idx], axis=1) if self.weeks else np.full((len(self.users), len(idx)), np.nan)
+        else:
+            ys = self.values[:, self.weeks.index(week), idx]
+        x = self.traits[:, :, None]  # users x traits x 1
+        y = ys[:, None, :]  # users x 1 x dims
+        valid = ~np.isnan(x) & ~np.isnan(y)  # users x traits x dims
+        n = valid.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            xm = np.where(valid, x, 0.0).sum(axis=0) / n
+            ym = np.where(valid, y, 0.0).sum(axis=0) / n
+            dx = np.where(valid, x - xm, 0.0)
+            dy = np.where(valid, y - ym, 0.0)
+            r = (dx * dy).sum(axis=0) / np.sqrt((dx * dx).sum(axis=0) * (dy * dy).sum(axis=0))
+        r = np.where(n >= 3, r, np.nan)
+        return {
+            "week": week,
+            "traits": list(TRAITS),
+            "dimensions": list(dimensions),
+            "r": [_clean(row) for row in r],
+            "n": n.tolist(),
+        }
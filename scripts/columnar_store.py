@@ -0,0 +1,272 @@
+"""Compiled columnar copy of the workspace CSVs, loaded with memory-mapped ``.npy`` files.
+
+Every ``uXX/data_per_weekN.csv``, ``uXX/{kind}_week_.csv`` and
+``uXX/class1_week_N.csv`` is parsed once and appended to one array per
+(column, dtype): timestamps as int64 nanoseconds since the epoch, numbers
+as-is and strings dictionary-encoded into int32 codes.  ``manifest.json`` records, per source file, its stamp
+and the row range it occupies, so the server maps the arrays in
+milliseconds and falls back to the CSV for any file whose stamp no longer
+matches.
+
+    python -m scripts.columnar_store build [--root .] [--out .compiled]
+    python -m scripts.columnar_store check   # exit status 1 when stale
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from scripts.dataset_store import (
+    CLASS_CSV_RE,
+    CLASS_TIME_COLUMNS,
+    STATUS_KINDS,
+    STATUS_TIME_COLUMNS,
+    WEEK_CSV_RE,
+    WEEK_TIME_COLUMNS,
+    FileStamp,
+    FrameColumns,
+    FrameEntry,
+    _file_stamp,
+    is_user_dir_name,
+    read_frame_columns,
+)
+
+COMPILED_FORMAT = 1
+MANIFEST = "manifest.json"
+DICTIONARY = "dictionary.json"
+DEFAULT_COMPILED_DIR = ".compiled"
+NULL_CODE = -1
+
+
+def source_files(root: Path) -> List[Tuple[str, List[str]]]:
+    """``(path relative to root, time column candidates)`` of every frame the API loads."""
+    found: List[Tuple[str, List[str]]] = []
+    with os.scandir(root) as it:
+        user_dirs = sorted(e.name for e in it if e.is_dir() and is_user_dir_name(e.name))
+    for user_id in user_dirs:
+        with os.scandir(root / user_id) as it:
+            names = sorted(e.name for e in it if e.is_file())
+        for name in names:
+            if WEEK_CSV_RE.match(name):
+                found.append((f"{user_id}/{name}", WEEK_TIME_COLUMNS))
+            elif any(name == f"{kind}_week_.csv" for kind in STATUS_KINDS):
+                found.append((f"{user_id}/{name}", STATUS_TIME_COLUMNS))
+            elif CLASS_CSV_RE.match(name):
+                found.append((f"{user_id}/{name}", CLASS_TIME_COLUMNS))
+    return found
+
+
+class _Unsupported(Exception):
+    """A column this format cannot reproduce exactly; the file stays CSV-only."""
+
+
+class _Builder:
+    def __init__(self) -> None:
+        self.arrays: Dict[str, List[np.ndarray]] = {}
+        self.lengths: Dict[str, int] = {}
+        self.strings: List[str] = []
+        self.codes: Dict[str, int] = {}
+
+    def _append(self, key: str, values: np.ndarray) -> Tuple[int, int]:
+        start = self.lengths.get(key, 0)
+        self.arrays.setdefault(key, []).append(values)
+        self.lengths[key] = start + len(values)
+        return start, start + len(values)
+
+    def _encode(self, series: pd.Series) -> np.ndarray:
+        codes = np.empty(len(series), dtype=np.int32)
+        for i, value in enumerate(series.tolist()):
+            if isinstance(value, str):
+                code = self.codes.get(value)
+                if code is None:
+                    code = self.codes[value] = len(self.strings)
+                    self.strings.append(value)
+                codes[i] = code
+            elif value is None or (isinstance(value, float) and np.isnan(value)):
+                codes[i] = NULL_CODE
+            else:
+                raise _Unsupported(f"non-string value {value!r}")
+        return codes
+
+    def add(self, time_col: Optional[str], frame: FrameColumns) -> List[Dict[str, Any]]:
+        # encode everything first so an unsupported column leaves no partial rows behind
+        encoded: List[Tuple[str, str, str, np.ndarray]] = []
+        for col, series in frame.items():
+            dtype = series.dtype
+            if col == time_col:
+                if getattr(dtype, "tz", None) is not None or dtype != np.dtype("datetime64[ns]"):
+                    raise _Unsupported(f"time column dtype {dtype}")
+                encoded.append((col, "time", "time.int64", series.to_numpy().view(np.int64)))
+            elif dtype == object:
+                encoded.append((col, "str", f"{col}.str", self._encode(series)))
+            elif dtype.kind in "biuf":
+                encoded.append((col, dtype.str, f"{col}.{dtype.str}", series.to_numpy()))
+            else:
+                raise _Unsupported(f"column {col!r} dtype {dtype}")
+        return [
+            {"name": col, "kind": kind, "array": key, "range": self._append(key, values)}
+            for col, kind, key, values in encoded
+        ]
+
+
+def compile_workspace(root: Path, out: Path) -> Dict[str, Any]:
+    """Write the compiled store for ``root`` to ``out`` (replacing it atomically)."""
+    builder = _Builder()
+    frames: Dict[str, Any] = {}
+    skipped: Dict[str, str] = {}
+    for rel, candidates in source_files(root):
+        path = root / rel
+        stamp = _file_stamp(path)
+        if stamp is None:
+            continue
+        try:
+            time_col, frame = read_frame_columns(path, candidates)
+            columns = builder.add(time_col, frame)
+        except (_Unsupported, ValueError, pd.errors.ParserError) as e:
+            skipped[rel] = str(e)
+            continue
+        length = len(next(iter(frame.values()))) if frame else 0
+        frames[rel] = {"stamp": list(stamp), "time_col": time_col, "rows": length, "columns": columns}
+
+    tmp = out.with_name(out.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    arrays = {}
+    for key, parts in builder.arrays.items():
+        filename = f"{len(arrays):03d}.npy"
+        np.save(tmp / filename, np.concatenate(parts))
+        arrays[key] = filename
+    with open(tmp / DICTIONARY, "w", encoding="utf-8") as f:
+        json.dump(builder.strings, f, ensure_ascii=False)
+    manifest = {
+        "format": COMPILED_FORMAT,
+        "built": time.time(),
+        "arrays": arrays,
+        "frames": frames,
+        "skipped": skipped,
+    }
+    with open(tmp / MANIFEST, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    # a running server keeps its mappings of the old files after they are unlinked
+    shutil.rmtree(out, ignore_errors=True)
+    os.replace(tmp, out)
+    return {"frames": len(frames), "arrays": len(arrays), "strings": len(builder.strings), "skipped": skipped}
+
+
+class CompiledStore:
+    """Read side of :func:`compile_workspace`: hands out frames backed by mmapped arrays."""
+
+    def __init__(self, directory: Path, manifest: Dict[str, Any]) -> None:
+        self.directory = directory
+        self.frames: Dict[str, Dict[str, Any]] = manifest["frames"]
+        self.built: float = manifest.get("built", 0.0)
+        self._array_files: Dict[str, str] = manifest["arrays"]
+        self._arrays: Dict[str, np.ndarray] = {}
+        self._dictionary: Optional[np.ndarray] = None
+
+    @classmethod
+    def open(cls, directory: Path) -> Optional["CompiledStore"]:
+        """The store at ``directory``, or ``None`` when it is missing or from another format."""
+        try:
+            with open(directory / MANIFEST, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get("format") != COMPILED_FORMAT:
+            return None
+        return cls(directory, manifest)
+
+    def _array(self, key: str) -> np.ndarray:
+        array = self._arrays.get(key)
+        if array is None:
+            array = self._arrays[key] = np.load(self.directory / self._array_files[key], mmap_mode="r")
+        return array
+
+    def _strings(self) -> np.ndarray:
+        if self._dictionary is None:
+            with open(self.directory / DICTIONARY, encoding="utf-8") as f:
+                strings = json.load(f)
+            # NULL_CODE (-1) indexes the trailing None
+            self._dictionary = np.array(strings + [None], dtype=object)
+        return self._dictionary
+
+    def _columns(self, meta: Dict[str, Any]) -> FrameColumns:
+        frame: FrameColumns = {}
+        for col in meta["columns"]:
+            start, end = col["range"]
+            values = self._array(col["array"])[start:end]
+            if col["kind"] == "time":
+                frame[col["name"]] = pd.Series(values.view("datetime64[ns]"))
+            elif col["kind"] == "str":
+                frame[col["name"]] = pd.Series(self._strings()[values], dtype=object)
+            else:
+                frame[col["name"]] = pd.Series(values)
+        return frame
+
+    def frame(self, root: Path, path: Path, stamp: FileStamp) -> Optional[FrameEntry]:
+        """A lazily built entry for ``path`` if the store holds it at this exact stamp."""
+        try:
+            rel = path.relative_to(root).as_posix()
+        except ValueError:
+            return None
+        meta = self.frames.get(rel)
+        if meta is None or tuple(meta["stamp"]) != tuple(stamp):
+            return None
+        return FrameEntry(path, stamp, meta["time_col"], lambda: self._columns(meta))
+
+    def stale_sources(self, root: Path) -> Dict[str, List[str]]:
+        """Source files added, changed or removed since the store was built."""
+        current = {rel: _file_stamp(root / rel) for rel, _ in source_files(root)}
+        return {
+            "added": sorted(rel for rel in current if rel not in self.frames),
+            "changed": sorted(
+                rel for rel, stamp in current.items()
+                if rel in self.frames and tuple(self.frames[rel]["stamp"]) != stamp
+            ),
+            "removed": sorted(rel for rel in self.frames if rel not in current),
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compile the workspace CSVs into a memory-mappable columnar store")
+    parser.add_argument("command", choices=("build", "check"))
+    parser.add_argument("--root", default=str(Path(__file__).resolve().parents[1]), help="workspace root")
+    parser.add_argument("--out", help=f"store directory (default: <root>/{DEFAULT_COMPILED_DIR})")
+    args = parser.parse_args()
+    root = Path(args.root).resolve()
+    out = Path(args.out) if args.out else root / DEFAULT_COMPILED_DIR
+
+    if args.command == "build":
+        start = time.perf_counter()
+        summary = compile_workspace(root, out)
+        print(f"compiled {summary['frames']} files into {summary['arrays']} arrays "
+              f"({summary['strings']} distinct strings) at {out} in {time.perf_counter() - start:.2f}s")
+        for rel, reason in summary["skipped"].items():
+            print(f"  kept as CSV: {rel} ({reason})")
+        return
+
+    store = CompiledStore.open(out)
+    if store is None:
+        print(f"no compiled store at {out}")
+        sys.exit(1)
+    stale = store.stale_sources(root)
+    for kind, paths in stale.items():
+        for rel in paths:
+            print(f"{kind:8s} {rel}")
+    if any(stale.values()):
+        print("compiled store is stale; run `python -m scripts.columnar_store build`")
+        sys.exit(1)
+    print("compiled store is up to date")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,722 @@
+from __future__ import annotations
+
+import functools
+import io
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from scripts.metrics import phase, timed
+
+WEEK_CSV_RE = re.compile(r"^data_per_week(\d+)\.csv$")
+CLASS_CSV_RE = re.compile(r"^class1_week_(\d+)\.csv$")
+STATUS_KINDS = ("sleep", "social", "stress")
+STATUS_VALUE_COLUMNS = {"sleep": "hour", "social": "number", "stress": "level"}
+WEEK_TIME_COLUMNS = ["times", "timestamp", "time", "resp_time"]
+STATUS_TIME_COLUMNS = ["resp_time", "times", "time"]
+CLASS_TIME_COLUMNS = ["resp_time"]
+INT_COLUMNS = ("week", "day_offset")
+EMOTION_LOG_SUFFIX = "_emotion_status_history.jsonl"
+BIG_FIVE_CSV = "result_pre_bigfive.csv"
+# profile key -> column of BIG_FIVE_CSV, in the order profiles list them
+BIG_FIVE_COLUMNS = {
+    "openness": "Openness",
+    "conscientiousness": "Conscientiousness",
+    "extraversion": "Extraversion",
+    "agreeableness": "Agreeableness",
+    "neuroticism": "Neuroticism",
+}
+# Long prose fields of an emotion entry; these stay on disk and are read by offset.
+NARRATIVE_FIELDS = ("weekly_desc", "judge_reasoning")
+
+# (st_mtime_ns, st_size) of a source file; a change in either triggers a reload
+FileStamp = Tuple[int, int]
+
+
+def is_user_dir_name(name: str) -> bool:
+    return name.startswith("u") and name[1:].isdigit()
+
+
+def _file_stamp(path: Path) -> Optional[FileStamp]:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _pick_time_col(df: pd.DataFrame, candidates: List[str]) -> Optional[str]:
+    for cand in candidates:
+        if cand in df.columns:
+            return cand
+    return None
+
+
+class RowIndex:
+    """Maps a partition key (a day, a week, ...) to the frame rows holding it.
+
+    Rows are grouped by key in first-seen order, keeping file order within a
+    group, so every key is a contiguous ``(start, end)`` range into ``order``.
+    """
+
+    __slots__ = ("order", "ranges")
+
+    def __init__(self, keys: Sequence[Optional[Hashable]]) -> None:
+        groups: Dict[Hashable, List[int]] = {}
+        for pos, key in enumerate(keys):
+            if key is not None:
+                groups.setdefault(key, []).append(pos)
+        self.order: List[int] = []
+        self.ranges: Dict[Hashable, Tuple[int, int]] = {}
+        for key, rows in groups.items():
+            self.ranges[key] = (len(self.order), len(self.order) + len(rows))
+            self.order.extend(rows)
+
+    def keys(self) -> List[Hashable]:
+        return list(self.ranges)
+
+    def rows(self, key: Hashable) -> List[int]:
+        span = self.ranges.get(key)
+        if span is None:
+            return []
+        return self.order[span[0]:span[1]]
+
+
+NAT_NS = np.iinfo(np.int64).min
+
+
+class TimeIndex:
+    """Row positions sorted by timestamp, for binary-searched ``[start, end)`` ranges.
+
+    Rows without a timestamp are left out; equal timestamps keep file order.
+    """
+
+    __slots__ = ("ns", "rows")
+
+    def __init__(self, ns: np.ndarray) -> None:
+        order = np.argsort(ns, kind="stable")
+        order = order[ns[order] != NAT_NS]
+        self.ns = ns[order]
+        self.rows = order
+
+    def between(self, start: Optional[int], end: Optional[int]) -> Tuple[int, int]:
+        """``(lo, hi)`` bounds into ``ns``/``rows`` for ``start <= t < end`` (either may be open)."""
+        lo = int(np.searchsorted(self.ns, start, side="left")) if start is not None else 0
+        hi = int(np.searchsorted(self.ns, end, side="left")) if end is not None else len(self.ns)
+        return lo, max(lo, hi)
+
+
+def _epoch_ns(series: pd.Series) -> np.ndarray:
+    if series.dt.tz is not None:
+        series = series.dt.tz_convert(None)
+    return np.asarray(series.values).view(np.int64)
+
+
+def _nullable_list(series: pd.Series) -> List[Any]:
+    """Column values as plain Python objects with NaN/NaT turned into ``None``."""
+    if series.notna().all():
+        return series.tolist()
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def _int_list(series: pd.Series) -> List[Optional[int]]:
+    if pd.api.types.is_integer_dtype(series):
+        return series.tolist()
+    return [None if v is None else int(v) for v in _nullable_list(series)]
+
+
+def _iso_list(series: pd.Series) -> List[Optional[str]]:
+    """``Timestamp.isoformat()`` for a whole datetime column at once."""
+    values = series.values
+    if series.dt.tz is None and series.notna().all() and not (values.astype("int64") % 1_000_000_000).any():
+        return np.datetime_as_string(values, unit="s").tolist()
+    return [None if pd.isna(t) else t.isoformat() for t in series]
+
+
+def _day_keys(series: pd.Series) -> List[Optional[str]]:
+    if series.dt.tz is not None:
+        series = series.dt.tz_localize(None)
+    days = np.datetime_as_string(series.values, unit="D").tolist()
+    return [None if isna else day for day, isna in zip(days, series.isna().tolist())]
+
+
+# column name -> values, in file order; the time column (if any) already holds datetimes
+FrameColumns = Dict[str, pd.Series]
+
+
+class FrameEntry:
+    """A source CSV held in memory together with the stamp it was read from.
+
+    Keeps JSON-ready column lists (``times`` as ISO strings, ``columns`` with
+    NaN already mapped to ``None`` and ``week``/``day_offset`` cast to int) and
+    row indexes by day, week and (week, day), so requests only pick rows
+    instead of filtering and converting a frame.  These are derived from
+    ``source`` on first access; a frame mapped from the compiled store costs
+    nothing until a request needs it.
+    """
+
+    __slots__ = (
+        "path", "stamp", "time_col", "source",
+        "times", "epoch_ns", "time_index", "columns", "days", "by_day", "by_week", "by_week_day",
+    )
+
+    _DERIVED = frozenset(("times", "epoch_ns", "time_index", "columns", "days", "by_day", "by_week", "by_week_day"))
+
+    def __init__(
+        self,
+        path: Path,
+        stamp: FileStamp,
+        time_col: Optional[str],
+        source: Callable[[], FrameColumns],
+    ) -> None:
+        self.path = path
+        self.stamp = stamp
+        self.time_col = time_col
+        self.source = source
+
+    def __getattr__(self, name: str) -> Any:
+        # only reached while a derived slot is still unset
+        if name not in FrameEntry._DERIVED:
+            raise AttributeError(name)
+        self.build()
+        return object.__getattribute__(self, name)
+
+    @property
+    def built(self) -> bool:
+        try:
+            object.__getattribute__(self, "columns")
+        except AttributeError:
+            return False
+        return True
+
+    def build(self) -> None:
+        with phase("read"):
+            frame = self.source()
+        with phase("parse"):
+            self._derive(frame)
+
+    def _derive(self, frame: FrameColumns) -> None:
+        time_col = self.time_col
+        length = len(next(iter(frame.values()))) if frame else 0
+        columns: Dict[str, List[Any]] = {}
+        for col, series in frame.items():
+            if col == time_col:
+                continue
+            columns[col] = _int_list(series) if col in INT_COLUMNS else _nullable_list(series)
+
+        if time_col is not None:
+            times = _iso_list(frame[time_col])
+            days = _day_keys(frame[time_col])
+            epoch_ns = _epoch_ns(frame[time_col])
+        else:
+            times = []
+            days = [None] * length
+            epoch_ns = np.full(length, NAT_NS, dtype=np.int64)
+        weeks = columns.get("week", [None] * length)
+        by_day = RowIndex(days)
+        self.by_week = RowIndex(weeks)
+        self.by_week_day = RowIndex([
+            None if w is None or d is None else (w, d) for w, d in zip(weeks, days)
+        ])
+        self.days = sorted(by_day.keys())
+        self.by_day = by_day
+        self.epoch_ns = epoch_ns
+        self.time_index = TimeIndex(epoch_ns)
+        self.times = times
+        self.columns = columns
+
+
+def read_frame_columns(path: Path, time_candidates: List[str]) -> Tuple[Optional[str], FrameColumns]:
+    """Parse one CSV the way the API serves it: ``(time column, columns)``."""
+    with phase("read"):
+        data = path.read_bytes()
+    with phase("parse"):
+        df = pd.read_csv(io.BytesIO(data))
+        time_col = _pick_time_col(df, time_candidates)
+        if time_col is not None:
+            df[time_col] = pd.to_datetime(df[time_col])
+    return time_col, {col: df[col] for col in df.columns}
+
+
+def _load_frame(path: Path, stamp: FileStamp, time_candidates: List[str]) -> FrameEntry:
+    time_col, frame = read_frame_columns(path, time_candidates)
+    entry = FrameEntry(path, stamp, time_col, lambda: frame)
+    entry.build()
+    return entry
+
+
+class EmotionLog:
+    """Byte-offset index over one ``uXX_emotion_status_history.jsonl``.
+
+    ``spans`` holds the ``(offset, length)`` of every entry in file order and
+    ``week_pos`` maps a week to its first entry, so one week is a single seek
+    and read.  Everything except the narrative fields is also kept parsed in
+    ``compact`` for projections that do not need the prose.
+
+    The simulator appends one line per week, so a file that grew with the bytes
+    just before ``end`` unchanged is only read from ``end`` on; any other change
+    re-reads the whole file.  ``on_change`` receives the weeks that were added,
+    changed or removed (possibly none after a rewrite that kept every entry).
+    """
+
+    __slots__ = ("path", "stamp", "spans", "compact", "week_pos", "end", "tail", "on_change", "_lock")
+
+    # bytes before ``end`` compared to tell an append from a rewrite
+    TAIL_BYTES = 64
+
+    def __init__(self, path: Path, on_change: Optional[Callable[[List[int]], None]] = None) -> None:
+        self.path = path
+        self.on_change = on_change
+        self.stamp: Optional[FileStamp] = None
+        self.spans: List[Tuple[int, int]] = []
+        self.compact: List[Dict[str, Any]] = []
+        self.week_pos: Dict[int, int] = {}
+        # offset just past the last indexed line, and the bytes leading up to it
+        self.end = 0
+        self.tail = b""
+        self._lock = threading.Lock()
+
+    def index(self) -> None:
+        with open(self.path, "rb") as f:
+            self._index_file(f)
+
+    def _index_file(self, f) -> None:
+        st = os.fstat(f.fileno())
+        with phase("read"):
+            data = f.read()
+        with phase("parse"):
+            self.spans, self.compact, self.week_pos = [], [], {}
+            self.end, self.tail = 0, b""
+            self._index_data(data, 0)
+        self.stamp = (st.st_mtime_ns, st.st_size)
+
+    def _index_data(self, data: bytes, base: int) -> List[int]:
+        """Index the lines of ``data``, read from offset ``base``, after the ones
+        already held; returns the weeks of the new entries."""
+        spans, compact, week_pos = self.spans, self.compact, self.week_pos
+        weeks: List[int] = []
+        offset = end = base
+        for line in data.splitlines(keepends=True):
+            start = offset
+            offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                if line.endswith((b"\n", b"\r")):
+                    raise
+                # the last line is still being written; the next refresh reads it again
+                break
+            spans.append((start, len(line)))
+            compact.append({k: v for k, v in entry.items() if k not in NARRATIVE_FIELDS})
+            week = entry.get("week")
+            if week is not None:
+                week_pos.setdefault(int(week), len(spans) - 1)
+                if int(week) not in weeks:
+                    weeks.append(int(week))
+            end = offset
+        if end > self.end:
+            self.tail = (self.tail + data[max(0, end - base - self.TAIL_BYTES):end - base])[-self.TAIL_BYTES:]
+            self.end = end
+        return weeks
+
+    def _appended(self, f, size: int) -> bool:
+        """Whether the file only grew since it was indexed."""
+        if self.stamp is None or size <= self.stamp[1] or size < self.end:
+            return False
+        f.seek(self.end - len(self.tail))
+        return f.read(len(self.tail)) == self.tail
+
+    def refresh(self) -> Optional[List[int]]:
+        """Catch up with the file on disk; see ``_refresh``."""
+        try:
+            with open(self.path, "rb") as f:
+                return self._refresh(f)
+        except FileNotFoundError:
+            # removed; the next dataset scan drops this log
+            return None
+
+    def _refresh(self, f) -> Optional[List[int]]:
+        """Index whatever changed since the last read; returns the weeks that
+        changed, or ``None`` if the entries did not."""
+        st = os.fstat(f.fileno())
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp == self.stamp:
+            return None
+        with self._lock:
+            if stamp == self.stamp:
+                return None
+            if self._appended(f, st.st_size):
+                count = len(self.spans)
+                f.seek(self.end)
+                with phase("read"):
+                    data = f.read()
+                with phase("parse"):
+                    weeks = self._index_data(data, self.end)
+                self.stamp = stamp
+                if len(self.spans) == count:
+                    # only part of a line so far
+                    return None
+            else:
+                before = self._week_states()
+                f.seek(0)
+                self._index_file(f)
+                after = self._week_states()
+                weeks = sorted(w for w in before.keys() | after.keys() if before.get(w) != after.get(w))
+        if self.on_change is not None:
+            self.on_change(weeks)
+        return weeks
+
+    def _week_states(self) -> Dict[int, Tuple[Dict[str, Any], int]]:
+        # narrative fields are only compared by the length of their line
+        return {week: (self.compact[pos], self.spans[pos][1]) for week, pos in self.week_pos.items()}
+
+    def weeks(self) -> List[int]:
+        return sorted(self.week_pos)
+
+    def entry(self, week: int) -> Optional[Dict[str, Any]]:
+        """The full entry for ``week`` (first one in the file), read with one seek."""
+        with open(self.path, "rb") as f:
+            # the file may have grown or been rewritten since the last scan
+            self._refresh(f)
+            pos = self.week_pos.get(week)
+            if pos is None:
+                return None
+            offset, length = self.spans[pos]
+            with phase("read"):
+                f.seek(offset)
+                data = f.read(length)
+        with phase("parse"):
+            return json.loads(data)
+
+    def entries(self) -> List[Dict[str, Any]]:
+        with open(self.path, "rb") as f:
+            self._refresh(f)
+            # taken before the read, so every span is within ``data`` even if lines are appended meanwhile
+            spans = list(self.spans)
+            with phase("read"):
+                f.seek(0)
+                data = f.read()
+        with phase("parse"):
+            return [json.loads(data[offset:offset + length]) for offset, length in spans]
+
+
+def _load_big_five(path: Path) -> Dict[str, Dict[str, float]]:
+    """uid -> Big Five scores; the first row wins if a uid repeats."""
+    df = pd.read_csv(path)
+    scores: Dict[str, Dict[str, float]] = {}
+    columns = [df[col].tolist() for col in BIG_FIVE_COLUMNS.values()]
+    for pos, uid in enumerate(df["uid"].tolist()):
+        if uid not in scores:
+            scores[uid] = {key: col[pos] for key, col in zip(BIG_FIVE_COLUMNS, columns)}
+    return scores
+
+
+class Timeline:
+    """Several frames merged into one time-sorted index (e.g. all of a user's weeks).
+
+    Positions in ``index.rows`` address the concatenated frames; ``locate`` maps
+    them back to ``(frame, rows)`` runs.
+    """
+
+    __slots__ = ("frames", "offsets", "index")
+
+    def __init__(self, frames: List[FrameEntry]) -> None:
+        self.frames = frames
+        self.offsets = np.cumsum([0] + [len(f.epoch_ns) for f in frames])
+        ns = np.concatenate([f.epoch_ns for f in frames]) if frames else np.empty(0, dtype=np.int64)
+        self.index = TimeIndex(ns)
+
+    def locate(self, positions: np.ndarray) -> List[Tuple[FrameEntry, List[int]]]:
+        frame_ids = np.searchsorted(self.offsets, positions, side="right") - 1
+        runs: List[Tuple[FrameEntry, List[int]]] = []
+        if not len(positions):
+            return runs
+        breaks = np.flatnonzero(np.r_[True, frame_ids[1:] != frame_ids[:-1], True])
+        for lo, hi in zip(breaks[:-1], breaks[1:]):
+            f = int(frame_ids[lo])
+            runs.append((self.frames[f], (positions[lo:hi] - self.offsets[f]).tolist()))
+        return runs
+
+
+class UserData:
+    __slots__ = ("weeks", "status", "classes", "timeline")
+
+    def __init__(self) -> None:
+        self.weeks: Dict[int, FrameEntry] = {}
+        self.status: Dict[str, FrameEntry] = {}
+        # class1_week_N.csv survey responses by week
+        self.classes: Dict[int, FrameEntry] = {}
+        # built on demand from ``weeks``; reset whenever a week file changes
+        self.timeline: Optional[Timeline] = None
+
+
+def _event(type: str, user_id: str, **fields: Any) -> Dict[str, Any]:
+    """A change notice for ``DatasetStore`` listeners.
+
+    ``type`` is ``user``, ``week`` (``data_per_weekN.csv``), ``status``
+    (``{kind}_week_.csv``), ``classes`` (``class1_week_N.csv``) or ``emotions``
+    (the weeks added to or changed in the emotion log); ``change`` is
+    ``added``, ``changed`` or ``removed``.
+    """
+    fields.setdefault("change", "changed")
+    return {"type": type, "user": user_id, **fields}
+
+
+class DatasetStore:
+    """In-memory copy of every ``uXX/data_per_weekN.csv``, ``uXX/{kind}_week_.csv`` and
+    ``uXX/class1_week_N.csv``, plus the Big Five scores from ``result_pre_bigfive.csv``.
+
+    Frames are parsed once, with their time column already converted to
+    datetimes, and handed out without touching the disk.  Source files are
+    re-stat'ed at most once every ``refresh_interval`` seconds; only files whose
+    mtime or size changed are re-parsed, and ``version`` is bumped whenever the
+    in-memory data changes.
+
+    Listeners registered with ``add_listener`` receive each batch of changes as
+    event dicts, e.g. ``{"type": "week", "user": "u01", "week": 9, "change":
+    "added"}``; see ``_event`` for the types.  They are called with the store
+    locked and must only hand the events off.
+
+    ``compiled`` (a ``scripts.columnar_store.CompiledStore``) supplies frames
+    whose stamp matches the compiled copy; any other file is parsed from CSV.
+    """
+
+    def __init__(self, root: Path, refresh_interval: float = 2.0, compiled: Optional[Any] = None) -> None:
+        self.root = root
+        self.refresh_interval = refresh_interval
+        self.compiled = compiled
+        self.version = 0
+        self._users: Dict[str, UserData] = {}
+        self._emotions: Dict[str, EmotionLog] = {}
+        self._big_five: Dict[str, Dict[str, float]] = {}
+        self._big_five_stamp: Optional[FileStamp] = None
+        self._lock = threading.RLock()
+        self._last_scan: Optional[float] = None
+        self._listeners: List[Callable[[List[Dict[str, Any]]], None]] = []
+
+    # ------------------------------------------------------------------ loading
+    def load(self) -> None:
+        """Scan the workspace now, (re)parsing anything new or modified."""
+        with self._lock:
+            self._scan()
+
+    def _maybe_refresh(self) -> None:
+        last = self._last_scan
+        if last is not None and time.monotonic() - last < self.refresh_interval:
+            return
+        with self._lock:
+            last = self._last_scan
+            if last is not None and time.monotonic() - last < self.refresh_interval:
+                return
+            self._scan()
+
+    def add_listener(self, listener: Callable[[List[Dict[str, Any]]], None]) -> None:
+        with self._lock:
+            self._listeners.append(listener)
+
+    def _notify(self, events: List[Dict[str, Any]]) -> None:
+        if events:
+            for listener in self._listeners:
+                listener(events)
+
+    @timed("stat")
+    def _scan(self) -> None:
+        events: List[Dict[str, Any]] = []
+        seen_users = set()
+        emotion_files: Dict[str, Path] = {}
+        with os.scandir(self.root) as it:
+            user_dirs = []
+            for e in it:
+                if e.is_dir() and is_user_dir_name(e.name):
+                    user_dirs.append(e)
+                elif e.name.endswith(EMOTION_LOG_SUFFIX) and is_user_dir_name(e.name[:-len(EMOTION_LOG_SUFFIX)]):
+                    emotion_files[e.name[:-len(EMOTION_LOG_SUFFIX)]] = Path(e.path)
+        changed = self._sync_emotions(emotion_files, events)
+        changed |= self._sync_big_five()
+        for user_entry in user_dirs:
+            user_id = user_entry.name
+            seen_users.add(user_id)
+            user = self._users.get(user_id)
+            if user is None:
+                user = self._users[user_id] = UserData()
+                events.append(_event("user", user_id, change="added"))
+                changed = True
+            changed |= self._scan_user(user_id, Path(user_entry.path), user, events)
+        for user_id in list(self._users):
+            if user_id not in seen_users:
+                del self._users[user_id]
+                events.append(_event("user", user_id, change="removed"))
+                changed = True
+        if changed:
+            self.version += 1
+        self._last_scan = time.monotonic()
+        self._notify(events)
+
+    def current_version(self) -> int:
+        """``version`` after picking up any changes on disk."""
+        self._maybe_refresh()
+        return self.version
+
+    def warm(self) -> None:
+        """Build every frame's derived lists and indexes and each user's timeline now
+        instead of on first request, e.g. before forking workers that share them."""
+        self._maybe_refresh()
+        with self._lock:
+            users = list(self._users.items())
+        for user_id, user in users:
+            for entry in (*user.weeks.values(), *user.status.values(), *user.classes.values()):
+                if not entry.built:
+                    entry.build()
+            self.location_timeline(user_id)
+
+    def _emotions_changed(self, user_id: str, weeks: List[int]) -> None:
+        # called by the log itself, whether a scan or a request noticed the change
+        with self._lock:
+            self.version += 1
+            if weeks:
+                self._notify([_event("emotions", user_id, weeks=weeks)])
+
+    def _sync_emotions(self, found: Dict[str, Path], events: List[Dict[str, Any]]) -> bool:
+        changed = False
+        for user_id in list(self._emotions):
+            if user_id not in found:
+                del self._emotions[user_id]
+                events.append(_event("emotions", user_id, weeks=[], change="removed"))
+                changed = True
+        for user_id, path in found.items():
+            log = self._emotions.get(user_id)
+            if log is not None and log.path == path:
+                # appended weeks are read incrementally and reported through on_change
+                log.refresh()
+                continue
+            if _file_stamp(path) is None:
+                continue
+            log = EmotionLog(path, on_change=functools.partial(self._emotions_changed, user_id))
+            log.index()
+            self._emotions[user_id] = log
+            events.append(_event("emotions", user_id, weeks=log.weeks(), change="added"))
+            changed = True
+        return changed
+
+    def _sync_big_five(self) -> bool:
+        stamp = _file_stamp(self.root / BIG_FIVE_CSV)
+        if stamp == self._big_five_stamp:
+            return False
+        self._big_five = _load_big_five(self.root / BIG_FIVE_CSV) if stamp is not None else {}
+        self._big_five_stamp = stamp
+        return True
+
+    def _scan_user(self, user_id: str, user_path: Path, user: UserData, events: List[Dict[str, Any]]) -> bool:
+        week_files: Dict[int, Path] = {}
+        status_files: Dict[str, Path] = {}
+        class_files: Dict[int, Path] = {}
+        with os.scandir(user_path) as it:
+            for entry in it:
+                m = WEEK_CSV_RE.match(entry.name)
+                if m:
+                    week_files[int(m.group(1))] = Path(entry.path)
+                    continue
+                m = CLASS_CSV_RE.match(entry.name)
+                if m:
+                    class_files[int(m.group(1))] = Path(entry.path)
+                    continue
+                for kind in STATUS_KINDS:
+                    if entry.name == f"{kind}_week_.csv":
+                        status_files[kind] = Path(entry.path)
+
+        week_changes = self._sync_entries(user.weeks, week_files, WEEK_TIME_COLUMNS)
+        if week_changes:
+            user.timeline = None
+        status_changes = self._sync_entries(user.status, status_files, STATUS_TIME_COLUMNS)
+        class_changes = self._sync_entries(user.classes, class_files, CLASS_TIME_COLUMNS)
+        events.extend(_event("week", user_id, week=week, change=change) for week, change in week_changes)
+        events.extend(_event("status", user_id, kind=kind, change=change) for kind, change in status_changes)
+        events.extend(_event("classes", user_id, week=week, change=change) for week, change in class_changes)
+        return bool(week_changes or status_changes or class_changes)
+
+    def _sync_entries(self, entries: Dict, found: Dict, time_candidates: List[str]) -> List[Tuple[Any, str]]:
+        """Bring ``entries`` in line with the files ``found``; returns ``(key, change)``
+        for every entry added, changed or removed."""
+        changes: List[Tuple[Any, str]] = []
+        for key in list(entries):
+            if key not in found:
+                del entries[key]
+                changes.append((key, "removed"))
+        for key, path in found.items():
+            stamp = _file_stamp(path)
+            if stamp is None:
+                continue
+            current = entries.get(key)
+            if current is not None and current.stamp == stamp:
+                continue
+            entry = self.compiled.frame(self.root, path, stamp) if self.compiled is not None else None
+            entries[key] = entry if entry is not None else _load_frame(path, stamp, time_candidates)
+            changes.append((key, "added" if current is None else "changed"))
+        return changes
+
+    # ------------------------------------------------------------------ access
+    def users(self) -> List[str]:
+        self._maybe_refresh()
+        return sorted(self._users)
+
+    def has_user(self, user_id: str) -> bool:
+        self._maybe_refresh()
+        return user_id in self._users
+
+    def weeks(self, user_id: str) -> List[int]:
+        self._maybe_refresh()
+        user = self._users.get(user_id)
+        return sorted(user.weeks) if user is not None else []
+
+    def status_kinds(self, user_id: str) -> List[str]:
+        self._maybe_refresh()
+        user = self._users.get(user_id)
+        return [kind for kind in STATUS_KINDS if kind in user.status] if user is not None else []
+
+    def big_five(self, user_id: str) -> Optional[Dict[str, float]]:
+        self._maybe_refresh()
+        return self._big_five.get(user_id)
+
+    def location_timeline(self, user_id: str) -> Optional[Timeline]:
+        """All of a user's week frames in one time-sorted index."""
+        self._maybe_refresh()
+        user = self._users.get(user_id)
+        if user is None:
+            return None
+        timeline = user.timeline
+        if timeline is None:
+            timeline = user.timeline = Timeline([user.weeks[w] for w in sorted(user.weeks)])
+        return timeline
+
+    def week_frame(self, user_id: str, week: int) -> Optional[FrameEntry]:
+        self._maybe_refresh()
+        user = self._users.get(user_id)
+        return user.weeks.get(week) if user is not None else None
+
+    def status_frame(self, user_id: str, kind: str) -> Optional[FrameEntry]:
+        self._maybe_refresh()
+        user = self._users.get(user_id)
+        return user.status.get(kind) if user is not None else None
+
+    def class_frames(self, user_id: str) -> Dict[int, FrameEntry]:
+        """week -> parsed ``class1_week_N.csv`` of one user."""
+        self._maybe_refresh()
+        user = self._users.get(user_id)
+        return dict(user.classes) if user is not None else {}
+
+    def emotion_users(self) -> List[str]:
+        self._maybe_refresh()
+        return sorted(self._emotions)
+
+    def emotion_log(self, user_id: str) -> Optional[EmotionLog]:
+        self._maybe_refresh()
+        return self._emotions.get(user_id)
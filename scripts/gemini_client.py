@@ -0,0 +1,305 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+import httpx
+
+from scripts.metrics import add_phase, timed
+
+DEFAULT_API_BASE = "https://generativelanguage.googleapis.com"
+DEFAULT_MODEL = "gemini-2.0-flash"
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# phrases of the cachedContents rejections that say the prompt or model cannot be
+# cached at all, as opposed to an invalid key or a transient failure
+CACHE_UNSUPPORTED_MESSAGES = ("too small", "not supported", "does not support")
+
+
+class GeminiError(Exception):
+    """An upstream call that failed for good (after retries, if any applied).
+
+    ``status_code`` and ``body`` are the upstream HTTP status and response text,
+    or ``None`` for network errors and timeouts.
+    """
+
+    def __init__(
+        self,
+        message: str,
+        status_code: Optional[int] = None,
+        body: Optional[str] = None,
+        timeout: bool = False,
+    ) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.body = body
+        self.timeout = timeout
+
+    @property
+    def cache_unsupported(self) -> bool:
+        """Whether a ``cachedContents`` upload was refused because the content is
+        below the model's minimum size or the model cannot cache at all."""
+        body = (self.body or "").lower()
+        return self.status_code in (400, 404) and any(m in body for m in CACHE_UNSUPPORTED_MESSAGES)
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+class GeminiClient:
+    """Shared async client for the Gemini REST API.
+
+    One keep-alive connection pool is reused by every request, at most
+    ``max_concurrency`` upstream calls are in flight at once, and 429/5xx
+    answers or transport errors are retried with full-jitter exponential
+    backoff (honouring ``Retry-After`` when the upstream sends it).
+
+    A streamed reply holds its slot until the client has read the last delta,
+    so streams are bounded separately by ``max_streams`` and slow readers
+    cannot take the slots of non-streaming calls.
+    """
+
+    def __init__(
+        self,
+        api_base: str = DEFAULT_API_BASE,
+        model: str = DEFAULT_MODEL,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 60.0,
+        max_concurrency: int = 8,
+        max_retries: int = 3,
+        max_streams: Optional[int] = None,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+    ) -> None:
+        self.api_base = api_base.rstrip("/")
+        self.model = model
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.max_concurrency = max_concurrency
+        self.max_streams = max_streams if max_streams is not None else max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._stream_semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @classmethod
+    def from_env(cls) -> "GeminiClient":
+        return cls(
+            api_base=os.getenv("GEMINI_API_BASE", DEFAULT_API_BASE),
+            model=os.getenv("GEMINI_MODEL", DEFAULT_MODEL),
+            connect_timeout=_env_float("GEMINI_CONNECT_TIMEOUT", 5.0),
+            read_timeout=_env_float("GEMINI_READ_TIMEOUT", 60.0),
+            max_concurrency=_env_int("GEMINI_MAX_CONCURRENCY", 8),
+            max_retries=_env_int("GEMINI_MAX_RETRIES", 3),
+            max_streams=_env_int("GEMINI_MAX_STREAMS", _env_int("GEMINI_MAX_CONCURRENCY", 8)),
+        )
+
+    def url(self, method: str = "generateContent") -> str:
+        return f"{self.api_base}/v1beta/models/{self.model}:{method}"
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # created lazily so the pool and semaphore bind to the running event loop;
+        # a different loop (e.g. after a fork) gets a fresh pool
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._retire_client()
+            self._loop = loop
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency + self.max_streams,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._stream_semaphore = asyncio.Semaphore(self.max_streams)
+        return self._client
+
+    def _retire_client(self) -> None:
+        """Close the pool of the previous loop, which must happen on that loop."""
+        old, loop = self._client, self._loop
+        self._client = None
+        if old is not None and loop is not None and loop.is_running() and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(old.aclose(), loop)
+        # otherwise nothing can run the close any more (a stopped loop, or the
+        # parent's loop after a fork); its sockets close when collected
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._semaphore = None
+            self._stream_semaphore = None
+            self._loop = None
+
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    @timed("upstream")
+    async def generate(
+        self,
+        api_key: str,
+        request_data: Dict[str, Any],
+        on_retry: Optional[Callable[[GeminiError, float], None]] = None,
+        max_retries: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """POST ``request_data`` to ``generateContent`` and return the decoded JSON.
+
+        ``on_retry`` is told about each retried failure and the backoff before
+        the next attempt; ``max_retries`` overrides the client's default.
+        """
+        client = self._get_client()
+        retries = self.max_retries if max_retries is None else max_retries
+        headers = {"Content-Type": "application/json", "X-goog-api-key": api_key}
+        attempt = 0
+        while True:
+            retry_after = None
+            try:
+                async with self._semaphore:
+                    response = await client.post(self.url(), headers=headers, json=request_data)
+            except httpx.TimeoutException as e:
+                error = GeminiError(f"Gemini API timeout: {e!r}", timeout=True)
+            except httpx.TransportError as e:
+                error = GeminiError(f"Network error: {e!r}")
+            else:
+                if response.is_success:
+                    return response.json()
+                error = GeminiError(
+                    f"Gemini API error: {response.text}",
+                    status_code=response.status_code,
+                    body=response.text,
+                )
+                if response.status_code not in RETRY_STATUS_CODES:
+                    raise error
+                retry_after = response.headers.get("Retry-After")
+            if attempt >= retries:
+                raise error
+            delay = self._backoff(attempt, retry_after)
+            if on_retry is not None:
+                on_retry(error, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    @timed("upstream")
+    async def create_cached_content(
+        self,
+        api_key: str,
+        system_instruction: Dict[str, Any],
+        ttl_seconds: int,
+    ) -> str:
+        """Upload a system instruction once as a ``cachedContents`` resource.
+
+        Returns the resource name to pass as ``cachedContent`` in later
+        requests made with the same ``api_key``.  Failures raise ``GeminiError``;
+        its ``cache_unsupported`` tells a prompt or model that cannot be cached
+        from a bad key or an upstream outage.
+        """
+        client = self._get_client()
+        headers = {"Content-Type": "application/json", "X-goog-api-key": api_key}
+        body = {
+            "model": f"models/{self.model}",
+            "systemInstruction": system_instruction,
+            "ttl": f"{int(ttl_seconds)}s",
+        }
+        try:
+            async with self._semaphore:
+                response = await client.post(f"{self.api_base}/v1beta/cachedContents", headers=headers, json=body)
+        except httpx.TimeoutException as e:
+            raise GeminiError(f"Gemini API timeout: {e!r}", timeout=True)
+        except httpx.TransportError as e:
+            raise GeminiError(f"Network error: {e!r}")
+        if not response.is_success:
+            raise GeminiError(
+                f"Gemini API error: {response.text}",
+                status_code=response.status_code,
+                body=response.text,
+            )
+        return response.json()["name"]
+
+    async def stream_generate(self, api_key: str, request_data: Dict[str, Any]) -> AsyncIterator[str]:
+        """Text deltas from ``streamGenerateContent`` (``alt=sse``) as they arrive.
+
+        Failures before the first delta are retried like ``generate``; once text
+        has been yielded an error is raised straight away, since a retry would
+        repeat it.  Closing the iterator early closes the upstream request.
+        Only the waits for the upstream count towards the ``upstream`` phase,
+        not the time the consumer spends between deltas.
+        """
+        client = self._get_client()
+        headers = {"Content-Type": "application/json", "X-goog-api-key": api_key}
+        attempt = 0
+        started = False
+        waiting = time.perf_counter()
+        while True:
+            retry_after = None
+            async with self._stream_semaphore:
+                try:
+                    async with client.stream(
+                        "POST",
+                        self.url("streamGenerateContent"),
+                        params={"alt": "sse"},
+                        headers=headers,
+                        json=request_data,
+                    ) as response:
+                        if response.is_success:
+                            async for text in _iter_sse_text(response):
+                                started = True
+                                add_phase("upstream", time.perf_counter() - waiting)
+                                yield text
+                                waiting = time.perf_counter()
+                            add_phase("upstream", time.perf_counter() - waiting)
+                            return
+                        body = (await response.aread()).decode("utf-8", errors="replace")
+                        error = GeminiError(f"Gemini API error: {body}", status_code=response.status_code, body=body)
+                        if response.status_code not in RETRY_STATUS_CODES:
+                            raise error
+                        retry_after = response.headers.get("Retry-After")
+                except httpx.TimeoutException as e:
+                    error = GeminiError(f"Gemini API timeout: {e!r}", timeout=True)
+                except httpx.TransportError as e:
+                    error = GeminiError(f"Network error: {e!r}")
+            if started or attempt >= self.max_retries:
+                add_phase("upstream", time.perf_counter() - waiting)
+                raise error
+            await asyncio.sleep(self._backoff(attempt, retry_after))
+            attempt += 1
+
+
+async def _iter_sse_text(response: httpx.Response) -> AsyncIterator[str]:
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        payload = line[len("data:"):].strip()
+        if not payload:
+            continue
+        text = extract_text(json.loads(payload))
+        if text:
+            yield text
+
+
+def extract_text(response_data: Dict[str, Any]) -> Optional[str]:
+    """The first candidate's text from a ``generateContent`` response, if any."""
+    candidates = response_data.get("candidates") or []
+    if candidates:
+        content = candidates[0].get("content") or {}
+        parts = content.get("parts") or []
+        if parts and "text" in parts[0]:
+            return parts[0]["text"]
+    return None
@@ -0,0 +1,297 @@
+"""Strong ETags, ``If-None-Match`` -> 304, ``Cache-Control`` and gzip/brotli for
+the read-only data endpoints, served from a cache of already-encoded bodies.
+
+Bodies are cached per (path, query string) for the current dataset version,
+so a repeat hit skips the handler and JSON encoding, and a 304 skips the
+body as well.  The ETag is a hash of the body, which keeps it stable across
+restarts and worker processes serving the same data.  Hashing large bodies
+and compressing run in the threadpool, and each encoding is only made the
+first time a client asks for it.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from scripts.metrics import annotate
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only without it
+    brotli = None
+
+
+def _compressors() -> Dict[str, Callable[[bytes], bytes]]:
+    found: Dict[str, Callable[[bytes], bytes]] = {}
+    if brotli is not None:
+        found["br"] = lambda body: brotli.compress(body, quality=5)
+    found["gzip"] = lambda body: gzip.compress(body, compresslevel=6, mtime=0)
+    return found
+
+
+# preference order when a client accepts several
+COMPRESSORS = _compressors()
+
+
+class CachedBody:
+    """One encoded response.  Compressed variants are made on first request for
+    each encoding (see :meth:`ResponseCache.encode`); ``None`` records that
+    compressing did not make the body smaller."""
+
+    __slots__ = ("content_type", "body", "etag", "encodings", "encoded", "size")
+
+    def __init__(self, content_type: bytes, body: bytes, min_compress: int) -> None:
+        self.content_type = content_type
+        self.body = body
+        self.etag = b'"' + hashlib.blake2b(body, digest_size=16).hexdigest().encode() + b'"'
+        self.encodings = tuple(COMPRESSORS) if len(body) >= min_compress else ()
+        self.encoded: Dict[str, Optional[bytes]] = {}
+        self.size = len(body)
+
+
+class ResponseCache:
+    """LRU of :class:`CachedBody` for one dataset version, bounded by total bytes.
+
+    ``max_bytes == 0`` stores nothing; responses still get ETags and compression.
+    """
+
+    def __init__(self, max_bytes: int = 64 << 20, min_compress: int = 1024, max_age: int = 0) -> None:
+        self.max_bytes = max_bytes
+        self.min_compress = min_compress
+        self.cache_control = b"private, no-cache" if max_age <= 0 else f"private, max-age={max_age}".encode()
+        self._entries: "OrderedDict[Hashable, CachedBody]" = OrderedDict()
+        self._bytes = 0
+        self._version: Optional[Hashable] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        return cls(
+            max_bytes=int(float(os.getenv("API_RESPONSE_CACHE_MB", "64")) * (1 << 20)),
+            min_compress=int(os.getenv("API_COMPRESS_MIN_BYTES", "1024")),
+            max_age=int(os.getenv("API_CACHE_MAX_AGE", "0")),
+        )
+
+    def get(self, version: Hashable, key: Hashable) -> Optional[CachedBody]:
+        with self._lock:
+            if version != self._version:
+                # everything cached belongs to older data
+                self._entries.clear()
+                self._bytes = 0
+                self._version = version
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, version: Hashable, key: Hashable, entry: CachedBody) -> None:
+        with self._lock:
+            if version != self._version or entry.size > self.max_bytes:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self.evictions += 1
+
+    def note_not_modified(self) -> None:
+        with self._lock:
+            self.not_modified += 1
+
+    def encode(self, key: Hashable, entry: CachedBody, encoding: str) -> Optional[bytes]:
+        """``entry`` compressed with ``encoding``, made once and counted against
+        ``max_bytes`` if the entry is cached; blocks, so call it in the threadpool."""
+        if encoding in entry.encoded:
+            return entry.encoded[encoding]
+        packed: Optional[bytes] = COMPRESSORS[encoding](entry.body)
+        if len(packed) >= len(entry.body):
+            packed = None
+        with self._lock:
+            if encoding in entry.encoded:
+                # compressed concurrently by another request
+                return entry.encoded[encoding]
+            entry.encoded[encoding] = packed
+            added = len(packed) if packed is not None else 0
+            entry.size += added
+            if self._entries.get(key) is entry:
+                self._bytes += added
+                while self._bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._bytes -= evicted.size
+                    self.evictions += 1
+        return packed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "evictions": self.evictions,
+                "encodings": list(COMPRESSORS),
+            }
+
+
+def _etag_matches(if_none_match: Optional[str], etag: bytes) -> bool:
+    if not if_none_match:
+        return False
+    tag = etag.decode()
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        # If-None-Match uses the weak comparison
+        if candidate == "*" or candidate.removeprefix("W/") == tag:
+            return True
+    return False
+
+
+def _accepted(accept_encoding: str) -> Dict[str, float]:
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    return accepted
+
+
+def pick_encoding(accept_encoding: str, available: Sequence[str]) -> Optional[str]:
+    """The encoding in ``available`` with the client's highest q > 0; ties go to
+    the ``COMPRESSORS`` order."""
+    if not available or not accept_encoding:
+        return None
+    accepted = _accepted(accept_encoding)
+    best, best_q = None, 0.0
+    for name in COMPRESSORS:
+        q = accepted.get(name, accepted.get("*", 0.0))
+        if name in available and q > best_q:
+            best, best_q = name, q
+    return best
+
+
+class ConditionalGetMiddleware:
+    """Serve GETs for which ``cacheable(path)`` holds through a :class:`ResponseCache`.
+
+    ``version()`` is the data version a response was computed from (it may hit
+    the filesystem, so it runs in the threadpool).  Only complete 200 JSON
+    responses, i.e. those with a Content-Length, are cached; errors and
+    streams pass through untouched.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        cache: ResponseCache,
+        version: Callable[[], Hashable],
+        cacheable: Callable[[str], bool],
+    ) -> None:
+        self.app = app
+        self.cache = cache
+        self.version = version
+        self.cacheable = cacheable
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "GET" or not self.cacheable(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        version = await run_in_threadpool(self.version)
+        key = (scope["path"], scope["query_string"])
+        entry = self.cache.get(version, key)
+        annotate(response_cache="miss" if entry is None else "hit")
+        if entry is None:
+            entry = await self._render(scope, receive, send)
+            if entry is None:
+                return
+            self.cache.put(version, key, entry)
+        await self._respond(key, entry, Headers(scope=scope), send)
+
+    async def _render(self, scope: Scope, receive: Receive, send: Send) -> Optional[CachedBody]:
+        """Run the app and capture a cacheable body, or forward its response as is."""
+        start: Optional[Message] = None
+        chunks: List[bytes] = []
+        passthrough = False
+
+        async def capture(message: Message) -> None:
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+            elif message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if (
+                    message["status"] == 200
+                    and "content-length" in headers
+                    and "content-encoding" not in headers
+                    and headers.get("content-type", "").startswith("application/json")
+                ):
+                    start = message
+                else:
+                    passthrough = True
+                    await send(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, capture)
+        if start is None:
+            return None
+        content_type = Headers(raw=start["headers"])["content-type"].encode("latin-1")
+        body = b"".join(chunks)
+        if len(body) < self.cache.min_compress:
+            return CachedBody(content_type, body, self.cache.min_compress)
+        # hashing a large body would hold up every other request on the loop
+        return await run_in_threadpool(CachedBody, content_type, body, self.cache.min_compress)
+
+    async def _respond(self, key: Hashable, entry: CachedBody, request: Headers, send: Send) -> None:
+        headers: List[Tuple[bytes, bytes]] = [
+            (b"etag", entry.etag),
+            (b"cache-control", self.cache.cache_control),
+            (b"vary", b"Accept-Encoding"),
+        ]
+        if _etag_matches(request.get("if-none-match"), entry.etag):
+            self.cache.note_not_modified()
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        encoding = pick_encoding(request.get("accept-encoding", ""), entry.encodings)
+        body = entry.body
+        if encoding:
+            # only the encoding this client asked for, compressed off the loop
+            packed = entry.encoded[encoding] if encoding in entry.encoded else \
+                await run_in_threadpool(self.cache.encode, key, entry, encoding)
+            if packed is None:
+                encoding = None
+            else:
+                body = packed
+        headers.append((b"content-type", entry.content_type))
+        headers.append((b"content-length", str(len(body)).encode()))
+        if encoding:
+            headers.append((b"content-encoding", encoding.encode()))
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,141 @@
+"""Push notices of new simulation output to connected clients.
+
+While anyone is subscribed, a watcher thread re-scans the dataset every
+``interval`` seconds.  ``DatasetStore`` only re-reads what changed (new or
+rewritten CSVs, lines appended to an emotion log) and reports each change
+as an event; the watcher builds the message for an event once and hands it
+to every subscriber interested in that user.  Subscribers live on the event
+loop and read their messages from an ``asyncio.Queue``.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+LOG = logging.getLogger("api.live")
+
+# change event -> message sent to clients
+Payload = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+
+class Subscriber:
+    """One client's queue of messages; ``users`` of ``None`` means every user."""
+
+    __slots__ = ("users", "loop", "queue")
+
+    def __init__(self, users: Optional[Iterable[str]], loop: asyncio.AbstractEventLoop, size: int) -> None:
+        self.users = frozenset(users) if users is not None else None
+        self.loop = loop
+        self.queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=size)
+
+    def wants(self, user_id: Optional[str]) -> bool:
+        return self.users is None or user_id in self.users
+
+    def push(self, message: Dict[str, Any]) -> None:
+        # runs on the subscriber's loop
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # a client this far behind refetches instead of replaying every change
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"type": "reset"})
+
+
+class LiveFeed:
+    __slots__ = ("store", "interval", "queue_size", "payload", "published",
+                 "_subscribers", "_events", "_lock", "_thread", "_stop", "_listening")
+
+    def __init__(self, store: Any, interval: float = 2.0, queue_size: int = 256) -> None:
+        self.store = store
+        self.interval = interval
+        self.queue_size = queue_size
+        self.payload: Optional[Payload] = None
+        self.published = 0
+        self._subscribers: List[Subscriber] = []
+        self._events: "queue.Queue[Optional[List[Dict[str, Any]]]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._listening = False
+
+    @classmethod
+    def from_env(cls, store: Any) -> "LiveFeed":
+        return cls(
+            store,
+            interval=float(os.getenv("DATASET_WATCH_SECONDS", str(store.refresh_interval))),
+            queue_size=int(os.getenv("API_LIVE_QUEUE", "256")),
+        )
+
+    def start(self, payload: Optional[Payload] = None) -> None:
+        """Start watching; called in each worker, since threads do not survive a fork."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self.payload = payload
+        self._stop.clear()
+        if not self._listening:
+            self.store.add_listener(self._events.put)
+            self._listening = True
+        self._thread = threading.Thread(target=self._run, name="dataset-watch", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._events.put(None)
+
+    def subscribe(self, users: Optional[Iterable[str]] = None) -> Subscriber:
+        subscriber = Subscriber(users, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"subscribers": len(self._subscribers), "published": self.published}
+
+    def _run(self) -> None:
+        next_scan = time.monotonic() + self.interval
+        while not self._stop.is_set():
+            try:
+                events = self._events.get(timeout=max(0.0, next_scan - time.monotonic()))
+            except queue.Empty:
+                next_scan = time.monotonic() + self.interval
+                if self._subscribers:
+                    try:
+                        # listeners are called from inside the scan and queue what changed
+                        self.store.load()
+                    except Exception:
+                        LOG.exception("dataset scan failed")
+                continue
+            if events:
+                self._publish(events)
+
+    def _publish(self, events: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for event in events:
+            targets = [s for s in subscribers if s.wants(event.get("user"))]
+            if not targets:
+                continue
+            message = event
+            if self.payload is not None:
+                try:
+                    message = self.payload(event)
+                except Exception:
+                    LOG.exception("building the %s message for %s failed", event["type"], event.get("user"))
+            for subscriber in targets:
+                try:
+                    subscriber.loop.call_soon_threadsafe(subscriber.push, message)
+                except RuntimeError:
+                    # the loop is closed; the subscriber goes away with it
+                    self.unsubscribe(subscriber)
+            self.published += 1
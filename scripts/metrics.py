@@ -0,0 +1,357 @@
+"""Per-route latency histograms, per-request phase timers, Prometheus text output
+and sampled request logging.
+
+:class:`TimingMiddleware` times every HTTP request under its route template
+(``/api/{user_id}/emotions``, not the concrete path) and makes a
+:class:`RequestTimings` current for the request.  Code on the request path
+wraps its work in :func:`phase` / :func:`timed`; phases nest and are
+exclusive, so a CSV parsed lazily while records are being built counts as
+``parse``, not ``serialize``.  Outside a request the timers do nothing.
+
+Phases used by the server: ``stat`` (change detection), ``read`` (file I/O),
+``parse`` (CSV/JSON decoding), ``filter`` (row selection), ``aggregate``
+(bucketing and cohort statistics), ``serialize`` (building records and JSON
+encoding) and ``upstream`` (waiting on Gemini).
+"""
+from __future__ import annotations
+
+import bisect
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from starlette.datastructures import MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# seconds; shared by request and phase histograms
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+UNMATCHED_ROUTE = "<unmatched>"
+# stats() keys that only ever grow; exported as counters
+COUNTER_KEYS = frozenset((
+    "hits", "misses", "not_modified", "evictions", "bypasses", "expirations",
+    "published", "replies", "errors", "throttles",
+))
+
+REQUEST_LOG = logging.getLogger("api.requests")
+
+
+class RequestTimings:
+    """Exclusive seconds per phase for one request, plus fields for its log line."""
+
+    __slots__ = ("phases", "fields", "_stack")
+
+    def __init__(self) -> None:
+        self.phases: Dict[str, float] = {}
+        self.fields: Dict[str, Any] = {}
+        self._stack: List[str] = []
+
+    def add(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+
+_CURRENT: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Charge the enclosed work to ``name``; time spent in nested phases is
+    subtracted from the enclosing one."""
+    timings = _CURRENT.get()
+    if timings is None:
+        yield
+        return
+    stack = timings._stack
+    parent = stack[-1] if stack else None
+    stack.append(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stack.pop()
+        timings.add(name, elapsed)
+        if parent is not None:
+            timings.add(parent, -elapsed)
+
+
+def timed(name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Decorator form of :func:`phase` for plain and ``async`` functions."""
+
+    def decorate(fn: Callable[..., Any]) -> Callable[..., Any]:
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def run_async(*args: Any, **kwargs: Any) -> Any:
+                with phase(name):
+                    return await fn(*args, **kwargs)
+            return run_async
+
+        @functools.wraps(fn)
+        def run(*args: Any, **kwargs: Any) -> Any:
+            if _CURRENT.get() is None:
+                return fn(*args, **kwargs)
+            with phase(name):
+                return fn(*args, **kwargs)
+        return run
+
+    return decorate
+
+
+def add_phase(name: str, seconds: float) -> None:
+    """Charge ``seconds`` measured by the caller (e.g. between stream chunks)."""
+    timings = _CURRENT.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+def annotate(**fields: Any) -> None:
+    """Attach fields to the current request's log line."""
+    timings = _CURRENT.get()
+    if timings is not None:
+        timings.fields.update(fields)
+
+
+class TimedJSONResponse(JSONResponse):
+    """``JSONResponse`` whose encoding is charged to the ``serialize`` phase."""
+
+    def render(self, content: Any) -> bytes:
+        with phase("serialize"):
+            return super().render(content)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int) -> None:
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, buckets: Sequence[float], value: float) -> None:
+        i = bisect.bisect_left(buckets, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    parts = [
+        f'{n}="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for n, v in zip(names, values)
+    ]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """Request counters and histograms keyed by route template, plus sampled logging.
+
+    A request is logged (one JSON line on the ``api.requests`` logger) with
+    probability ``log_sample``, and always when it fails with a 5xx or takes
+    at least ``slow_ms``.
+    """
+
+    def __init__(
+        self,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        server_timing: bool = False,
+        log_sample: float = 0.01,
+        slow_ms: float = 1000.0,
+    ) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self.server_timing = server_timing
+        self.log_sample = log_sample
+        self.slow_ms = slow_ms
+        self.started = time.time()
+        self.in_progress = 0
+        self._requests: Dict[Tuple[str, str, int], int] = {}
+        self._latency: Dict[Tuple[str, str], Histogram] = {}
+        self._phases: Dict[Tuple[str, str], Histogram] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "Metrics":
+        metrics = cls(
+            server_timing=os.getenv("API_SERVER_TIMING", "0") not in ("0", "false", "no", ""),
+            log_sample=float(os.getenv("API_LOG_SAMPLE", "0.01")),
+            slow_ms=float(os.getenv("API_LOG_SLOW_MS", "1000")),
+        )
+        if not REQUEST_LOG.handlers:
+            handler = logging.StreamHandler(sys.stderr)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            REQUEST_LOG.addHandler(handler)
+            REQUEST_LOG.setLevel(logging.INFO)
+            REQUEST_LOG.propagate = False
+        return metrics
+
+    def observe(self, method: str, route: str, status: int, seconds: float, timings: RequestTimings) -> None:
+        with self._lock:
+            key = (method, route, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            size = len(self.buckets)
+            latency = self._latency.get((method, route))
+            if latency is None:
+                latency = self._latency[(method, route)] = Histogram(size)
+            latency.observe(self.buckets, seconds)
+            for name, spent in timings.phases.items():
+                hist = self._phases.get((route, name))
+                if hist is None:
+                    hist = self._phases[(route, name)] = Histogram(size)
+                hist.observe(self.buckets, max(spent, 0.0))
+
+    def should_log(self, status: int, seconds: float) -> bool:
+        return status >= 500 or seconds * 1000.0 >= self.slow_ms or (
+            self.log_sample > 0 and random.random() < self.log_sample
+        )
+
+    def log(self, method: str, route: str, path: str, status: int, seconds: float, timings: RequestTimings) -> None:
+        record = {
+            "ts": round(time.time(), 3),
+            "method": method,
+            "route": route,
+            "path": path,
+            "status": status,
+            "ms": round(seconds * 1000.0, 3),
+            "phases_ms": {name: round(spent * 1000.0, 3) for name, spent in timings.phases.items()},
+            **timings.fields,
+        }
+        REQUEST_LOG.info(json.dumps(record, ensure_ascii=False, default=str))
+
+    def _histogram_lines(self, name: str, label_names: Sequence[str], series: Dict[Tuple, Histogram]) -> List[str]:
+        lines = [f"# TYPE {name} histogram"]
+        for key, hist in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, hist.counts):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{name}_bucket{_labels(label_names, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{name}_bucket{_labels(label_names, key, le)} {hist.count}")
+            lines.append(f"{name}_sum{_labels(label_names, key)} {_number(hist.sum)}")
+            lines.append(f"{name}_count{_labels(label_names, key)} {hist.count}")
+        return lines
+
+    def render(self, stats: Optional[Dict[str, Dict[str, Any]]] = None) -> str:
+        """Prometheus text exposition format (0.0.4).
+
+        ``stats`` maps a metric prefix to a ``stats()`` dict whose numeric
+        values are exported as gauges, or as counters for the cumulative
+        ``COUNTER_KEYS``.
+        """
+        with self._lock:
+            lines = [
+                "# HELP api_requests_total HTTP requests by method, route template and status.",
+                "# TYPE api_requests_total counter",
+            ]
+            for key, count in sorted(self._requests.items()):
+                lines.append(f"api_requests_total{_labels(('method', 'route', 'status'), key)} {count}")
+            lines.append("# HELP api_request_duration_seconds Time from request to the last body byte.")
+            lines.extend(self._histogram_lines("api_request_duration_seconds", ("method", "route"), self._latency))
+            lines.append("# HELP api_request_phase_seconds Exclusive time per request spent in each phase.")
+            lines.extend(self._histogram_lines("api_request_phase_seconds", ("route", "phase"), self._phases))
+            lines.append("# TYPE api_requests_in_progress gauge")
+            lines.append(f"api_requests_in_progress {self.in_progress}")
+        lines.append("# TYPE api_start_time_seconds gauge")
+        lines.append(f"api_start_time_seconds {self.started:.3f}")
+        for prefix, values in (stats or {}).items():
+            for key, value in values.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"{prefix}_{key}"
+                if key in COUNTER_KEYS:
+                    lines.append(f"# TYPE {name}_total counter")
+                    lines.append(f"{name}_total {_number(value)}")
+                else:
+                    lines.append(f"# TYPE {name} gauge")
+                    lines.append(f"{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+
+def server_timing_header(timings: RequestTimings, seconds: float) -> bytes:
+    parts = [f"{name};dur={spent * 1000.0:.3f}" for name, spent in timings.phases.items() if spent > 0]
+    parts.append(f"total;dur={seconds * 1000.0:.3f}")
+    return ", ".join(parts).encode("latin-1")
+
+
+class TimingMiddleware:
+    """Time each HTTP request, label it with its route template and record it in ``metrics``.
+
+    ``routes`` is the application's route list, used to name requests that
+    never reach the router (e.g. answered from the response cache).  With
+    ``metrics.server_timing`` the phases measured before the response starts
+    are sent as a ``Server-Timing`` header.
+    """
+
+    def __init__(self, app: ASGIApp, metrics: Metrics, routes: Sequence[Any]) -> None:
+        self.app = app
+        self.metrics = metrics
+        self.routes = routes
+        self._route_names: Dict[Tuple[str, str], str] = {}
+
+    def _route(self, scope: Scope) -> str:
+        route = scope.get("route")
+        if route is not None:
+            return getattr(route, "path", UNMATCHED_ROUTE)
+        key = (scope["method"], scope["path"])
+        name = self._route_names.get(key)
+        if name is None:
+            name = UNMATCHED_ROUTE
+            for candidate in self.routes:
+                match, _ = candidate.matches(scope)
+                if match == Match.FULL:
+                    name = getattr(candidate, "path", UNMATCHED_ROUTE)
+                    break
+            if len(self._route_names) >= 4096:
+                # concrete paths are unbounded (user ids, weeks); keep the memo small
+                self._route_names.clear()
+            self._route_names[key] = name
+        return name
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        metrics = self.metrics
+        timings = RequestTimings()
+        token = _CURRENT.set(timings)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_timed(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if metrics.server_timing:
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", server_timing_header(timings, time.perf_counter() - start).decode())
+                    headers.append("Timing-Allow-Origin", "*")
+            await send(message)
+
+        metrics.in_progress += 1
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            metrics.in_progress -= 1
+            seconds = time.perf_counter() - start
+            _CURRENT.reset(token)
+            route = self._route(scope)
+            metrics.observe(scope["method"], route, status, seconds, timings)
+            if metrics.should_log(status, seconds):
+                metrics.log(scope["method"], route, scope["path"], status, seconds, timings)
@@ -0,0 +1,577 @@
+"""Full-text search over the students' weekly narratives: the index behind ``/api/search``.
+
+Every ``weekly_desc`` (one document per user and week) is tokenized into
+lowercase words.  Documents are laid out one after another on a single
+token axis, one empty slot apart, and each term keeps a positional posting
+list: the documents containing it, how often, and every position on that
+axis.  A phrase is a run of consecutive positions, so it can never span two
+documents.  Results are ranked with BM25.
+
+Like ``CohortStats`` the index follows the dataset version and re-reads
+only the emotion logs whose stamp moved.  A week whose narrative changed
+gets a new document and the old one is marked dead.  Dead documents are
+skipped at query time and dropped once they outnumber the live ones.  A
+change to the emotion values alone is applied in place.
+
+Queries are words, ``"quoted phrases"`` and ``prefix*`` terms.  Adjacent
+terms must all match (``AND`` may be written out).  ``OR``, ``NOT`` or
+``-term``, and parentheses combine them.
+"""
+from __future__ import annotations
+
+import html
+import re
+import threading
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from scripts.cohort import EMOTION_DIMENSIONS
+from scripts.dataset_store import DatasetStore, FileStamp
+from scripts.metrics import phase
+
+TOKEN_RE = re.compile(r"\w+(?:['’]\w+)*")
+# query syntax: a quoted phrase (possibly unterminated), a parenthesis, or a word
+QUERY_RE = re.compile(r'-?"[^"]*"?|-?\(|\)|[^\s()"]+')
+# most terms a prefix expands to (the most frequent ones are kept)
+MAX_EXPANSIONS = 64
+
+# emotion threshold comparisons; NaN (a missing value) never passes
+COMPARISONS = {">": np.greater, ">=": np.greater_equal, "<": np.less, "<=": np.less_equal, "=": np.equal}
+# characters of a narrative shown around its best-matching stretch
+SNIPPET_CHARS = 200
+
+# query tree: ("term", word) | ("prefix", stem) | ("phrase", words) | ("and"/"or", children) | ("not", child)
+Node = Tuple[Any, ...]
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+def _word(text: str) -> Optional[Node]:
+    prefix = text.endswith("*")
+    words = tokenize(text)
+    if not words:
+        return None
+    if len(words) > 1:
+        # e.g. "covid-19" or "o'clock" written without quotes
+        return ("phrase", tuple(words))
+    return ("prefix", words[0]) if prefix else ("term", words[0])
+
+
+class _Parser:
+    """Recursive descent over ``or := and (OR and)*``, ``and := unary ([AND] unary)*``,
+    ``unary := (NOT | -) unary | ( or ) | phrase | word``."""
+
+    def __init__(self, query: str) -> None:
+        self.tokens = QUERY_RE.findall(query)
+        self.pos = 0
+
+    def _peek(self) -> Optional[str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def parse(self) -> Optional[Node]:
+        node = self._or()
+        while self._peek() is not None:
+            # a stray ")" or operator; read on rather than reject the query
+            self.pos += 1
+            rest = self._or()
+            node = rest if node is None else node if rest is None else ("and", [node, rest])
+        return node
+
+    def _or(self) -> Optional[Node]:
+        children = [self._and()]
+        while self._peek() == "OR":
+            self.pos += 1
+            children.append(self._and())
+        children = [c for c in children if c is not None]
+        if len(children) > 1:
+            return ("or", children)
+        return children[0] if children else None
+
+    def _and(self) -> Optional[Node]:
+        children: List[Node] = []
+        while self._peek() not in (None, "OR", ")"):
+            if self._peek() == "AND":
+                self.pos += 1
+                continue
+            child = self._unary()
+            if child is not None:
+                children.append(child)
+        if len(children) > 1:
+            return ("and", children)
+        return children[0] if children else None
+
+    def _unary(self) -> Optional[Node]:
+        token = self.tokens[self.pos]
+        self.pos += 1
+        if token == "NOT" or (token.startswith("-") and len(token) > 1):
+            if token == "NOT":
+                child = self._unary() if self._peek() not in (None, "OR", ")") else None
+            else:
+                # "-word", '-"a phrase"' or "-(": parse what follows the dash
+                self.pos -= 1
+                self.tokens[self.pos] = token[1:]
+                child = self._unary()
+            return ("not", child) if child is not None else None
+        if token == "(":
+            node = self._or()
+            if self._peek() == ")":
+                self.pos += 1
+            return node
+        if token == ")":
+            return None
+        if token.startswith('"'):
+            words = tokenize(token.strip('"'))
+            if not words:
+                return None
+            return ("phrase", tuple(words)) if len(words) > 1 else ("term", words[0])
+        return _word(token)
+
+
+def parse_query(query: str) -> Optional[Node]:
+    """The query tree of ``query``, or ``None`` if it has no searchable words."""
+    return _Parser(query).parse()
+
+
+def _positive(node: Node) -> List[Node]:
+    """The terms, prefixes and phrases that count towards the score (not under a NOT)."""
+    kind = node[0]
+    if kind == "not":
+        return []
+    if kind in ("and", "or"):
+        return [leaf for child in node[1] for leaf in _positive(child)]
+    return [node]
+
+
+def _emotion_value(value: Any) -> float:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return np.nan
+
+
+def _concat(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.concatenate((a, b)) if len(a) else b
+
+
+class SearchIndex:
+    """Positional inverted index over every user's ``weekly_desc``.
+
+    Per term, ``_postings`` holds ``(docs, tfs, positions)``: the documents
+    containing it in ascending order, the term's count in each, and its
+    sorted positions on the shared token axis.  Document ``d`` covers the
+    positions ``starts[d]`` to ``starts[d] + lengths[d]``.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, store: DatasetStore, field: str = "weekly_desc") -> None:
+        self.store = store
+        self.field = field
+        self.version = -1
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        self._vocabulary: Optional[List[str]] = None
+        # per document
+        self._starts = np.empty(0, dtype=np.int64)
+        self._lengths = np.empty(0, dtype=np.int32)
+        self._users = np.empty(0, dtype=np.int32)
+        self._weeks = np.empty(0, dtype=np.int32)
+        self._live = np.empty(0, dtype=bool)
+        self._emotions = np.empty((0, len(EMOTION_DIMENSIONS)))
+        self._end = 0  # next free position on the token axis
+        self._user_ids: List[str] = []
+        self._user_pos: Dict[str, int] = {}
+        self._user_order: Optional[np.ndarray] = None  # rank of each user id in sorted order
+        # user -> (log stamp, week -> (document, hash of the narrative))
+        self._docs: Dict[str, Tuple[Optional[FileStamp], Dict[int, Tuple[int, int]]]] = {}
+        self._live_count = 0
+        self._live_tokens = 0
+        self._lock = threading.RLock()
+
+    # ----------------------------------------------------------------- updates
+    def refresh(self) -> None:
+        with self._lock:
+            users = self.store.emotion_users()
+            if self.store.version == self.version:
+                return
+            version = self.store.version
+            added: List[Tuple[str, int, List[str], np.ndarray]] = []
+            for user_id in list(self._docs):
+                if user_id not in users:
+                    for doc, _ in self._docs.pop(user_id)[1].values():
+                        self._kill(doc)
+            for user_id in users:
+                log = self.store.emotion_log(user_id)
+                if log is None:
+                    continue
+                cached = self._docs.get(user_id)
+                if cached is None or cached[0] != log.stamp:
+                    added.extend(self._sync_user(user_id, log))
+            if added:
+                self._add(added)
+            if len(self._live) - self._live_count > max(1024, self._live_count):
+                self._compact()
+            self.version = version
+
+    def _sync_user(self, user_id: str, log: Any) -> List[Tuple[str, int, List[str], np.ndarray]]:
+        """Kill the documents of ``user_id`` whose narrative changed or went away and
+        return the new ones to add; emotion values of unchanged weeks are updated in place."""
+        entries = log.entries()
+        # after the read, which catches the log up with the file
+        stamp = log.stamp
+        old = self._docs.get(user_id, (None, {}))[1]
+        docs: Dict[int, Tuple[int, int]] = {}
+        added = []
+        for entry in entries:
+            week = entry.get("week")
+            if week is None or int(week) in docs:
+                continue
+            week = int(week)
+            text = entry.get(self.field) or ""
+            digest = hash(text)
+            emotion = entry.get("emotion") or {}
+            values = np.array([_emotion_value(emotion.get(d)) for d in EMOTION_DIMENSIONS])
+            previous = old.pop(week, None)
+            if previous is not None and previous[1] == digest:
+                docs[week] = previous
+                self._emotions[previous[0]] = values
+                continue
+            if previous is not None:
+                self._kill(previous[0])
+            # the document id is filled in by _add
+            docs[week] = (-1, digest)
+            added.append((user_id, week, tokenize(text), values))
+        for doc, _ in old.values():
+            self._kill(doc)
+        self._docs[user_id] = (stamp, docs)
+        return added
+
+    def _kill(self, doc: int) -> None:
+        if doc >= 0 and self._live[doc]:
+            self._live[doc] = False
+            self._live_count -= 1
+            self._live_tokens -= int(self._lengths[doc])
+
+    def _add(self, added: List[Tuple[str, int, List[str], np.ndarray]]) -> None:
+        first = len(self._live)
+        lengths = np.array([len(tokens) for _, _, tokens, _ in added], dtype=np.int32)
+        # one empty slot after every document keeps phrases from running into the next
+        starts = self._end + np.concatenate(([0], np.cumsum(lengths[:-1] + 1))).astype(np.int64)
+        users = np.array([self._user_index(user_id) for user_id, _, _, _ in added], dtype=np.int32)
+        for i, (user_id, week, _, _) in enumerate(added):
+            self._docs[user_id][1][week] = (first + i, self._docs[user_id][1][week][1])
+
+        # every token of the batch, grouped by term with positions ascending within a term
+        terms = [t for _, _, tokens, _ in added for t in tokens]
+        if terms:
+            vocabulary = list(dict.fromkeys(terms))
+            ids = {term: i for i, term in enumerate(vocabulary)}
+            term_ids = np.array(list(map(ids.__getitem__, terms)), dtype=np.int64)
+            doc_of = np.repeat(np.arange(first, first + len(added), dtype=np.int32), lengths)
+            offsets = np.concatenate(([0], np.cumsum(lengths[:-1], dtype=np.int64)))
+            positions = np.repeat(starts - offsets, lengths) + np.arange(len(terms))
+            order = np.argsort(term_ids, kind="stable")
+            term_ids, doc_of, positions = term_ids[order], doc_of[order], positions[order].astype(np.int32)
+            bounds = np.flatnonzero(np.diff(term_ids)) + 1
+            los, his = np.concatenate(([0], bounds)), np.concatenate((bounds, [len(terms)]))
+            for term_id, lo, hi in zip(term_ids[los].tolist(), los.tolist(), his.tolist()):
+                term = vocabulary[term_id]
+                docs, tfs = np.unique(doc_of[lo:hi], return_counts=True)
+                docs, tfs = docs.astype(np.int32), tfs.astype(np.int32)
+                current = self._postings.get(term)
+                if current is None:
+                    self._postings[term] = (docs, tfs, positions[lo:hi])
+                    self._vocabulary = None
+                else:
+                    self._postings[term] = (_concat(current[0], docs), _concat(current[1], tfs),
+                                            _concat(current[2], positions[lo:hi]))
+
+        self._starts = _concat(self._starts, starts)
+        self._lengths = _concat(self._lengths, lengths)
+        self._users = _concat(self._users, users)
+        self._weeks = _concat(self._weeks, np.array([week for _, week, _, _ in added], dtype=np.int32))
+        self._live = _concat(self._live, np.ones(len(added), dtype=bool))
+        self._emotions = np.concatenate((self._emotions, np.array([values for _, _, _, values in added])))
+        self._end = int(starts[-1] + lengths[-1] + 1)
+        self._live_count += len(added)
+        self._live_tokens += int(lengths.sum())
+
+    def _user_index(self, user_id: str) -> int:
+        pos = self._user_pos.get(user_id)
+        if pos is None:
+            pos = self._user_pos[user_id] = len(self._user_ids)
+            self._user_ids.append(user_id)
+            self._user_order = None
+        return pos
+
+    def _compact(self) -> None:
+        """Drop dead documents and close the gaps they leave on the token axis."""
+        keep = self._live
+        new_id = np.cumsum(keep, dtype=np.int64) - 1
+        # positions removed before each document
+        span = self._lengths.astype(np.int64) + 1
+        shift = np.cumsum(np.where(keep, 0, span)) - np.where(keep, 0, span)
+        for term, (docs, tfs, positions) in list(self._postings.items()):
+            alive = keep[docs]
+            if not alive.any():
+                del self._postings[term]
+                self._vocabulary = None
+                continue
+            doc_of_pos = np.repeat(docs, tfs)
+            self._postings[term] = (
+                new_id[docs[alive]].astype(np.int32),
+                tfs[alive],
+                (positions - shift[doc_of_pos])[keep[doc_of_pos]].astype(np.int32),
+            )
+        self._starts = (self._starts - shift)[keep]
+        self._lengths = self._lengths[keep]
+        self._users = self._users[keep]
+        self._weeks = self._weeks[keep]
+        self._emotions = self._emotions[keep]
+        self._live = self._live[keep]
+        self._end = int(self._starts[-1] + self._lengths[-1] + 1) if len(self._starts) else 0
+        for stamp, docs in self._docs.values():
+            for week, (doc, digest) in docs.items():
+                docs[week] = (int(new_id[doc]), digest)
+
+    # ----------------------------------------------------------------- queries
+    def _vocab(self) -> List[str]:
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+        return self._vocabulary
+
+    def _leaf(self, node: Node) -> Tuple[np.ndarray, np.ndarray]:
+        """(documents, counts) of one term, prefix or phrase; dead documents included."""
+        kind = node[0]
+        if kind == "term":
+            posting = self._postings.get(node[1])
+            return (posting[0], posting[1]) if posting is not None else _NO_DOCS
+        if kind == "prefix":
+            vocab = self._vocab()
+            stem = node[1]
+            terms = []
+            for term in vocab[bisect_left(vocab, stem):]:
+                if not term.startswith(stem):
+                    break
+                terms.append(term)
+            if not terms:
+                return _NO_DOCS
+            if len(terms) > MAX_EXPANSIONS:
+                terms = sorted(terms, key=lambda t: -len(self._postings[t][0]))[:MAX_EXPANSIONS]
+            docs = np.concatenate([self._postings[t][0] for t in terms])
+            tfs = np.concatenate([self._postings[t][1] for t in terms])
+            docs, inverse = np.unique(docs, return_inverse=True)
+            return docs, np.bincount(inverse, weights=tfs).astype(np.int32)
+        return self._phrase(node[1])
+
+    def _phrase(self, words: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        postings = [self._postings.get(w) for w in words]
+        if any(p is None for p in postings):
+            return _NO_DOCS
+        # start from the rarest word: every match has it at a known offset
+        rarest = min(range(len(words)), key=lambda i: len(postings[i][2]))
+        starts = postings[rarest][2].astype(np.int64) - rarest
+        for i, posting in enumerate(postings):
+            if i == rarest or not len(starts):
+                continue
+            positions = posting[2]
+            wanted = starts + i
+            found = np.searchsorted(positions, wanted)
+            found[found == len(positions)] = 0
+            starts = starts[positions[found] == wanted]
+        if not len(starts):
+            return _NO_DOCS
+        docs, tfs = np.unique(np.searchsorted(self._starts, starts, side="right") - 1, return_counts=True)
+        return docs.astype(np.int32), tfs.astype(np.int32)
+
+    def _match(self, node: Node, leaves: Dict[Node, Tuple[np.ndarray, np.ndarray]]) -> np.ndarray:
+        kind = node[0]
+        if kind == "not":
+            return ~self._match(node[1], leaves)
+        if kind == "or":
+            mask = np.zeros(len(self._live), dtype=bool)
+            for child in node[1]:
+                mask |= self._match(child, leaves)
+            return mask
+        if kind == "and":
+            mask = np.ones(len(self._live), dtype=bool)
+            for child in node[1]:
+                mask &= self._match(child, leaves)
+            return mask
+        if node not in leaves:
+            leaves[node] = self._leaf(node)
+        mask = np.zeros(len(self._live), dtype=bool)
+        mask[leaves[node][0]] = True
+        return mask
+
+    def _scores(self, node: Node, leaves: Dict[Node, Tuple[np.ndarray, np.ndarray]]) -> np.ndarray:
+        """BM25 of every document, summed over the words, prefixes and phrases not under a NOT."""
+        scores = np.zeros(len(self._live))
+        if not self._live_count:
+            return scores
+        avgdl = self._live_tokens / self._live_count
+        for leaf in _positive(node):
+            docs, tfs = leaves[leaf]
+            if not len(docs):
+                continue
+            df = int(self._live[docs].sum())
+            idf = np.log(1.0 + (self._live_count - df + 0.5) / (df + 0.5))
+            norm = self.K1 * (1.0 - self.B + self.B * self._lengths[docs] / avgdl)
+            scores[docs] += idf * tfs * (self.K1 + 1.0) / (tfs + norm)
+        return scores
+
+    def _filter(
+        self,
+        users: Optional[Sequence[str]],
+        weeks: Optional[Sequence[int]],
+        thresholds: Sequence[Tuple[str, str, float]],
+    ) -> np.ndarray:
+        mask = self._live.copy()
+        if users is not None:
+            wanted = [self._user_pos[u] for u in users if u in self._user_pos]
+            mask &= np.isin(self._users, wanted)
+        if weeks is not None:
+            mask &= np.isin(self._weeks, list(weeks))
+        for dimension, op, value in thresholds:
+            mask &= COMPARISONS[op](self._emotions[:, EMOTION_DIMENSIONS.index(dimension)], value)
+        return mask
+
+    def _user_ranks(self) -> np.ndarray:
+        if self._user_order is None:
+            ranks = np.empty(len(self._user_ids), dtype=np.int32)
+            ranks[sorted(range(len(self._user_ids)), key=self._user_ids.__getitem__)] = np.arange(len(self._user_ids))
+            self._user_order = ranks
+        return self._user_order
+
+    def search(
+        self,
+        query: str,
+        users: Optional[Sequence[str]] = None,
+        weeks: Optional[Sequence[int]] = None,
+        thresholds: Sequence[Tuple[str, str, float]] = (),
+        limit: int = 20,
+        offset: int = 0,
+    ) -> Dict[str, Any]:
+        """Weeks matching ``query`` and the filters, best BM25 score first (then by
+        user and week), each with a highlighted snippet of its narrative.
+
+        ``thresholds`` are ``(dimension, operator, value)`` tests on the week's
+        emotion values, e.g. ``("stress", ">", 70)``.  An empty query matches
+        every week that passes the filters; a non-empty one without any search
+        terms (e.g. ``"()"`` or ``"OR"``) raises ``ValueError``.
+        """
+        node = parse_query(query)
+        if node is None and query.strip():
+            raise ValueError("query has no search terms")
+        self.refresh()
+        with self._lock, phase("filter"):
+            mask = self._filter(users, weeks, thresholds)
+            leaves: Dict[Node, Tuple[np.ndarray, np.ndarray]] = {}
+            if node is not None:
+                mask &= self._match(node, leaves)
+                scores = self._scores(node, leaves)
+            else:
+                scores = np.zeros(len(self._live))
+            hits = np.flatnonzero(mask)
+            total = len(hits)
+            wanted = offset + limit
+            if total > wanted:
+                # only the documents scoring at least the wanted-th best need sorting
+                cutoff = np.partition(scores[hits], total - wanted)[total - wanted]
+                hits = hits[scores[hits] >= cutoff]
+            order = np.lexsort((self._weeks[hits], self._user_ranks()[self._users[hits]], -scores[hits]))
+            page = [
+                (self._user_ids[self._users[doc]], int(self._weeks[doc]), float(scores[doc]), self._emotions[doc])
+                for doc in hits[order][offset:wanted]
+            ]
+        pattern = highlighter(_positive(node)) if node is not None else None
+        results = []
+        for user_id, week, score, values in page:
+            log = self.store.emotion_log(user_id)
+            entry = log.entry(week) if log is not None else None
+            if entry is None:
+                # changed since the query ran
+                entry = {"emotion": {d: None if np.isnan(v) else float(v) for d, v in zip(EMOTION_DIMENSIONS, values)}}
+            with phase("serialize"):
+                results.append({
+                    "user_id": user_id,
+                    "week": week,
+                    "score": round(score, 4),
+                    "emotion": entry.get("emotion"),
+                    "snippet": snippet(entry.get(self.field) or "", pattern),
+                })
+        return {"query": query, "total": total, "offset": offset, "limit": limit, "results": results}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "documents": self._live_count,
+            "dead_documents": len(self._live) - self._live_count,
+            "terms": len(self._postings),
+            "tokens": self._live_tokens,
+        }
+
+
+_NO_DOCS = (np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32))
+
+
+def highlighter(leaves: Sequence[Node]) -> Optional["re.Pattern[str]"]:
+    """A pattern matching the query's words, prefixes and phrases in the original text."""
+    parts = []
+    for leaf in leaves:
+        if leaf[0] == "phrase":
+            parts.append(r"\W+".join(re.escape(w) for w in leaf[1]))
+        elif leaf[0] == "prefix":
+            parts.append(re.escape(leaf[1]) + r"\w*(?:['’]\w+)*")
+        else:
+            parts.append(re.escape(leaf[1]))
+    if not parts:
+        return None
+    # longest first, so a phrase wins over its own words; whole tokens only, as TOKEN_RE splits them
+    parts.sort(key=len, reverse=True)
+    return re.compile(r"(?<!\w)(?<!\w['’])(?:" + "|".join(parts) + r")(?!\w|['’]\w)", re.IGNORECASE)
+
+
+def _break_before(text: str, pos: int) -> int:
+    return max(text.rfind(c, 0, pos) for c in " \n\t") + 1
+
+
+def _break_after(text: str, pos: int) -> int:
+    found = [i for i in (text.find(c, pos) for c in " \n\t") if i >= 0]
+    return min(found) if found else len(text)
+
+
+def snippet(text: str, pattern: Optional["re.Pattern[str]"], width: int = SNIPPET_CHARS) -> str:
+    """HTML-escaped stretch of about ``width`` characters of ``text`` holding the
+    most matches of ``pattern``, with the matches in ``<mark>``."""
+    matches = [m.span() for m in pattern.finditer(text)] if pattern is not None else []
+    starts = [a for a, _ in matches]
+    # the window holding the most matches, opening a little before its first one
+    lo = 0
+    if matches:
+        best = -1
+        for a in starts:
+            start = max(0, a - width // 4)
+            count = bisect_left(starts, start + width) - bisect_left(starts, start)
+            if count > best:
+                lo, best = start, count
+    lo = _break_before(text, lo) if lo else 0
+    hi = _break_after(text, lo + width) if lo + width < len(text) else len(text)
+    for a, b in matches:
+        if a < hi < b:
+            hi = b
+
+    parts = ["…" if lo else ""]
+    pos = lo
+    for a, b in matches:
+        if a < lo or b > hi:
+            continue
+        parts.append(html.escape(text[pos:a], quote=False))
+        parts.append("<mark>" + html.escape(text[a:b], quote=False) + "</mark>")
+        pos = b
+    parts.append(html.escape(text[pos:hi], quote=False))
+    if hi < len(text):
+        parts.append("…")
+    return " ".join("".join(parts).split())
@@ -0,0 +1,163 @@
+"""Production launcher: load the dataset once, then fork uvicorn workers.
+
+The parent process parses (or maps) the whole dataset and builds every
+derived index and cohort aggregate before forking, so all workers start
+ready without parsing anything themselves.  Only the large numpy buffers and
+the memory-mapped compiled store stay shared between workers: Python objects
+(frames' index and object columns, dicts, strings) get their pages copied
+into a worker as soon as it touches them, because reading an object writes
+its reference count.  ``gc.freeze()`` merely stops the collector from
+touching every object too, so size each worker's memory for its own copy of
+the object data.  Workers accept connections on one socket bound by the
+parent, and a worker that dies is replaced.
+
+    python -m scripts.serve --workers 4 --host 0.0.0.0 --port 8089
+
+``API_WORKERS``, ``API_HOST`` and ``API_PORT`` set the defaults (1 worker on
+127.0.0.1:8089).  With more than one worker, chat sessions are kept in a
+SQLite file shared by the workers (``CHAT_SESSION_PATH``, a temporary file
+unless set).
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import tempfile
+import time
+import traceback
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+# a worker exiting sooner than this after its start counts as a crash loop
+MIN_WORKER_UPTIME = 1.0
+
+
+def _bind(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _server(api_server: Any, args: argparse.Namespace) -> Any:
+    import uvicorn
+
+    config = uvicorn.Config(
+        api_server.app,
+        log_level=args.log_level,
+        access_log=args.access_log,
+        timeout_keep_alive=args.keep_alive,
+    )
+    return uvicorn.Server(config)
+
+
+def _run_worker(api_server: Any, args: argparse.Namespace, sock: socket.socket) -> None:
+    # the parent's handlers forward signals; uvicorn installs its own for a graceful stop
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    api_server.after_fork()
+    _server(api_server, args).run(sockets=[sock])
+
+
+def _supervise(api_server: Any, args: argparse.Namespace, sock: socket.socket) -> None:
+    workers: Dict[int, float] = {}
+    stopping = False
+
+    def spawn() -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(api_server, args, sock)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            # never fall back into the supervisor loop or run the parent's cleanup
+            os._exit(code)
+        workers[pid] = time.monotonic()
+
+    def stop(signum: int, _frame: Any) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for _ in range(args.workers):
+        spawn()
+    print(f"serving on http://{args.host}:{args.port} with {args.workers} workers (pids {sorted(workers)})", flush=True)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        started = workers.pop(pid, None)
+        if started is None or stopping:
+            continue
+        code = os.waitstatus_to_exitcode(status)
+        print(f"worker {pid} exited with status {code}; starting a new one", file=sys.stderr, flush=True)
+        if time.monotonic() - started < MIN_WORKER_UPTIME:
+            time.sleep(MIN_WORKER_UPTIME)
+        spawn()
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=int(os.getenv("API_WORKERS", "1")))
+    parser.add_argument("--host", default=os.getenv("API_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", "8089")))
+    parser.add_argument("--lazy", action="store_true", help="only load the dataset; build indexes and aggregates on first use")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--no-access-log", dest="access_log", action="store_false")
+    parser.add_argument("--keep-alive", type=int, default=5, help="seconds an idle keep-alive connection stays open")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.workers > 1 and not hasattr(os, "fork"):
+        parser.error("multiple workers need os.fork(); run one worker per process instead")
+
+    session_file: Optional[Path] = None
+    if args.workers > 1 and not os.getenv("CHAT_SESSION_PATH"):
+        # sessions must be visible to whichever worker gets the next turn
+        session_file = Path(tempfile.gettempdir()) / f"api-chat-sessions-{os.getpid()}.sqlite"
+        os.environ["CHAT_SESSION_PATH"] = str(session_file)
+
+    # imported after CHAT_SESSION_PATH is settled: the module builds its stores on import
+    from scripts import api_server
+
+    start = time.perf_counter()
+    api_server.preload(warm=not args.lazy)
+    print(f"loaded {len(api_server.DATASET.users())} users in {time.perf_counter() - start:.2f}s", flush=True)
+
+    sock = _bind(args.host, args.port)
+    try:
+        if args.workers == 1:
+            _server(api_server, args).run(sockets=[sock])
+        else:
+            # keep the GC from touching, and so copying, every object loaded so far
+            gc.collect()
+            gc.freeze()
+            _supervise(api_server, args, sock)
+    finally:
+        sock.close()
+        if session_file is not None:
+            for suffix in ("", "-wal", "-shm"):
+                Path(f"{session_file}{suffix}").unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS_M = 6_371_008.8
+# "43.70672295,-72.28910432"; anything else (survey answers, junk) is not a coordinate
+COORD_RE = r"^\s*([-+]?\d+(?:\.\d+)?)\s*,\s*([-+]?\d+(?:\.\d+)?)\s*$"
+
+
+def parse_coordinates(values: Sequence[Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """``(lat, lon)`` float arrays for a column of ``"lat,lon"`` strings, parsed in one
+    regex pass; NaN wherever the value is missing, not a string or out of range."""
+    series = pd.Series(values, dtype=object)
+    strings = series.where(series.map(type) == str)
+    parts = strings.str.extract(COORD_RE).astype(np.float64)
+    lat, lon = parts[0].to_numpy(), parts[1].to_numpy()
+    with np.errstate(invalid="ignore"):
+        bad = (np.abs(lat) > 90) | (np.abs(lon) > 180)
+    lat[bad] = np.nan
+    lon[bad] = np.nan
+    return lat, lon
+
+
+class GridIndex:
+    """Nearest-point lookups over a fixed set of ``(lat, lon)`` points, up to ``cell_m`` meters away.
+
+    Points are projected onto a local equirectangular plane and bucketed into
+    square cells ``cell_m`` wide.  Anything within ``cell_m`` of a query lies in
+    the query's cell or one of its eight neighbours, so queries are grouped by
+    cell and each group is measured against those candidates only.
+    """
+
+    __slots__ = ("cell_m", "lat0", "lon0", "cos0", "x", "y", "_cells", "_candidates")
+
+    def __init__(self, lat: Sequence[float], lon: Sequence[float], cell_m: float) -> None:
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        self.cell_m = float(cell_m)
+        self.lat0 = float(lat.mean()) if len(lat) else 0.0
+        self.lon0 = float(lon.mean()) if len(lon) else 0.0
+        self.cos0 = float(np.cos(np.radians(self.lat0)))
+        self.x, self.y = self._project(lat, lon)
+        self._cells: Dict[Tuple[int, int], List[int]] = {}
+        for i, key in enumerate(zip(*self._cell(self.x, self.y))):
+            self._cells.setdefault((int(key[0]), int(key[1])), []).append(i)
+        self._candidates: Dict[Tuple[int, int], np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+    def _project(self, lat: np.ndarray, lon: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        x = np.radians(lon - self.lon0) * self.cos0 * EARTH_RADIUS_M
+        y = np.radians(lat - self.lat0) * EARTH_RADIUS_M
+        return x, y
+
+    def _cell(self, x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return np.floor(x / self.cell_m).astype(np.int64), np.floor(y / self.cell_m).astype(np.int64)
+
+    def _near(self, cx: int, cy: int) -> np.ndarray:
+        candidates = self._candidates.get((cx, cy))
+        if candidates is None:
+            found = [i for dx in (-1, 0, 1) for dy in (-1, 0, 1) for i in self._cells.get((cx + dx, cy + dy), ())]
+            candidates = self._candidates[(cx, cy)] = np.array(sorted(found), dtype=np.int64)
+        return candidates
+
+    def nearest(self, lat: Sequence[float], lon: Sequence[float]) -> Tuple[np.ndarray, np.ndarray]:
+        """Index of the nearest point within ``cell_m`` of each query (-1 if none) and its
+        distance in meters (NaN if none).  NaN queries match nothing."""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        found = np.full(len(lat), -1, dtype=np.int64)
+        dist = np.full(len(lat), np.nan)
+        queries = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+        if not len(queries) or not len(self):
+            return found, dist
+        x, y = self._project(lat[queries], lon[queries])
+        cx, cy = self._cell(x, y)
+        order = np.lexsort((cy, cx))
+        edges = np.flatnonzero(np.r_[True, (np.diff(cx[order]) != 0) | (np.diff(cy[order]) != 0), True])
+        for lo, hi in zip(edges[:-1], edges[1:]):
+            rows = order[lo:hi]
+            candidates = self._near(int(cx[rows[0]]), int(cy[rows[0]]))
+            if not len(candidates):
+                continue
+            d = np.hypot(x[rows, None] - self.x[candidates], y[rows, None] - self.y[candidates])
+            best = d.argmin(axis=1)
+            best_d = d[np.arange(len(rows)), best]
+            hit = best_d <= self.cell_m
+            found[queries[rows[hit]]] = candidates[best[hit]]
+            dist[queries[rows[hit]]] = best_d[hit]
+        return found, dist
+
+
+def frame_coordinates(columns: Dict[str, List[Any]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Coordinates of each row of a survey frame: its ``location`` column, or the
+    ``null`` column for rows where a misaligned header pushed the fix there."""
+    length = len(next(iter(columns.values()))) if columns else 0
+    none = [None] * length
+    lat, lon = parse_coordinates(columns.get("location", none))
+    if "null" in columns:
+        null_lat, null_lon = parse_coordinates(columns["null"])
+        missing = np.isnan(lat)
+        lat[missing] = null_lat[missing]
+        lon[missing] = null_lon[missing]
+    return lat, lon
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# named bucket widths accepted besides pandas offsets such as "15min", "6h" or "2D"
+BUCKET_ALIASES = {"minute": "1min", "hour": "1h", "hourly": "1h", "day": "1D", "daily": "1D", "week": "7D", "weekly": "7D"}
+NS_PER_SECOND = 1_000_000_000
+NS_PER_DAY = 86_400 * NS_PER_SECOND
+# widths ``max_points`` may widen a bucket to, kept only if they are whole multiples of it
+WIDTH_LADDER = tuple(
+    int(pd.Timedelta(w).value)
+    for w in ("1s", "10s", "1min", "5min", "15min", "30min", "1h", "2h", "6h", "12h", "1D", "2D", "7D")
+)
+
+
+def parse_time(value: str) -> int:
+    """Nanoseconds since the epoch for an ISO date/datetime; aware values are taken as UTC."""
+    ts = pd.Timestamp(value)
+    if ts is pd.NaT:
+        raise ValueError(f"not a timestamp: {value!r}")
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert(None)
+    return int(ts.value)
+
+
+def parse_bucket(spec: str) -> int:
+    """Bucket width in nanoseconds, at least one second."""
+    width = pd.Timedelta(BUCKET_ALIASES.get(spec.strip().lower(), spec.strip()))
+    if width is pd.NaT or width.value < NS_PER_SECOND:
+        raise ValueError(f"bucket must be at least one second: {spec!r}")
+    return int(width.value)
+
+
+def bucket_origin(lo: int, width: int) -> int:
+    """Start of the bucket holding ``lo``: ``lo`` rounded down to the largest step
+    dividing both ``width`` and a day, so hourly buckets start on the hour and
+    daily ones at midnight (UTC)."""
+    step = math.gcd(width, NS_PER_DAY)
+    return lo // step * step
+
+
+def buckets(ns: np.ndarray, width: int, origin: int = 0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Group time-sorted ``ns`` into buckets of ``width`` starting at ``origin``.
+
+    Returns ``(bucket start ns, index of each bucket's first row, bucket of each row)``.
+    """
+    ids = (ns - origin) // width
+    if not len(ids):
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.int64)
+    first = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    inverse = np.cumsum(np.r_[False, ids[1:] != ids[:-1]])
+    return origin + ids[first] * width, first, inverse
+
+
+def aligned_buckets(ns: np.ndarray, width: int, lo: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """``buckets`` starting at ``bucket_origin(lo)`` (``lo`` defaults to the first
+    sample), with the first bucket stamped no earlier than its first sample."""
+    if not len(ns):
+        return buckets(ns, width)
+    starts, first, inverse = buckets(ns, width, bucket_origin(int(ns[0]) if lo is None else lo, width))
+    return np.maximum(starts, ns[0]), first, inverse
+
+
+def bucket_mean(values: np.ndarray, inverse: np.ndarray, n_buckets: int) -> np.ndarray:
+    """Mean of the non-NaN ``values`` per bucket (NaN for buckets without any)."""
+    valid = ~np.isnan(values)
+    sums = np.bincount(inverse, weights=np.where(valid, values, 0.0), minlength=n_buckets)
+    counts = np.bincount(inverse, weights=valid, minlength=n_buckets)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def bucket_mode(codes: np.ndarray, inverse: np.ndarray, n_buckets: int) -> np.ndarray:
+    """Row index of each bucket's most frequent code.
+
+    ``codes`` are category codes with ``-1`` for missing values, which only win
+    a bucket that has nothing else; ties go to the value seen first.
+    """
+    if not len(codes):
+        return np.empty(0, np.int64)
+    width = int(codes.max()) + 2
+    keys = inverse.astype(np.int64) * width + (codes.astype(np.int64) + 1)
+    uniq, first, counts = np.unique(keys, return_index=True, return_counts=True)
+    bucket = uniq // width
+    missing = (uniq % width) == 0
+    order = np.lexsort((first, -counts, missing, bucket))
+    winners = order[np.r_[True, bucket[order][1:] != bucket[order][:-1]]]
+    return first[winners]
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Indices of the points kept by Largest-Triangle-Three-Buckets downsampling.
+
+    The first and last points are always kept; ``x`` must be sorted.
+    """
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1][:max(n_out, 0)], dtype=np.int64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo = edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_lo:next_hi].mean()
+        avg_y = y[next_lo:next_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def widen_to_fit(ns: np.ndarray, width: Optional[int], max_points: int, lo: Optional[int] = None) -> int:
+    """Narrowest bucket width giving time-sorted ``ns`` at most ``max_points`` buckets.
+
+    Starting from ``width`` (one second if unset), only ``WIDTH_LADDER`` steps that
+    are whole multiples of it are tried, then doublings of the widest one, so an
+    hourly bucket widens to 2h, 6h, 12h, 1D, 2D, 7D, 14D...  Buckets start at
+    ``bucket_origin(lo)``, ``lo`` defaulting to the first sample.
+    """
+    base = width or NS_PER_SECOND
+    if not len(ns):
+        return base
+    lo = int(ns[0]) if lo is None else lo
+    candidate = base
+    ladder = iter(w for w in WIDTH_LADDER if w > base and w % base == 0)
+    while np.count_nonzero(np.diff((ns - bucket_origin(lo, candidate)) // candidate)) + 1 > max_points:
+        candidate = next(ladder, candidate * 2)
+    return candidate
@@ -0,0 +1,79 @@
+import contextlib
+import time
+from typing import Any, Iterator
+
+import httpx
+import pytest
+
+from scripts import api_server
+from scripts.benchmarks.chat_stream import CHAT_BODY, iter_sse
+from scripts.benchmarks.fake_gemini import create_fake_gemini_app, serve_in_thread
+
+STREAM_BODY = {**CHAT_BODY, "stream": True}
+
+
+@pytest.fixture(scope="module")
+def base() -> Iterator[str]:
+    with serve_in_thread(api_server.app) as url:
+        yield url
+
+
+@pytest.fixture
+def client() -> Iterator[httpx.Client]:
+    with httpx.Client(timeout=30) as client:
+        yield client
+
+
+@contextlib.contextmanager
+def fake_upstream(**kwargs: Any) -> Iterator[Any]:
+    """The fake Gemini app, served and set as the chat upstream while in use."""
+    app = create_fake_gemini_app(**kwargs)
+    api_base = api_server.GEMINI.api_base
+    with serve_in_thread(app) as url:
+        api_server.GEMINI.api_base = url
+        try:
+            yield app
+        finally:
+            api_server.GEMINI.api_base = api_base
+
+
+@pytest.fixture
+def upstream() -> Iterator[Any]:
+    # chunks 0.2s apart: a buffered reply would only start once the last one is sent
+    with fake_upstream(latency=0.05, chunk_delay=0.2) as app:
+        yield app
+
+
+def test_first_chunk_arrives_before_upstream_finishes(base, client, upstream):
+    with client.stream("POST", f"{base}/api/chat", json=STREAM_BODY) as response:
+        assert response.status_code == 200
+        events = iter_sse(response)
+        event, data = next(events)
+        assert event == "chunk"
+        assert upstream.state.finished_streams == 0
+        texts = [data["text"]]
+        for event, data in events:
+            if event != "chunk":
+                break
+            texts.append(data["text"])
+    assert event == "done"
+    assert data["response"] == "".join(texts)
+    assert upstream.state.finished_streams == 1
+
+
+def test_upstream_error_ends_with_error_event(base, client):
+    with fake_upstream(fail_first=10**6, fail_status=400):
+        with client.stream("POST", f"{base}/api/chat", json=STREAM_BODY) as response:
+            events = list(iter_sse(response))
+    assert [e for e, _ in events] == ["error"]
+    assert events[0][1]["status"] == 400
+
+
+def test_client_disconnect_cancels_upstream(base, client, upstream):
+    with client.stream("POST", f"{base}/api/chat", json=STREAM_BODY) as response:
+        assert next(iter_sse(response))[0] == "chunk"
+    deadline = time.monotonic() + 5
+    while not upstream.state.cancelled_streams and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert upstream.state.cancelled_streams == 1
+    assert upstream.state.finished_streams == 0
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+from scripts.timeseries import aligned_buckets, parse_bucket, widen_to_fit
+
+HOUR = parse_bucket("hour")
+
+
+def _samples(start: str, periods: int, every: str) -> np.ndarray:
+    return pd.date_range(start, periods=periods, freq=every).asi8
+
+
+def test_hourly_buckets_widen_to_whole_hours_within_range():
+    # three days of samples every 7 minutes, starting off the hour
+    ns = _samples("2024-03-04 08:13", 3 * 24 * 60 // 7, "7min")
+    start = int(pd.Timestamp("2024-03-04 08:00").value)
+
+    width = widen_to_fit(ns, HOUR, 20, start)
+    starts, first, _ = aligned_buckets(ns, width, start)
+
+    assert width % HOUR == 0 and width > HOUR
+    assert len(starts) <= 20
+    assert (starts >= ns[0]).all()
+    assert (starts <= ns[first]).all()
+    # every bucket after the clamped first one starts on the hour
+    assert (starts[1:] % HOUR == 0).all()
+
+
+def test_first_bucket_is_clamped_to_first_sample():
+    ns = _samples("2024-03-04 08:13", 10, "10min")
+
+    starts, _, _ = aligned_buckets(ns, HOUR)
+
+    assert starts[0] == ns[0]
+    assert starts[1] == pd.Timestamp("2024-03-04 09:00").value
+
+
+def test_widen_keeps_requested_bucket_when_it_fits():
+    ns = _samples("2024-03-04 08:00", 48, "1h")
+
+    assert widen_to_fit(ns, HOUR, 48) == HOUR
+    assert widen_to_fit(ns, HOUR, 24) == 2 * HOUR
+    assert widen_to_fit(ns, HOUR, 5) == 12 * HOUR
@@ -1,8 +1,8 @@
 import { useCallback, useEffect, useMemo, useRef, useState } from 'react'
 import './App.css'
-import type { EmotionEntry, LocationRecord, UserProfile } from './api'
-import { getDays, getEmotions, getLocations, getUserProfile, listWeeks } from './api'
-import { CAMPUS_PLACES, matchPlaceByText } from './geo'
+import type { EmotionEntry, LocationRecord, ProfileSummary, UserProfile, WeekBundle } from './api'
+import { getEmotions, getProfiles, getUserProfile, getWeekBundle, listWeeks, streamChat, streamSemester, subscribeLive } from './api'
+import { CAMPUS_PLACES, placeForRecord } from './geo'
 
 // Animation types
 type AnimatedPosition = {
@@ -57,6 +57,14 @@ type AnimationState = {
   pathHistory: AnimatedPosition[]
 }
 
+// "u01 · O78 C89 E63 A76 N55" for the student picker
+function profileLabel(userId: string, profile?: ProfileSummary): string {
+  if (!profile) return userId
+  const b = profile.big_five
+  const scores = [['O', b.openness], ['C', b.conscientiousness], ['E', b.extraversion], ['A', b.agreeableness], ['N', b.neuroticism]] as const
+  return `${userId} · ${scores.map(([k, v]) => `${k}${Math.round(v)}`).join(' ')}`
+}
+
 function Select({ value, onChange, options, label }: { value: string | number; onChange: (v: string) => void; options: Array<{ value: string; label: string }>; label: string }) {
   const getLabelColor = (label: string) => {
     const colors = {
@@ -97,6 +105,7 @@ function App() {
   const animationIntervalRef = useRef<ReturnType<typeof setInterval> | null>(null)
   const [isDebouncing, setIsDebouncing] = useState(false)
   const [users, setUsers] = useState<string[]>([])
+  const [profiles, setProfiles] = useState<Record<string, ProfileSummary>>({})
   const [user, setUser] = useState<string>('u01')
   const [weeks, setWeeks] = useState<number[]>([])
   const [week, setWeek] = useState<number>(1)
@@ -188,18 +197,19 @@ function App() {
   }, [])
 
   useEffect(() => {
-  // Fetch user list from backend API
-  fetch('http://localhost:8089/api/users') // <-- add http://localhost:8089
-    .then(res => res.json())
-    .then(data => {
-      if (Array.isArray(data.users)) {
-        setUsers(data.users)
-        // Set default user if current user is not in the list
-        if (!data.users.includes(user)) setUser(data.users[0] ?? '')
-      }
+  // Fetch every profile once; the picker and profile card read from this map
+  getProfiles()
+    .then(list => {
+      const byUser: Record<string, ProfileSummary> = {}
+      for (const p of list) byUser[p.user_id] = p
+      setProfiles(byUser)
+      const ids = list.map(p => p.user_id)
+      setUsers(ids)
+      // Set default user if current user is not in the list
+      setUser(current => (ids.includes(current) ? current : ids[0] ?? ''))
     })
     .catch(console.error)
-}, [user])
+}, [])
   useEffect(() => {
   if (isDebouncing) {
     const timeout = setTimeout(() => setIsDebouncing(false), 700) // 700ms delay
@@ -257,38 +267,113 @@ function App() {
       })
       .catch(console.error)
     getEmotions(user).then(setEmotions).catch(console.error)
-    getUserProfile(user).then(setUserProfile).catch(console.error)
     // Clear chat when switching users
     setChatMessages([])
   }, [user, week])
 
   useEffect(() => {
-    getDays(user, week)
-      .then((ds) => {
-        setDays(ds)
-        // Only set to first day if no day is currently selected or if current day is not in the new list
-        if (!day || !ds.includes(day)) {
-          const newDay = ds[0] ?? ''
-          setDay(newDay)
-          setTimeIndex(-1)
+    if (!user) return
+    if (profiles[user]) setUserProfile(profiles[user])
+    else getUserProfile(user).then(setUserProfile).catch(console.error)
+  }, [user, profiles])
+
+  // Week bundles (days + every day's locations) keyed by `${user}:${week}`,
+  // warmed by the semester stream so playback rarely has to wait on the API
+  const bundleCacheRef = useRef<Map<string, WeekBundle>>(new Map())
+  const [bundle, setBundle] = useState<WeekBundle | null>(null)
+
+  useEffect(() => {
+    const controller = new AbortController()
+    streamSemester(user, (b) => {
+      bundleCacheRef.current.set(`${user}:${b.week}`, b)
+    }, controller.signal).catch(() => { /* per-week fetch below is the fallback */ })
+    return () => controller.abort()
+  }, [user])
+
+  useEffect(() => {
+    let cancelled = false
+    const applyBundle = (b: WeekBundle) => {
+      if (cancelled) return
+      setBundle(b)
+      setDays(b.days)
+    }
+    const key = `${user}:${week}`
+    const cached = bundleCacheRef.current.get(key)
+    if (cached) {
+      applyBundle(cached)
+    } else {
+      getWeekBundle(user, week)
+        .then((b) => {
+          bundleCacheRef.current.set(key, b)
+          applyBundle(b)
+        })
+        .catch(console.error)
+    }
+    return () => { cancelled = true }
+  }, [user, week])
+
+  // Apply simulation output as the server pushes it, instead of polling
+  const liveWeekRef = useRef(week)
+  liveWeekRef.current = week
+  useEffect(() => {
+    if (!user) return
+    const cache = bundleCacheRef.current
+    const refetch = (w: number) => {
+      cache.delete(`${user}:${w}`)
+      if (w !== liveWeekRef.current) return
+      getWeekBundle(user, w)
+        .then((b) => {
+          cache.set(`${user}:${w}`, b)
+          if (w === liveWeekRef.current) { setBundle(b); setDays(b.days) }
+        })
+        .catch(console.error)
+    }
+    return subscribeLive([user], (e) => {
+      if (e.type === 'reset') {
+        listWeeks(user).then(setWeeks).catch(console.error)
+        getEmotions(user).then(setEmotions).catch(console.error)
+        for (const key of [...cache.keys()]) if (key.startsWith(`${user}:`)) cache.delete(key)
+        refetch(liveWeekRef.current)
+      } else if (e.type === 'week' && e.week != null) {
+        if (e.weeks) setWeeks(e.weeks)
+        if (e.bundle) {
+          cache.set(`${user}:${e.week}`, e.bundle)
+          if (e.week === liveWeekRef.current) { setBundle(e.bundle); setDays(e.bundle.days) }
+        } else {
+          cache.delete(`${user}:${e.week}`)
         }
-      })
-      .catch(console.error)
-  }, [user, week, day])
+      } else if (e.type === 'emotions' && e.weeks) {
+        const changed = new Set(e.weeks)
+        const entries = e.entries ?? []
+        setEmotions(prev => [...prev.filter(x => !changed.has(x.week)), ...entries].sort((a, b) => a.week - b.week))
+        e.weeks.forEach(refetch)
+      } else if (e.type === 'status') {
+        // status series span every week; drop them all and reload the one on screen
+        for (const key of [...cache.keys()]) if (key.startsWith(`${user}:`)) cache.delete(key)
+        refetch(liveWeekRef.current)
+      }
+    })
+  }, [user])
 
   // Track previous day and week to detect manual changes
   const prevDayRef = useRef<string>('')
   const prevWeekRef = useRef<number>(0)
   
   useEffect(() => {
-    if (!day) return
-    getLocations(user, week, day).then((recs) => {
-      // ensure chronological order
-      const sorted = [...recs].sort((a, b) => new Date(a.time).getTime() - new Date(b.time).getTime())
-      setLocations(sorted)
-      setTimeIndex(sorted.length > 0 ? 0 : -1) 
-    }).catch(console.error)
-  }, [user, week, day])
+    if (!bundle) return
+    // Move to the first day only if the current day is not part of this week
+    if (!day || !bundle.days.includes(day)) {
+      const firstDay = bundle.days[0] ?? ''
+      setTimeIndex(-1)
+      if (firstDay !== day) setDay(firstDay)
+      return
+    }
+    const recs = bundle.locations[day] ?? []
+    // ensure chronological order
+    const sorted = [...recs].sort((a, b) => new Date(a.time).getTime() - new Date(b.time).getTime())
+    setLocations(sorted)
+    setTimeIndex(sorted.length > 0 ? 0 : -1)
+  }, [bundle, day])
 
   // Handle manual day changes
   useEffect(() => {
@@ -311,7 +396,7 @@ function App() {
 
   // Animation helper functions
   const createAnimatedPosition = useCallback((record: LocationRecord): AnimatedPosition | null => {
-    const place = matchPlaceByText(record.location_des || record.activity || record.location || undefined)
+    const place = placeForRecord(record)
     if (!place) return null
     
     return {
@@ -396,7 +481,7 @@ function App() {
     // filter by layer
     const classPlaces = new Set<string>(['hall1','hall2','study building','library','main building'])
     return sub.filter(rec => {
-      const place = matchPlaceByText(rec.location_des || rec.activity || rec.location || undefined)
+      const place = placeForRecord(rec)
       if (!place) return false
       if (layer === 'Activity') return true
       if (layer === 'Class') return classPlaces.has(place.key)
@@ -422,7 +507,7 @@ function App() {
   const clustered = useMemo(() => {
     const map = new Map<string, { count: number; x: number; y: number; label: string }>()
     for (const rec of visibleLocations) {
-      const place = matchPlaceByText(rec.location_des || rec.activity || rec.location || undefined)
+      const place = placeForRecord(rec)
       if (!place) continue
       const k = place.key
       const ent = map.get(k)
@@ -529,17 +614,22 @@ function App() {
           weeklyDesc: weeklyDescription,
           week: week
         };
-        console.log("Request Body Payload:", JSON.stringify(requestBody, null, 2));
-        const response = await fetch('http://localhost:8089/api/chat', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(requestBody)
-      });
-
-      if (!response.ok) throw new Error('Chat request failed')
-      
-      const data = await response.json()
-      setChatMessages(prev => [...prev, { role: 'assistant', content: data.response }])
+        // Stream the reply: the assistant bubble appears with the first chunk
+        let started = false
+        await streamChat(requestBody, (delta) => {
+          if (!started) {
+            started = true
+            setIsLoading(false)
+            setChatMessages(prev => [...prev, { role: 'assistant', content: delta }])
+            return
+          }
+          setChatMessages(prev => {
+            const next = [...prev]
+            const last = next[next.length - 1]
+            next[next.length - 1] = { ...last, content: last.content + delta }
+            return next
+          })
+        })
     } catch (error) {
       console.error('Chat error:', error)
       let errorMessage = 'Sorry, I encountered an error. '
@@ -623,7 +713,7 @@ function App() {
       
       {/* Top Controls */}
       <div style={{ display: 'flex', alignItems: 'center', gap: 12, flexWrap: 'wrap', marginBottom: 8 }}>
-        <Select value={user} onChange={(v) => setUser(v)} options={users.map((u) => ({ value: u, label: u }))} label="Student" />
+        <Select value={user} onChange={(v) => setUser(v)} options={users.map((u) => ({ value: u, label: profileLabel(u, profiles[u]) }))} label="Student" />
         <Select value={week} onChange={(v) => setWeek(Number(v))} options={weeks.map((w) => ({ value: String(w), label: `Week ${w}` }))} label="Week" />
         <Select value={day} onChange={(v) => setDay(v)} options={days.map((d) => ({ value: d, label: d }))} label="Day" />
         <label style={{ display: 'inline-flex', gap: 8, alignItems: 'center', marginRight: 12 }}>
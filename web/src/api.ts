@@ -1,3 +1,5 @@
+import type { CampusPlaceKey } from "./geo";
+
 export type EmotionEntry = {
   week: number;
   emotion: {
@@ -24,8 +26,30 @@ export type LocationRecord = {
   location?: string | null;
   location_des?: string | null;
   activity?: string | null;
+  // campus place resolved by the server (compact format); null = no match
+  place?: CampusPlaceKey | null;
+};
+
+// `format=compact` location columns: codes index the response's `table`, -1 is null.
+type CompactLocations = {
+  time: string[];
+  location: number[];
+  location_des: number[];
+  activity: number[];
+  place: number[];
 };
 
+function decodeLocations(c: CompactLocations, table: any[]): LocationRecord[] {
+  const v = (code: number) => (code < 0 ? null : table[code]);
+  return c.time.map((time, i) => ({
+    time,
+    location: v(c.location[i]),
+    location_des: v(c.location_des[i]),
+    activity: v(c.activity[i]),
+    place: v(c.place[i]),
+  }));
+}
+
 const API_BASE = (import.meta as any).env.VITE_API_BASE || "http://127.0.0.1:8089";
 
 async function getJson<T>(path: string): Promise<T> {
@@ -61,21 +85,88 @@ export async function getLocations(
   return data.records;
 }
 
+// Locations across weeks in time order; bucketed records carry `count`.
+export async function getLocationRange(
+  userId: string,
+  opts?: RangeOptions
+): Promise<Array<LocationRecord & { count?: number }>> {
+  const q = new URLSearchParams();
+  setRange(q, opts);
+  const qs = q.toString();
+  const data = await getJson<{ records: Array<LocationRecord & { count?: number }> }>(
+    `/api/${userId}/locations${qs ? `?${qs}` : ""}`
+  );
+  return data.records;
+}
+
 export async function getEmotions(userId: string): Promise<EmotionEntry[]> {
   const data = await getJson<{ entries: EmotionEntry[] }>(`/api/${userId}/emotions`);
   return data.entries;
 }
 
-export type StatusRecord = { time: string; value: number | null; week?: number | null; day_offset?: number | null };
+// Projected entries (always including `week`), e.g. ["emotion", "lab_assessment"]
+// for charts that do not need the weekly narrative.
+export async function getEmotionFields<K extends keyof EmotionEntry>(
+  userId: string,
+  fields: K[]
+): Promise<Array<Pick<EmotionEntry, K | "week">>> {
+  const q = encodeURIComponent(fields.join(","));
+  const data = await getJson<{ entries: Array<Pick<EmotionEntry, K | "week">> }>(
+    `/api/${userId}/emotions?fields=${q}`
+  );
+  return data.entries;
+}
+
+// One week matched by /api/search; `snippet` is HTML-escaped text with the matches in <mark>.
+export type SearchHit = {
+  user_id: string;
+  week: number;
+  score: number;
+  emotion: EmotionEntry["emotion"];
+  snippet: string;
+};
+
+export type SearchResults = { query: string; total: number; offset: number; limit: number; results: SearchHit[] };
+
+// `query` supports words, "phrases", prefix*, OR, NOT/-word and parentheses; `weeks` is
+// e.g. "3-5" or "1,4"; `emotion` holds thresholds like "stress>70,happy<=40".
+export async function searchNarratives(
+  query: string,
+  opts?: { users?: string[]; weeks?: string; emotion?: string; limit?: number; offset?: number }
+): Promise<SearchResults> {
+  const q = new URLSearchParams({ q: query });
+  if (opts?.users?.length) q.set("users", opts.users.join(","));
+  if (opts?.weeks) q.set("weeks", opts.weeks);
+  if (opts?.emotion) q.set("emotion", opts.emotion);
+  if (opts?.limit != null) q.set("limit", String(opts.limit));
+  if (opts?.offset != null) q.set("offset", String(opts.offset));
+  return getJson<SearchResults>(`/api/search?${q.toString()}`);
+}
+
+// `count` is set when a record stands for a resampled time bucket.
+export type StatusRecord = { time: string; value: number | null; week?: number | null; day_offset?: number | null; count?: number };
+
+// start/end select [start, end) across weeks; bucket ("hour", "day", "6h", ...) and
+// maxPoints (LTTB) keep long ranges down to a few hundred points.
+export type RangeOptions = { start?: string; end?: string; bucket?: string; maxPoints?: number };
+
+function setRange(q: URLSearchParams, opts?: RangeOptions) {
+  if (opts?.start) q.set("start", opts.start);
+  if (opts?.end) q.set("end", opts.end);
+  if (opts?.bucket) q.set("bucket", opts.bucket);
+  if (opts?.maxPoints != null) q.set("max_points", String(opts.maxPoints));
+}
 
 export async function getStatus(
   userId: string,
   kind: "sleep" | "social" | "stress",
-  opts?: { week?: number; day?: string }
+  opts?: { week?: number; day?: string; agg?: "mean" | "mode" } & RangeOptions
 ): Promise<StatusRecord[]> {
   const q = new URLSearchParams();
   if (opts?.week != null) q.set("week", String(opts.week));
   if (opts?.day) q.set("day", opts.day);
+  if (opts?.agg) q.set("agg", opts.agg);
+  setRange(q, opts);
   const qs = q.toString();
   const data = await getJson<{ records: StatusRecord[] }>(
     `/api/${userId}/status/${kind}${qs ? `?${qs}` : ""}`
@@ -83,6 +174,52 @@ export async function getStatus(
   return data.records;
 }
 
+export type WeekBundle = {
+  week: number;
+  days: string[];
+  locations: Record<string, LocationRecord[]>;
+  status: Record<"sleep" | "social" | "stress", StatusRecord[]>;
+  emotion: EmotionEntry | null;
+};
+
+type CompactBundle = Omit<WeekBundle, "locations"> & { table: any[]; locations: Record<string, CompactLocations> };
+
+function decodeBundle(b: CompactBundle): WeekBundle {
+  const locations: Record<string, LocationRecord[]> = {};
+  for (const [day, cols] of Object.entries(b.locations)) locations[day] = decodeLocations(cols, b.table);
+  return { week: b.week, days: b.days, locations, status: b.status, emotion: b.emotion };
+}
+
+export async function getWeekBundle(userId: string, week: number): Promise<WeekBundle> {
+  return decodeBundle(await getJson<CompactBundle>(`/api/${userId}/week/${week}/bundle?format=compact`));
+}
+
+// Streams every week's bundle (NDJSON) and calls onWeek as each line arrives.
+export async function streamSemester(
+  userId: string,
+  onWeek: (bundle: WeekBundle) => void,
+  signal?: AbortSignal
+): Promise<void> {
+  const path = `/api/${userId}/bundle/stream?format=compact`;
+  const res = await fetch(`${API_BASE}${path}`, { signal });
+  if (!res.ok || !res.body) throw new Error(`API ${path} ${res.status}`);
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffered = "";
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffered += decoder.decode(value, { stream: true });
+    let newline: number;
+    while ((newline = buffered.indexOf("\n")) >= 0) {
+      const line = buffered.slice(0, newline).trim();
+      buffered = buffered.slice(newline + 1);
+      if (line) onWeek(decodeBundle(JSON.parse(line) as CompactBundle));
+    }
+  }
+  if (buffered.trim()) onWeek(decodeBundle(JSON.parse(buffered) as CompactBundle));
+}
+
 export type UserProfile = {
   user_id: string;
   display_name: string;
@@ -105,4 +242,92 @@ export async function getUserProfile(userId: string): Promise<UserProfile> {
   return data;
 }
 
+export type ProfileSummary = UserProfile & {
+  available: { weeks: number[]; status: string[]; emotions: boolean };
+};
+
+// Every student's profile in one request (for the picker).
+export async function getProfiles(): Promise<ProfileSummary[]> {
+  const data = await getJson<{ profiles: ProfileSummary[] }>("/api/profiles");
+  return data.profiles;
+}
+
+
+
+export type ChatRequestBody = {
+  message: string;
+  apiKey: string;
+  studentId: string;
+  bigFive: Record<string, number>;
+  weeklyDesc: string;
+  week: number;
+};
 
+// Sends a chat message in streaming mode; onDelta receives each text chunk as
+// it arrives and the full reply is resolved once the server sends `done`.
+export async function streamChat(
+  body: ChatRequestBody,
+  onDelta: (text: string) => void
+): Promise<string> {
+  const res = await fetch(`${API_BASE}/api/chat`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ ...body, stream: true }),
+  });
+  if (!res.ok || !res.body) throw new Error(`Chat request failed (${res.status})`);
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffered = "";
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffered += decoder.decode(value, { stream: true });
+    let boundary: number;
+    while ((boundary = buffered.indexOf("\n\n")) >= 0) {
+      const block = buffered.slice(0, boundary);
+      buffered = buffered.slice(boundary + 2);
+      let event = "message";
+      let data = "";
+      for (const line of block.split("\n")) {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data += line.slice(5).trim();
+      }
+      if (!data) continue;
+      const payload = JSON.parse(data);
+      if (event === "chunk") onDelta(payload.text);
+      else if (event === "done") return payload.response as string;
+      else if (event === "error") throw new Error(payload.detail ?? "Chat error");
+    }
+  }
+  throw new Error("Chat stream ended unexpectedly");
+}
+
+// Pushed by /api/live when simulation output changes; `week` events carry the
+// user's weeks and the new week's bundle, `emotions` events the changed entries.
+export type LiveEvent = {
+  type: "week" | "emotions" | "status" | "classes" | "user" | "reset";
+  user?: string;
+  change?: "added" | "changed" | "removed";
+  week?: number;
+  kind?: "sleep" | "social" | "stress";
+  weeks?: number[];
+  bundle?: WeekBundle;
+  entries?: EmotionEntry[];
+};
+
+const LIVE_EVENTS: LiveEvent["type"][] = ["week", "emotions", "status", "classes", "user", "reset"];
+
+// Subscribes to changes for `users` (all users if empty); returns a function that closes
+// the stream. EventSource reconnects by itself after network errors.
+export function subscribeLive(users: string[], onEvent: (event: LiveEvent) => void): () => void {
+  const q = users.length ? `?users=${encodeURIComponent(users.join(","))}` : "";
+  const source = new EventSource(`${API_BASE}/api/live${q}`);
+  for (const type of LIVE_EVENTS) {
+    source.addEventListener(type, (e) => {
+      const event = JSON.parse((e as MessageEvent).data);
+      if (event.bundle) event.bundle = decodeBundle(event.bundle);
+      onEvent(event as LiveEvent);
+    });
+  }
+  return () => source.close();
+}
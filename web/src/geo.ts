@@ -81,3 +81,16 @@ export function matchPlaceByText(text: string | null | undefined): CampusPlace |
   return CAMPUS_PLACES.find(p => [p.label, ...p.aliases].some(a => t.includes(normalize(a))));
 }
 
+const PLACES_BY_KEY = new Map<string, CampusPlace>(CAMPUS_PLACES.map(p => [p.key, p]));
+
+// Place of a location record: the server-resolved `place` when the record has one
+// (compact payloads), otherwise the text heuristic above.
+export function placeForRecord(rec: {
+  place?: CampusPlaceKey | null;
+  location_des?: string | null;
+  activity?: string | null;
+  location?: string | null;
+}): CampusPlace | undefined {
+  if (rec.place !== undefined) return rec.place ? PLACES_BY_KEY.get(rec.place) : undefined;
+  return matchPlaceByText(rec.location_des || rec.activity || rec.location || undefined);
+}